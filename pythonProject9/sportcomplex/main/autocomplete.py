@@ -0,0 +1,40 @@
+# autocomplete.py
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from .pagination import KeysetPaginator
+
+
+class Autocomplete:
+    """Постраничные ответы API автодополнения для AutocompleteSelect (forms.py)"""
+
+    PAGE_SIZE = 20
+    CACHE_PREFIX = 'autocomplete'
+
+    @staticmethod
+    def cache_key(kind, query, cursor):
+        digest = hashlib.md5(f'{query}\n{cursor}'.encode()).hexdigest()
+        return f'{Autocomplete.CACHE_PREFIX}:{kind}:{digest}'
+
+    @staticmethod
+    def response(request, kind, queryset, ordering, label):
+        """
+        JSON {'results': [{'id', 'text'}], 'next_cursor'} для страницы queryset.
+        Ответ кэшируется на AUTOCOMPLETE_CACHE_TIMEOUT секунд: при наборе текста
+        одни и те же префиксы запрашиваются многократно.
+        """
+        query = request.GET.get('q', '').strip()
+        cursor = request.GET.get('cursor', '')
+
+        def build():
+            page = KeysetPaginator(queryset, Autocomplete.PAGE_SIZE, ordering).get_page(cursor)
+            return {
+                'results': [{'id': obj.pk, 'text': label(obj)} for obj in page],
+                'next_cursor': page.next_cursor,
+            }
+
+        data = cache.get_or_set(
+            Autocomplete.cache_key(kind, query, cursor), build, settings.AUTOCOMPLETE_CACHE_TIMEOUT
+        )
+        return JsonResponse(data)
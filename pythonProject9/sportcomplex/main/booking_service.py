@@ -0,0 +1,150 @@
+# booking_service.py
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Bookings, BookingLocks
+
+
+class BookingConflictError(Exception):
+    """Выбранное время уже занято (зал, тренер или клиент)"""
+
+    def __init__(self, kind, booking):
+        self.kind = kind
+        self.booking = booking
+        super().__init__(BookingService.conflict_message(kind, booking))
+
+
+class BookingService:
+    """Проверка пересечений и атомарное создание записей на занятия"""
+
+    @staticmethod
+    def conflicts(booking_date, start_time, end_time, room=None, trainer=None, client=None, exclude_pk=None):
+        """
+        Запрос запланированных записей, пересекающихся по времени с указанным интервалом
+        в том же зале, у того же тренера или у того же клиента (None - ресурсы не заданы)
+        """
+        resources = Q()
+        if room:
+            resources |= Q(room=room)
+        if trainer:
+            resources |= Q(trainer=trainer)
+        if client:
+            resources |= Q(client=client)
+
+        if not resources:
+            return None
+
+        conflicts = Bookings.objects.filter(
+            resources,
+            booking_date=booking_date,
+            status='scheduled',
+            start_time__lt=end_time,
+            end_time__gt=start_time,
+        )
+
+        if exclude_pk:
+            conflicts = conflicts.exclude(pk=exclude_pk)
+        return conflicts.order_by('start_time', 'pk')
+
+    @staticmethod
+    def find_conflict(booking_date, start_time, end_time, room=None, trainer=None, client=None, exclude_pk=None):
+        """
+        Ищет первую пересекающуюся запись (см. conflicts) одним SQL-запросом.
+        Возвращает кортеж (тип конфликта, запись) или None, если время свободно.
+        Тип конфликта: 'room', 'trainer' или 'client'.
+        """
+        conflicts = BookingService.conflicts(booking_date, start_time, end_time, room, trainer, client, exclude_pk)
+        booking = conflicts.first() if conflicts is not None else None
+        if booking is None:
+            return None
+
+        # Определяем, по какому ресурсу произошло пересечение
+        if room and booking.room == room:
+            return 'room', booking
+        if trainer and booking.trainer_id == getattr(trainer, 'pk', trainer):
+            return 'trainer', booking
+        return 'client', booking
+
+    @staticmethod
+    def conflict_message(kind, booking):
+        """Текст ошибки для найденного пересечения"""
+        interval = f'{booking.start_time.strftime("%H:%M")}-{booking.end_time.strftime("%H:%M")}'
+
+        if kind == 'room':
+            return f'Это время уже занято в {booking.room} ({interval})'
+        if kind == 'trainer':
+            return f'Тренер уже занят в это время ({interval})'
+        return f'У вас уже есть запись на это время: {interval}'
+
+    @staticmethod
+    def lock_keys(booking_date, room=None, trainer=None, client=None):
+        """Ключи блокировок ресурсов записи на указанный день (в отсортированном порядке)"""
+        day = booking_date.isoformat()
+        keys = []
+        if room:
+            keys.append(f'room:{room}:{day}')
+        if trainer:
+            keys.append(f'trainer:{getattr(trainer, "pk", trainer)}:{day}')
+        if client:
+            keys.append(f'client:{getattr(client, "pk", client)}:{day}')
+
+        # Единый порядок захвата исключает взаимные блокировки
+        return sorted(keys)
+
+    @staticmethod
+    def clear_past_locks(batch_size=1000):
+        """
+        Удаляет строки блокировок за прошедшие дни пачками по batch_size строк:
+        записи на прошедшие даты не создаются, и эти строки больше не захватываются
+        """
+        today = timezone.localdate()
+        total = 0
+        while True:
+            ids = list(
+                BookingLocks.objects.filter(day__lt=today).order_by('day').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+            BookingLocks.objects.filter(pk__in=ids).delete()
+            total += len(ids)
+
+    @staticmethod
+    def create_booking(client, service, booking_date, start_time, end_time, room, trainer=None, notes=''):
+        """
+        Создает запись на занятие без гонок между параллельными запросами.
+
+        Внутри транзакции захватываются строки BookingLocks для зала, тренера и клиента
+        на этот день, затем выполняется проверка пересечений и вставка.
+        При конфликте выбрасывается BookingConflictError.
+        """
+        keys = BookingService.lock_keys(booking_date, room, trainer, client)
+
+        # Строки блокировок создаются заранее, вне основной транзакции
+        for key in keys:
+            BookingLocks.objects.get_or_create(lock_key=key, defaults={'day': booking_date})
+
+        with transaction.atomic():
+            # UPDATE берет эксклюзивную блокировку строк в InnoDB и блокировку записи в SQLite,
+            # поэтому второй запрос ждет завершения первого, а не читает устаревшие данные
+            BookingLocks.objects.filter(lock_key__in=keys).update(updated_at=timezone.now())
+
+            conflict = BookingService.find_conflict(
+                booking_date, start_time, end_time,
+                room=room,
+                trainer=trainer,
+                client=client
+            )
+            if conflict:
+                raise BookingConflictError(*conflict)
+
+            return Bookings.objects.create(
+                client=client,
+                service=service,
+                trainer=trainer,
+                booking_date=booking_date,
+                start_time=start_time,
+                end_time=end_time,
+                room=room,
+                notes=notes,
+                status='scheduled'
+            )
@@ -53,10 +53,10 @@ def client_required(function=None):
                 return redirect('index')
 
             # Импорт здесь чтобы избежать циклических импортов
-            from .views import get_or_create_client_profile
+            from .views import get_request_client_profile
 
-            # Создаем или получаем профиль клиента
-            client_profile = get_or_create_client_profile(request.user)
+            # Создаем или получаем профиль клиента (view берет его из request.client_profile)
+            client_profile = get_request_client_profile(request)
 
             if not client_profile:
                 messages.error(request, 'Не удалось создать профиль клиента')
@@ -0,0 +1,157 @@
+# exports.py
+import csv
+from datetime import datetime
+from django.utils import timezone
+from .models import Clients, Subscriptions, Bookings
+
+# Таблицы для выгрузки: столбцы (поле values_list, заголовок) и поля фильтров.
+# service_field у клиентов - услуга любого из абонементов клиента
+EXPORT_TABLES = {
+    'clients': {
+        'model': Clients,
+        'columns': [
+            ('client_id', 'ID'),
+            ('last_name', 'Фамилия'),
+            ('first_name', 'Имя'),
+            ('phone', 'Телефон'),
+            ('email', 'Email'),
+            ('birth_date', 'Дата рождения'),
+            ('created_at', 'Дата регистрации'),
+        ],
+        'date_field': 'created_at__date',
+        'status_field': None,
+        'service_field': 'subscriptions__service',
+    },
+    'subscriptions': {
+        'model': Subscriptions,
+        'columns': [
+            ('subscription_id', 'ID'),
+            ('client__last_name', 'Фамилия'),
+            ('client__first_name', 'Имя'),
+            ('service__service_name', 'Услуга'),
+            ('start_date', 'Дата начала'),
+            ('end_date', 'Дата окончания'),
+            ('price_paid', 'Стоимость'),
+            ('status', 'Статус'),
+            ('created_at', 'Дата создания'),
+        ],
+        'date_field': 'start_date',
+        'status_field': 'status',
+        'service_field': 'service',
+    },
+    'bookings': {
+        'model': Bookings,
+        'columns': [
+            ('booking_id', 'ID'),
+            ('booking_date', 'Дата'),
+            ('start_time', 'Начало'),
+            ('end_time', 'Окончание'),
+            ('client__last_name', 'Фамилия'),
+            ('client__first_name', 'Имя'),
+            ('service__service_name', 'Услуга'),
+            ('trainer__full_name', 'Тренер'),
+            ('room', 'Зал'),
+            ('status', 'Статус'),
+        ],
+        'date_field': 'booking_date',
+        'status_field': 'status',
+        'service_field': 'service',
+    },
+}
+
+
+class EchoBuffer:
+    """Буфер для csv.writer, который сразу возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class TableExport:
+    """Потоковая выгрузка таблиц БД в CSV с фильтрами по дате, статусу и услуге"""
+
+    CHUNK_SIZE = 2000
+
+    @staticmethod
+    def parse_date(value):
+        try:
+            return datetime.strptime(value or '', '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
+    @staticmethod
+    def queryset(table, params):
+        """
+        Записи таблицы по параметрам start, end (ГГГГ-ММ-ДД), status и service (ID).
+        Неверные значения параметров игнорируются.
+        """
+        spec = EXPORT_TABLES[table]
+        model = spec['model']
+        queryset = model.objects.all()
+
+        start = TableExport.parse_date(params.get('start'))
+        end = TableExport.parse_date(params.get('end'))
+        if start:
+            queryset = queryset.filter(**{f"{spec['date_field']}__gte": start})
+        if end:
+            queryset = queryset.filter(**{f"{spec['date_field']}__lte": end})
+
+        status = params.get('status', '')
+        if spec['status_field'] and status in dict(model.STATUS_CHOICES):
+            queryset = queryset.filter(**{spec['status_field']: status})
+
+        service = params.get('service', '')
+        if service.isdigit():
+            # Через подзапрос: связь "многие" (абонементы клиента) не дублирует строки
+            queryset = queryset.filter(
+                pk__in=model.objects.filter(**{spec['service_field']: int(service)}).values('pk')
+            )
+        return queryset
+
+    @staticmethod
+    def rows(queryset, fields, chunk_size=None):
+        """
+        Значения полей блоками по chunk_size строк с продолжением по первичному ключу.
+        Каждый блок - отдельный запрос, поэтому память не растет с размером таблицы
+        и на MySQL, где драйвер читает весь результат запроса в память.
+        """
+        chunk_size = chunk_size or TableExport.CHUNK_SIZE
+        queryset = queryset.order_by('pk').values_list('pk', *fields)
+        last_pk = None
+        while True:
+            chunk = queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset
+            batch = list(chunk[:chunk_size])
+            for row in batch:
+                yield row[1:]
+            if len(batch) < chunk_size:
+                return
+            last_pk = batch[-1][0]
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return ''
+        if isinstance(value, datetime):
+            return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def stream(table, queryset, chunk_size=None):
+        """Строки CSV (разделитель ';', с BOM для Excel): заголовок, затем данные"""
+        spec = EXPORT_TABLES[table]
+        fields = [field for field, _ in spec['columns']]
+        # Поля с choices (статус, зал) выгружаются подписями, а не кодами
+        labels = {}
+        for index, field in enumerate(fields):
+            if '__' not in field and spec['model']._meta.get_field(field).choices:
+                labels[index] = dict(spec['model']._meta.get_field(field).choices)
+        writer = csv.writer(EchoBuffer(), delimiter=';')
+
+        yield '\ufeff' + writer.writerow([title for _, title in spec['columns']])
+        for row in TableExport.rows(queryset, fields, chunk_size):
+            values = [TableExport.format_value(value) for value in row]
+            for index, choices in labels.items():
+                values[index] = choices.get(values[index], values[index])
+            yield writer.writerow(values)
@@ -1,10 +1,41 @@
 from django import forms
+from django.urls import reverse
 from .models import Users, Clients, Trainers, Services, Subscriptions, Bookings
+from .booking_service import BookingService
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta, date
 
 
+class AutocompleteSelect(forms.Select):
+    """
+    Выбор из большой таблицы через API автодополнения.
+    В HTML попадает только выбранный объект, варианты подгружаются при вводе.
+    """
+    template_name = 'widgets/autocomplete_select.html'
+
+    def __init__(self, url_name, attrs=None, placeholder='Начните вводить для поиска...'):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.placeholder = placeholder
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['autocomplete_url'] = reverse(self.url_name)
+        context['widget']['placeholder'] = self.placeholder
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        """Пустой вариант и выбранные объекты - без перебора всего queryset"""
+        selected = [v for v in value if v not in ('', None)]
+        options = [self.create_option(name, '', self.choices.field.empty_label or '', not selected, 0)]
+        if selected:
+            for index, obj in enumerate(self.choices.queryset.filter(pk__in=selected), start=1):
+                choice_value, label = self.choices.choice(obj)
+                options.append(self.create_option(name, choice_value, label, True, index))
+        return [(None, options, 0)]
+
+
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField(
         required=True,
@@ -98,8 +129,8 @@ class SubscriptionForm(forms.ModelForm):
         model = Subscriptions
         fields = ['client', 'service', 'start_date', 'end_date', 'price_paid', 'status']
         widgets = {
-            'client': forms.Select(attrs={'class': 'form-control'}),
-            'service': forms.Select(attrs={'class': 'form-control'}),
+            'client': AutocompleteSelect('autocomplete_clients', attrs={'class': 'form-control'}),
+            'service': AutocompleteSelect('autocomplete_services', attrs={'class': 'form-control'}),
             'start_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'end_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'price_paid': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
@@ -107,6 +138,15 @@ class SubscriptionForm(forms.ModelForm):
         }
 
 
+class LinkClientForm(forms.Form):
+    """Выбор клиента для привязки к пользователю"""
+    client_id = forms.ModelChoiceField(
+        queryset=Clients.objects.all(),
+        label='Клиент',
+        widget=AutocompleteSelect('autocomplete_clients', attrs={'class': 'form-control'})
+    )
+
+
 class BookingForm(forms.ModelForm):
     """Форма для записи на занятие"""
 
@@ -204,17 +244,16 @@ class BookingForm(forms.ModelForm):
                 self.add_error('end_time', 'Последнее занятие должно заканчиваться до 23:00')
 
             if booking_date and start_time and end_time and room:
-                conflicting_bookings = Bookings.objects.filter(
-                    booking_date=booking_date,
+                # Один запрос на пересечения по залу, тренеру и клиенту
+                conflict = BookingService.find_conflict(
+                    booking_date, start_time, end_time,
                     room=room,
-                    status='scheduled'
-                ).exclude(pk=self.instance.pk if self.instance else None)
-
-                for booking in conflicting_bookings:
-                    if (start_time < booking.end_time and end_time > booking.start_time):
-                        self.add_error('start_time',
-                                       f'Это время уже занято в {room} ({booking.start_time.strftime("%H:%M")}-{booking.end_time.strftime("%H:%M")})')
-                        break
+                    trainer=cleaned_data.get('trainer'),
+                    client=self.client,
+                    exclude_pk=self.instance.pk if self.instance else None
+                )
+                if conflict:
+                    self.add_error('start_time', BookingService.conflict_message(*conflict))
 
         return cleaned_data
 
@@ -261,6 +300,7 @@ class QuickBookingForm(forms.Form):
     )
 
     def __init__(self, *args, **kwargs):
+        self.client = kwargs.pop('client', None)
         super().__init__(*args, **kwargs)
 
         # Устанавливаем доступные временные слоты
@@ -331,17 +371,15 @@ class QuickBookingForm(forms.Form):
                 end_time = datetime.strptime(end_time_str, '%H:%M').time()
 
                 if room:
-                    conflicting_bookings = Bookings.objects.filter(
-                        booking_date=booking_date,
+                    # Один запрос на пересечения по залу, тренеру и клиенту
+                    conflict = BookingService.find_conflict(
+                        booking_date, start_time, end_time,
                         room=room,
-                        status='scheduled'
+                        trainer=cleaned_data.get('trainer'),
+                        client=self.client
                     )
-
-                    for booking in conflicting_bookings:
-                        if (start_time < booking.end_time and end_time > booking.start_time):
-                            self.add_error('time_slot',
-                                           f'Это время уже занято в {room} ({booking.start_time.strftime("%H:%M")}-{booking.end_time.strftime("%H:%M")})')
-                            break
+                    if conflict:
+                        self.add_error('time_slot', BookingService.conflict_message(*conflict))
             except ValueError:
                 self.add_error('time_slot', 'Неверный формат времени')
 
@@ -359,15 +397,15 @@ class QuickBookingForm(forms.Form):
         start_time = datetime.strptime(start_time_str, '%H:%M').time()
         end_time = datetime.strptime(end_time_str, '%H:%M').time()
 
-        booking = Bookings.objects.create(
+        # Атомарное создание: при гонке выбрасывает BookingConflictError
+        booking = BookingService.create_booking(
             client=client,
             service=service,
             trainer=trainer,
             booking_date=booking_date,
             start_time=start_time,
             end_time=end_time,
-            room=room,
-            status='scheduled'
+            room=room
         )
 
         return booking
\ No newline at end of file
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from main.metrics import MetricsRollup
+
+
+class Command(BaseCommand):
+    help = 'Заполняет таблицу DailyMetrics по истории клиентов, абонементов и записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Начальная дата (ГГГГ-ММ-ДД), по умолчанию - начало истории')
+        parser.add_argument('--end', help='Конечная дата (ГГГГ-ММ-ДД), по умолчанию - последняя запись или сегодня')
+        parser.add_argument('--batch-days', type=int, default=31, help='Сколько дней пересчитывать за один проход')
+
+    def parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Неверный формат даты: {value}')
+
+    def handle(self, *args, **options):
+        history_start, history_end = MetricsRollup.history_range()
+        start = self.parse_date(options['start']) if options['start'] else history_start
+        end = self.parse_date(options['end']) if options['end'] else history_end or timezone.localdate()
+        batch_days = options['batch_days']
+
+        if batch_days < 1:
+            raise CommandError('--batch-days должен быть положительным')
+        if start is None:
+            self.stdout.write('Нет данных для пересчета')
+            return
+        if start > end:
+            raise CommandError('Начальная дата позже конечной')
+
+        total = 0
+        batch_start = start
+        while batch_start <= end:
+            batch_end = min(batch_start + timedelta(days=batch_days - 1), end)
+            total += MetricsRollup.refresh_range(batch_start, batch_end)
+            self.stdout.write(f'{batch_start} - {batch_end}: готово')
+            batch_start = batch_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано дней: {total}'))
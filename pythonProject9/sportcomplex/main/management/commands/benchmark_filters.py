@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from main.report_filters import STORED_FILTERS, FilterEngine
+from main.report_generator import ReportGenerator
+
+
+class Command(BaseCommand):
+    help = 'Замеряет готовые фильтры отчетов: одна маска против последовательной фильтрации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Размер набора тестовых пользователей')
+        parser.add_argument('--repeat', type=int, default=3, help='Сколько раз повторить замер (берется лучший)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def chained(self, df, spec):
+        """Прежний способ: копия и отдельная выборка строк на каждое условие"""
+        where = spec.get('where')
+        conditions = where.get('and', [where]) if where else []
+        result = df.copy()
+        for condition in conditions:
+            result = result[FilterEngine.condition_mask(result, condition)]
+        if spec.get('sort'):
+            result = result.sort_values(spec['sort'].lstrip('-'), ascending=not spec['sort'].startswith('-'), kind='stable')
+        return result.head(spec['limit']) if spec.get('limit') else result
+
+    def measure(self, func, df, spec, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func(df, spec)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        if rows < 1 or repeat < 1:
+            raise CommandError('--rows и --repeat должны быть положительными')
+
+        df = ReportGenerator.create_report_dataframe('users', rows, options['seed'])
+        self.stdout.write(f'Строк: {rows}, повторов: {repeat}')
+        for number, spec in STORED_FILTERS.items():
+            mask_time, result = self.measure(FilterEngine.apply, df, spec, repeat)
+            chained_time, expected = self.measure(self.chained, df, spec, repeat)
+            if not result['id'].equals(expected['id']):
+                raise CommandError(f'Фильтр {number}: результаты не совпадают')
+            self.stdout.write(
+                f'{number}. {spec["name"]:<50} найдено {len(result):>7}: '
+                f'маска {mask_time * 1000:7.1f} мс, последовательно {chained_time * 1000:7.1f} мс'
+            )
@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from main.report_generator import ReportGenerator
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает построчную, векторную и многопроцессную генерацию тестовых данных отчетов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Размер набора данных')
+        parser.add_argument('--repeat', type=int, default=3, help='Сколько раз повторить замер (берется лучший)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--data-type', choices=ReportGenerator.DATA_TYPES, action='append',
+                            help='Тип данных (можно несколько раз), по умолчанию все')
+        parser.add_argument('--skip-rows', action='store_true',
+                            help='Не замерять построчную генерацию (долго на больших наборах)')
+        parser.add_argument('--workers', type=int, action='append',
+                            help='Замерить генерацию частями в N процессах (можно несколько раз)')
+        parser.add_argument('--shard-rows', type=int, default=ReportGenerator.SHARD_ROWS,
+                            help='Строк в одной части при генерации в процессах')
+
+    def measure(self, func, data_type, rows, seed, repeat, **kwargs):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            df = func(data_type, rows, seed, **kwargs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, df
+
+    def handle(self, *args, **options):
+        rows, repeat, seed = options['rows'], options['repeat'], options['seed']
+        if rows < 1 or repeat < 1 or options['shard_rows'] < 1:
+            raise CommandError('--rows, --repeat и --shard-rows должны быть положительными')
+        if any(workers < 1 for workers in options['workers'] or []):
+            raise CommandError('--workers должно быть положительным')
+
+        self.stdout.write(f'Строк: {rows}, повторов: {repeat}, seed: {seed}')
+        for data_type in options['data_type'] or ReportGenerator.DATA_TYPES:
+            vector_time, df = self.measure(ReportGenerator.create_report_dataframe, data_type, rows, seed, repeat)
+            memory_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+            line = f'{data_type:<14} векторно: {vector_time * 1000:9.1f} мс ({memory_mb:.1f} МБ)'
+            if not options['skip_rows']:
+                rows_time, _ = self.measure(ReportGenerator.create_report_dataframe_rows, data_type, rows, seed, repeat)
+                line += f', построчно: {rows_time * 1000:9.1f} мс, ускорение x{rows_time / vector_time:.1f}'
+            self.stdout.write(line)
+
+            for workers in options['workers'] or []:
+                sharded_time, _ = self.measure(
+                    ReportGenerator.create_report_dataframe_sharded, data_type, rows, seed, repeat,
+                    workers=workers, shard_rows=options['shard_rows']
+                )
+                self.stdout.write(
+                    f'{"":<14} процессов: {workers:<3} {sharded_time * 1000:9.1f} мс, '
+                    f'ускорение x{vector_time / sharded_time:.1f}'
+                )
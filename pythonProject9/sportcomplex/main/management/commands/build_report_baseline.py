@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from main.report_generator import BaselineSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Строит снимок показателей тестовых данных за сегодня для страницы сравнения (запускать раз в день)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=settings.REPORT_BASELINE_ROWS,
+                            help='Размер тестового набора пользователей')
+        parser.add_argument('--seed', type=int, default=settings.REPORT_DATASET_SEED)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        if rows < 1:
+            raise CommandError('--rows должно быть положительным')
+
+        snapshot = BaselineSnapshot.build(count=rows, seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Снимок за {snapshot.day}: {snapshot.count} пользователей, seed {snapshot.seed}'
+        ))
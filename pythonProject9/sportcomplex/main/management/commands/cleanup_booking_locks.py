@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.booking_service import BookingService
+
+
+class Command(BaseCommand):
+    help = 'Удаляет строки блокировок записей за прошедшие дни пачками (для запуска по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сколько строк удалять за один DELETE')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        total = BookingService.clear_past_locks(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено блокировок: {total}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.session_backend import SessionStore
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные сессии из django_session пачками (для запуска по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сколько сессий удалять за один DELETE')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        total = SessionStore.clear_expired(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено просроченных сессий: {total}'))
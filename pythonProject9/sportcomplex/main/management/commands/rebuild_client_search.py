@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.search import ClientSearch
+
+
+class Command(BaseCommand):
+    help = 'Пересоздает токены поиска клиентов (после массовой загрузки или изменения правил нормализации)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сколько клиентов индексировать за один проход')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        total = ClientSearch.rebuild(options['batch_size'], self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Индекс поиска пересоздан, клиентов: {total}'))
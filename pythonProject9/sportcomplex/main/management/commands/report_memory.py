@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.report_generator import ReportGenerator
+
+
+class Command(BaseCommand):
+    help = 'Память DataFrame тестовых данных по столбцам: прежняя генерация и схема REPORT_SCHEMAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Размер набора данных')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--data-type', choices=ReportGenerator.DATA_TYPES, action='append',
+                            help='Тип данных (можно несколько раз), по умолчанию все')
+
+    def handle(self, *args, **options):
+        rows, seed = options['rows'], options['seed']
+        if rows < 1:
+            raise CommandError('--rows должно быть положительным')
+
+        self.stdout.write(f'Строк: {rows}, seed: {seed}')
+        for data_type in options['data_type'] or ReportGenerator.DATA_TYPES:
+            before = ReportGenerator.create_report_dataframe_rows(data_type, rows, seed)
+            after = ReportGenerator.create_report_dataframe(data_type, rows, seed)
+            report = ReportGenerator.memory_report(before, after)
+            for column in ('bytes_before', 'bytes_after'):
+                report[column] = (report[column] / 1024).round(1)
+            report = report.rename(columns={'bytes_before': 'KB_before', 'bytes_after': 'KB_after'})
+
+            total = report.loc['ИТОГО']
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{data_type}: {total["KB_before"] / 1024:.1f} МБ -> {total["KB_after"] / 1024:.1f} МБ '
+                f'({total["ratio"]:.1%})'
+            ))
+            self.stdout.write(report.to_string())
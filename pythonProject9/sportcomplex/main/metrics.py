@@ -0,0 +1,341 @@
+# metrics.py
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Sum, Min, Max, Q, DateField
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from .models import Clients, Subscriptions, Bookings, DailyMetrics
+
+
+class MetricsRollup:
+    """Пересчет и чтение дневных итогов DailyMetrics"""
+
+    # Источник данных -> поля DailyMetrics, которые он заполняет
+    SOURCE_FIELDS = {
+        'clients': ['new_clients'],
+        'subscriptions': ['revenue', 'new_subscriptions'],
+        'bookings': [
+            'bookings_scheduled', 'bookings_completed', 'bookings_cancelled', 'bookings_no_show',
+            'bookings_hall1', 'bookings_hall2', 'bookings_hall3', 'bookings_pool',
+        ],
+    }
+    SOURCES = tuple(SOURCE_FIELDS)
+
+    @staticmethod
+    def _day_bounds(start, end):
+        """Границы [start, end] в виде aware-datetime для фильтрации по created_at"""
+        tz = timezone.get_current_timezone()
+        return (
+            timezone.make_aware(datetime.combine(start, time.min), tz),
+            timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+        )
+
+    @staticmethod
+    def _created_per_day(queryset, start, end, **aggregates):
+        """Группировка по дню created_at (по полуинтервалу, чтобы работал индекс)"""
+        start_dt, end_dt = MetricsRollup._day_bounds(start, end)
+        return (
+            queryset.filter(created_at__gte=start_dt, created_at__lt=end_dt)
+            .annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(**aggregates)
+            .order_by()
+        )
+
+    @staticmethod
+    def collect(start, end, sources=SOURCES):
+        """Считает итоги за дни [start, end] - по одному сгруппированному запросу на источник"""
+        rows = defaultdict(dict)
+
+        if 'clients' in sources:
+            for row in MetricsRollup._created_per_day(Clients.objects, start, end, n=Count('pk')):
+                rows[row['day']]['new_clients'] = row['n']
+
+        if 'subscriptions' in sources:
+            for row in MetricsRollup._created_per_day(
+                    Subscriptions.objects, start, end, n=Count('pk'), revenue=Sum('price_paid')):
+                rows[row['day']]['new_subscriptions'] = row['n']
+                rows[row['day']]['revenue'] = row['revenue'] or Decimal('0')
+
+        if 'bookings' in sources:
+            grouped = (
+                Bookings.objects.filter(booking_date__range=(start, end))
+                .values('booking_date', 'status', 'room')
+                .annotate(n=Count('pk'))
+                .order_by()
+            )
+            for row in grouped:
+                day = rows[row['booking_date']]
+                status_field = f"bookings_{row['status']}"
+                room_field = f"bookings_{row['room']}"
+                day[status_field] = day.get(status_field, 0) + row['n']
+                # Записи со старыми названиями залов учитываются только в статусах
+                if room_field in MetricsRollup.SOURCE_FIELDS['bookings']:
+                    day[room_field] = day.get(room_field, 0) + row['n']
+
+        return rows
+
+    @staticmethod
+    def refresh_range(start, end, sources=SOURCES):
+        """Пересчитывает итоги за дни [start, end] и записывает их одним upsert"""
+        rows = MetricsRollup.collect(start, end, sources)
+        fields = [field for source in sources for field in MetricsRollup.SOURCE_FIELDS[source]]
+
+        objects = []
+        day = start
+        while day <= end:
+            values = rows.get(day, {})
+            # Дни без данных записываются нулями: значения могли исчезнуть после удаления
+            objects.append(DailyMetrics(day=day, **{field: values.get(field, 0) for field in fields}))
+            day += timedelta(days=1)
+
+        # MySQL не принимает unique_fields: upsert там идет через ON DUPLICATE KEY
+        # по уникальному day, а SQLite и PostgreSQL требуют указать столбец конфликта
+        DailyMetrics.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['day'] if connection.features.supports_update_conflicts_with_target else None,
+            update_fields=fields + ['updated_at'],
+        )
+        PeriodComparison.invalidate()
+        return len(objects)
+
+    @staticmethod
+    def refresh_days(days, sources=SOURCES):
+        """Пересчитывает итоги за отдельные дни (инкрементальное обновление из сигналов)"""
+        for day in sorted(set(days)):
+            MetricsRollup.refresh_range(day, day, sources)
+
+    @staticmethod
+    def history_range():
+        """Диапазон дат, за который есть данные (записи бывают и на будущие даты)"""
+        created = [
+            Clients.objects.aggregate(first=Min('created_at'))['first'],
+            Subscriptions.objects.aggregate(first=Min('created_at'))['first'],
+        ]
+        booking_dates = Bookings.objects.aggregate(first=Min('booking_date'), last=Max('booking_date'))
+
+        days = [timezone.localdate(value) for value in created if value]
+        days += [value for value in booking_dates.values() if value]
+        if not days:
+            return None, None
+        return min(days), max(days + [timezone.localdate()])
+
+    @staticmethod
+    def summary(start=None, end=None):
+        """Суммы DailyMetrics за период (без обращения к исходным таблицам)"""
+        metrics = DailyMetrics.objects.all()
+        if start:
+            metrics = metrics.filter(day__gte=start)
+        if end:
+            metrics = metrics.filter(day__lte=end)
+
+        fields = [field for source in MetricsRollup.SOURCES for field in MetricsRollup.SOURCE_FIELDS[source]]
+        totals = metrics.aggregate(**{field: Sum(field) for field in fields})
+        return {field: value or 0 for field, value in totals.items()}
+
+
+class PeriodComparison:
+    """
+    Сравнение периодов по DailyMetrics: месяц с начала против тех же дней
+    прошлого месяца и год с начала против того же периода прошлого года
+    """
+
+    FIELDS = (
+        ('revenue', 'Выручка, руб.'),
+        ('new_clients', 'Новые клиенты'),
+        ('new_subscriptions', 'Новые абонементы'),
+        ('bookings_completed', 'Проведено занятий'),
+        ('bookings_cancelled', 'Отменено записей'),
+        ('bookings_no_show', 'Неявки'),
+    )
+
+    @staticmethod
+    def _same_day(year, month, day):
+        """Тот же день в другом месяце (31 марта -> 28/29 февраля)"""
+        next_month = date(year + month // 12, month % 12 + 1, 1)
+        return date(year, month, min(day, (next_month - timedelta(days=1)).day))
+
+    @staticmethod
+    def periods(today):
+        """Пары периодов: (название, (начало, конец), (начало, конец) для сравнения)"""
+        month_start = today.replace(day=1)
+        prev_month_end = month_start - timedelta(days=1)
+        prev_month_start = prev_month_end.replace(day=1)
+        year_start = today.replace(month=1, day=1)
+        prev_year_start = year_start.replace(year=today.year - 1)
+        return [
+            ('Месяц к прошлому месяцу', (month_start, today),
+             (prev_month_start, PeriodComparison._same_day(prev_month_start.year, prev_month_start.month, today.day))),
+            ('Год к прошлому году', (year_start, today),
+             (prev_year_start, PeriodComparison._same_day(today.year - 1, today.month, today.day))),
+        ]
+
+    @staticmethod
+    def change(current, previous):
+        """Изменение в процентах; None, если в прошлом периоде был ноль"""
+        if not previous:
+            return None
+        return round((float(current) - float(previous)) / float(previous) * 100, 1)
+
+    @staticmethod
+    def compare(today=None):
+        """Суммы всех периодов одним запросом к DailyMetrics"""
+        today = today or timezone.localdate()
+        periods = PeriodComparison.periods(today)
+
+        aggregates = {}
+        for index, (_, current, previous) in enumerate(periods):
+            for field, _ in PeriodComparison.FIELDS:
+                aggregates[f'{field}_{index}_current'] = Sum(field, filter=Q(day__range=current))
+                aggregates[f'{field}_{index}_previous'] = Sum(field, filter=Q(day__range=previous))
+        totals = DailyMetrics.objects.aggregate(**aggregates)
+
+        result = []
+        for index, (name, current, previous) in enumerate(periods):
+            rows = []
+            for field, label in PeriodComparison.FIELDS:
+                current_value = totals[f'{field}_{index}_current'] or 0
+                previous_value = totals[f'{field}_{index}_previous'] or 0
+                rows.append({
+                    'field': field,
+                    'label': label,
+                    'current': current_value,
+                    'previous': previous_value,
+                    'change': PeriodComparison.change(current_value, previous_value),
+                })
+            result.append({'name': name, 'current': current, 'previous': previous, 'rows': rows})
+        return result
+
+    @staticmethod
+    def cache_key(today):
+        return f'period_comparison:{today.isoformat()}'
+
+    @staticmethod
+    def cached(today=None):
+        today = today or timezone.localdate()
+        return cache.get_or_set(
+            PeriodComparison.cache_key(today),
+            lambda: PeriodComparison.compare(today),
+            settings.STATS_CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    def invalidate(today=None):
+        """Сбрасывает сравнение за сегодня (вызывается после пересчета DailyMetrics)"""
+        cache.delete(PeriodComparison.cache_key(today or timezone.localdate()))
+
+
+class RevenueSeries:
+    """
+    Выручка по месяцам или неделям из Subscriptions.price_paid.
+
+    Значения закрытых периодов хранятся в кэше бессрочно (сбрасываются сигналом
+    при изменении абонемента этого периода), текущий период и неполные периоды
+    на краях диапазона пересчитываются одним сгруппированным запросом.
+    """
+
+    CACHE_PREFIX = 'revenue_series'
+    MONTH_LABELS = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+    TRUNC = {'month': TruncMonth, 'week': TruncWeek}
+    # Наибольший диапазон графика в годах: число точек и размер запроса ограничены
+    MAX_YEARS = {'month': 20, 'week': 5}
+
+    @staticmethod
+    def bucket_start(day, period):
+        if period == 'week':
+            return day - timedelta(days=day.weekday())
+        return day.replace(day=1)
+
+    @staticmethod
+    def next_bucket(bucket, period):
+        if period == 'week':
+            return bucket + timedelta(days=7)
+        return (bucket + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def cache_key(bucket, period):
+        return f'{RevenueSeries.CACHE_PREFIX}:{period}:{bucket.isoformat()}'
+
+    @staticmethod
+    def label(bucket, period):
+        if period == 'week':
+            return bucket.strftime('%d.%m.%Y')
+        return f'{RevenueSeries.MONTH_LABELS[bucket.month - 1]} {bucket.year}'
+
+    @staticmethod
+    def buckets(start, end, period):
+        """Периоды, пересекающие [start, end]: (начало периода, начало, конец обрезанного интервала)"""
+        result = []
+        bucket = RevenueSeries.bucket_start(start, period)
+        while bucket <= end:
+            following = RevenueSeries.next_bucket(bucket, period)
+            result.append((bucket, max(bucket, start), min(following - timedelta(days=1), end)))
+            bucket = following
+        return result
+
+    @staticmethod
+    def series(start, end, period='month'):
+        """Возвращает {'labels': [...], 'data': [...]} для графика выручки"""
+        if period not in RevenueSeries.TRUNC:
+            raise ValueError(f'Неизвестный период: {period}')
+        max_years = RevenueSeries.MAX_YEARS[period]
+        if (end - start).days > max_years * 366:
+            raise ValueError(f'Диапазон {"по неделям" if period == "week" else "по месяцам"} - не больше {max_years} лет')
+
+        today = timezone.localdate()
+        current_bucket = RevenueSeries.bucket_start(today, period)
+        buckets = RevenueSeries.buckets(start, end, period)
+
+        # Кэшировать можно только целиком попавшие в диапазон закрытые периоды
+        cacheable = {
+            bucket for bucket, clipped_start, clipped_end in buckets
+            if bucket < current_bucket
+            and clipped_start == bucket
+            and clipped_end == RevenueSeries.next_bucket(bucket, period) - timedelta(days=1)
+        }
+        cached = cache.get_many([RevenueSeries.cache_key(bucket, period) for bucket in cacheable])
+        values = {
+            bucket: Decimal(cached[RevenueSeries.cache_key(bucket, period)])
+            for bucket in cacheable if RevenueSeries.cache_key(bucket, period) in cached
+        }
+
+        missing = [(bucket, s, e) for bucket, s, e in buckets if bucket not in values]
+        if missing:
+            # Один запрос по диапазону от первого до последнего недостающего периода
+            # (по индексу created_at), на периоды его делит группировка; строки
+            # периодов из кэша в середине диапазона просто не используются
+            start_dt, end_dt = MetricsRollup._day_bounds(missing[0][1], missing[-1][2])
+
+            grouped = (
+                Subscriptions.objects.filter(created_at__gte=start_dt, created_at__lt=end_dt)
+                .annotate(bucket=RevenueSeries.TRUNC[period]('created_at', output_field=DateField()))
+                .values('bucket')
+                .annotate(total=Sum('price_paid'))
+                .order_by()
+            )
+            computed = {row['bucket']: row['total'] or Decimal('0') for row in grouped}
+
+            to_cache = {}
+            for bucket, _, _ in missing:
+                values[bucket] = computed.get(bucket, Decimal('0'))
+                if bucket in cacheable:
+                    to_cache[RevenueSeries.cache_key(bucket, period)] = str(values[bucket])
+            cache.set_many(to_cache, timeout=None)
+
+        return {
+            'labels': [RevenueSeries.label(bucket, period) for bucket, _, _ in buckets],
+            'data': [float(values[bucket]) for bucket, _, _ in buckets],
+        }
+
+    @staticmethod
+    def invalidate(day):
+        """Сбрасывает кэш месяца и недели, в которые попадает день"""
+        cache.delete_many([
+            RevenueSeries.cache_key(RevenueSeries.bucket_start(day, period), period)
+            for period in RevenueSeries.TRUNC
+        ])
@@ -0,0 +1,167 @@
+# middleware.py
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger('main.performance')
+
+
+class RequestStats:
+    """
+    Накопленная статистика запросов по страницам (url_name).
+
+    Хранится в кэше Django, поэтому при общем кэше (Redis, Memcached) видна
+    со всех процессов. Обновление не атомарное: при параллельных запросах
+    к одной странице отдельные замеры могут потеряться, для мониторинга это допустимо.
+    """
+
+    CACHE_PREFIX = 'request_stats'
+    # Список страниц со статистикой (отдельный префикс: url_name может быть 'index')
+    INDEX_KEY = f'{CACHE_PREFIX}_pages'
+
+    @staticmethod
+    def cache_key(url_name):
+        return f'{RequestStats.CACHE_PREFIX}:{url_name}'
+
+    @staticmethod
+    def budget(url_name):
+        """Бюджет страницы: (запросов к БД, миллисекунд)"""
+        override = settings.REQUEST_BUDGET_OVERRIDES.get(url_name, {})
+        return (
+            override.get('queries', settings.REQUEST_QUERY_BUDGET),
+            override.get('time_ms', settings.REQUEST_TIME_BUDGET_MS),
+        )
+
+    @staticmethod
+    def record(url_name, queries, db_ms, total_ms, over_budget):
+        key = RequestStats.cache_key(url_name)
+        stats = cache.get(key) or {
+            'url_name': url_name, 'requests': 0, 'queries': 0, 'max_queries': 0,
+            'db_ms': 0.0, 'total_ms': 0.0, 'max_ms': 0.0, 'over_budget': 0,
+        }
+        stats['requests'] += 1
+        stats['queries'] += queries
+        stats['max_queries'] = max(stats['max_queries'], queries)
+        stats['db_ms'] += db_ms
+        stats['total_ms'] += total_ms
+        stats['max_ms'] = max(stats['max_ms'], total_ms)
+        stats['over_budget'] += int(over_budget)
+        cache.set(key, stats, None)
+
+        index = cache.get(RequestStats.INDEX_KEY) or set()
+        if url_name not in index:
+            cache.set(RequestStats.INDEX_KEY, index | {url_name}, None)
+
+    @staticmethod
+    def all():
+        """Статистика всех страниц со средними значениями, самые медленные первыми"""
+        index = cache.get(RequestStats.INDEX_KEY) or set()
+        rows = []
+        for stats in cache.get_many([RequestStats.cache_key(name) for name in index]).values():
+            requests = stats['requests']
+            budget_queries, budget_ms = RequestStats.budget(stats['url_name'])
+            rows.append({
+                **stats,
+                'avg_queries': round(stats['queries'] / requests, 1),
+                'avg_db_ms': round(stats['db_ms'] / requests, 1),
+                'avg_ms': round(stats['total_ms'] / requests, 1),
+                'max_ms': round(stats['max_ms'], 1),
+                'budget_queries': budget_queries,
+                'budget_ms': budget_ms,
+            })
+        return sorted(rows, key=lambda row: row['avg_ms'], reverse=True)
+
+    @staticmethod
+    def reset():
+        index = cache.get(RequestStats.INDEX_KEY) or set()
+        cache.delete_many([RequestStats.cache_key(name) for name in index] + [RequestStats.INDEX_KEY])
+
+
+class QueryCounter:
+    """Обертка выполнения SQL (connection.execute_wrapper): считает запросы и время в БД"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class QueryBudgetMiddleware:
+    """
+    Замеряет число SQL-запросов, время в БД и общее время обработки запроса.
+
+    Результат отдается в заголовке Server-Timing, копится в RequestStats по
+    url_name и пишется в лог, если страница вышла за бюджет из настроек
+    (REQUEST_QUERY_BUDGET, REQUEST_TIME_BUDGET_MS, REQUEST_BUDGET_OVERRIDES).
+
+    У потоковых ответов (выгрузки CSV) тело формируется уже после выхода из
+    middleware, поэтому замер продолжается при выдаче каждой части и
+    записывается после последней; заголовок Server-Timing им не ставится.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def measure(counter):
+        """Контекст, в котором SQL всех соединений считается в counter"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with self.measure(counter):
+            response = self.get_response(request)
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.measure_stream(response.streaming_content, request, counter, start)
+            return response
+
+        total_ms = (time.perf_counter() - start) * 1000
+        response['Server-Timing'] = (
+            f'db;dur={counter.duration * 1000:.1f};desc="SQL: {counter.count}", total;dur={total_ms:.1f}'
+        )
+        self.record(request, counter, total_ms)
+        return response
+
+    def measure_stream(self, content, request, counter, start):
+        """Отдает части ответа, считая SQL при формировании каждой; итог - после последней"""
+        chunks = iter(content)
+        try:
+            while True:
+                # Обертка ставится только на время формирования части: между частями
+                # поток может выполнять чужие запросы
+                with self.measure(counter):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.record(request, counter, (time.perf_counter() - start) * 1000)
+
+    @staticmethod
+    def record(request, counter, total_ms):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if not url_name:
+            return
+        budget_queries, budget_ms = RequestStats.budget(url_name)
+        over_budget = counter.count > budget_queries or total_ms > budget_ms
+        if over_budget:
+            logger.warning(
+                'Страница %s (%s) вышла за бюджет: %d запросов к БД (бюджет %d), %.0f мс (бюджет %d мс)',
+                url_name, request.path, counter.count, budget_queries, total_ms, budget_ms
+            )
+        RequestStats.record(url_name, counter.count, counter.duration * 1000, total_ms, over_budget)
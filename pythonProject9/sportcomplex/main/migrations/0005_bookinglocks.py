@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_alter_bookings_room'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingLocks',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lock_key', models.CharField(max_length=100, unique=True, verbose_name='Ключ блокировки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последний захват')),
+            ],
+            options={
+                'verbose_name': 'Блокировка слота',
+                'verbose_name_plural': 'Блокировки слотов',
+                'db_table': 'BookingLocks',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_bookinglocks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookings',
+            index=models.Index(fields=['booking_date', 'room', 'status'], name='bookings_date_room_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookings',
+            index=models.Index(fields=['client', 'booking_date', 'status'], name='bookings_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookings',
+            index=models.Index(fields=['trainer', 'booking_date', 'status'], name='bookings_trainer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptions',
+            index=models.Index(fields=['client', 'status'], name='subs_client_status_idx'),
+        ),
+    ]
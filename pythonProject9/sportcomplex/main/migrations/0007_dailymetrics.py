@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_booking_subscription_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='День')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка')),
+                ('new_clients', models.IntegerField(default=0, verbose_name='Новые клиенты')),
+                ('new_subscriptions', models.IntegerField(default=0, verbose_name='Новые абонементы')),
+                ('bookings_scheduled', models.IntegerField(default=0, verbose_name='Запланировано')),
+                ('bookings_completed', models.IntegerField(default=0, verbose_name='Завершено')),
+                ('bookings_cancelled', models.IntegerField(default=0, verbose_name='Отменено')),
+                ('bookings_no_show', models.IntegerField(default=0, verbose_name='Не явился')),
+                ('bookings_hall1', models.IntegerField(default=0, verbose_name='Записи в зал 1')),
+                ('bookings_hall2', models.IntegerField(default=0, verbose_name='Записи в зал 2')),
+                ('bookings_hall3', models.IntegerField(default=0, verbose_name='Записи в зал 3')),
+                ('bookings_pool', models.IntegerField(default=0, verbose_name='Записи в бассейн')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата пересчета')),
+            ],
+            options={
+                'verbose_name': 'Итоги дня',
+                'verbose_name_plural': 'Итоги по дням',
+                'db_table': 'DailyMetrics',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='clients',
+            index=models.Index(fields=['created_at'], name='clients_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptions',
+            index=models.Index(fields=['created_at'], name='subs_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:03
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Копия токенизатора main.search на момент миграции: изменения в search.py
+# не должны менять то, что делает уже примененная миграция
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+}
+TOKEN_MAX_LENGTH = 100
+
+
+def name_tokens(text):
+    return [''.join(TRANSLIT.get(char, char) for char in word.lower()) for word in re.findall(r'\w+', text or '') if word]
+
+
+def phone_tokens(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    tokens = [digits] if digits else []
+    if len(digits) == 11:
+        tokens.append(digits[1:])
+    return tokens
+
+
+def client_tokens(first_name, last_name, phone, email):
+    tokens = [(token, 'name') for token in name_tokens(first_name) + name_tokens(last_name)]
+    tokens += [(token, 'phone') for token in phone_tokens(phone)]
+    if email:
+        tokens.append((email.strip().lower(), 'email'))
+    return list(dict.fromkeys((token[:TOKEN_MAX_LENGTH], kind) for token, kind in tokens))
+
+
+def fill_search_tokens(apps, schema_editor):
+    """Токены поиска для уже существующих клиентов"""
+    Clients = apps.get_model('main', 'Clients')
+    ClientSearchTokens = apps.get_model('main', 'ClientSearchTokens')
+
+    last_pk = 0
+    while True:
+        batch = list(Clients.objects.filter(pk__gt=last_pk).order_by('pk')[:1000])
+        if not batch:
+            break
+        ClientSearchTokens.objects.bulk_create([
+            ClientSearchTokens(client_id=client.pk, token=token, kind=kind)
+            for client in batch
+            for token, kind in client_tokens(client.first_name, client.last_name, client.phone, client.email)
+        ])
+        last_pk = batch[-1].pk
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_bookings_date_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientSearchTokens',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100, verbose_name='Токен')),
+                ('kind', models.CharField(choices=[('name', 'Имя'), ('phone', 'Телефон'), ('email', 'Email')], max_length=10, verbose_name='Тип')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='main.clients', verbose_name='Клиент')),
+            ],
+            options={
+                'verbose_name': 'Токен поиска клиента',
+                'verbose_name_plural': 'Токены поиска клиентов',
+                'db_table': 'ClientSearchTokens',
+                'indexes': [models.Index(fields=['token', 'client'], name='client_search_token_idx')],
+            },
+        ),
+        migrations.RunPython(fill_search_tokens, migrations.RunPython.noop),
+    ]
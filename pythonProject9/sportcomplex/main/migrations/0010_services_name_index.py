@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_clientsearchtokens'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='services',
+            index=models.Index(fields=['service_name'], name='services_name_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_services_name_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJobs',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_type', models.CharField(max_length=20, verbose_name='Тип данных')),
+                ('count', models.IntegerField(verbose_name='Количество строк')),
+                ('seed', models.BigIntegerField(verbose_name='Seed')),
+                ('filter_type', models.CharField(blank=True, max_length=10, verbose_name='Фильтр')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Прогресс, %')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='Сообщение')),
+                ('filter_name', models.CharField(blank=True, max_length=200, verbose_name='Название фильтра')),
+                ('filtered_count', models.IntegerField(blank=True, null=True, verbose_name='Найдено строк')),
+                ('total_count', models.IntegerField(blank=True, null=True, verbose_name='Всего строк')),
+                ('result_token', models.CharField(blank=True, max_length=22, verbose_name='Токен результата')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начато')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Фоновый отчет',
+                'verbose_name_plural': 'Фоновые отчеты',
+                'db_table': 'ReportJobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'status'], name='report_job_user_status_idx')],
+            },
+        ),
+    ]
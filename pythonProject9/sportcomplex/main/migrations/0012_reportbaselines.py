@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_reportjobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportBaselines',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='День')),
+                ('seed', models.BigIntegerField(verbose_name='Seed')),
+                ('count', models.IntegerField(verbose_name='Количество строк')),
+                ('stats', models.JSONField(default=dict, verbose_name='Показатели')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='Дата расчета')),
+            ],
+            options={
+                'verbose_name': 'Снимок тестовых данных',
+                'verbose_name_plural': 'Снимки тестовых данных',
+                'db_table': 'ReportBaselines',
+                'ordering': ['-day'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.db import migrations, models
+
+
+def fill_lock_days(apps, schema_editor):
+    """День берется из ключа блокировки: '<ресурс>:<id>:<ГГГГ-ММ-ДД>'"""
+    BookingLocks = apps.get_model('main', 'BookingLocks')
+    for lock in BookingLocks.objects.filter(day__isnull=True).iterator():
+        try:
+            lock.day = date.fromisoformat(lock.lock_key.rsplit(':', 1)[-1])
+        except ValueError:
+            lock.delete()
+            continue
+        lock.save(update_fields=['day'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_reportbaselines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookinglocks',
+            name='day',
+            field=models.DateField(db_index=True, null=True, verbose_name='День'),
+        ),
+        migrations.RunPython(fill_lock_days, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bookinglocks',
+            name='day',
+            field=models.DateField(db_index=True, verbose_name='День'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_metrics(apps, schema_editor):
+    """
+    Итоги по всей истории, если таблица еще не заполнена (иначе отчеты после
+    развертывания показывают нули до ручного запуска backfill_daily_metrics).
+    Копия расчета MetricsRollup.collect на исторических моделях
+    """
+    Clients = apps.get_model('main', 'Clients')
+    Subscriptions = apps.get_model('main', 'Subscriptions')
+    Bookings = apps.get_model('main', 'Bookings')
+    DailyMetrics = apps.get_model('main', 'DailyMetrics')
+    if DailyMetrics.objects.exists():
+        return
+
+    def per_day(model, **aggregates):
+        return model.objects.annotate(day=TruncDate('created_at')).values('day').annotate(**aggregates).order_by()
+
+    rows = defaultdict(dict)
+    for row in per_day(Clients, n=Count('pk')):
+        rows[row['day']]['new_clients'] = row['n']
+    for row in per_day(Subscriptions, n=Count('pk'), revenue=Sum('price_paid')):
+        rows[row['day']]['new_subscriptions'] = row['n']
+        rows[row['day']]['revenue'] = row['revenue'] or Decimal('0')
+
+    booking_fields = {
+        'bookings_scheduled', 'bookings_completed', 'bookings_cancelled', 'bookings_no_show',
+        'bookings_hall1', 'bookings_hall2', 'bookings_hall3', 'bookings_pool',
+    }
+    for row in Bookings.objects.values('booking_date', 'status', 'room').annotate(n=Count('pk')).order_by():
+        day = rows[row['booking_date']]
+        for field in (f"bookings_{row['status']}", f"bookings_{row['room']}"):
+            if field in booking_fields:
+                day[field] = day.get(field, 0) + row['n']
+
+    rows.pop(None, None)
+    if not rows:
+        return
+    # Как и refresh_range, дни без данных записываются нулями
+    objects = []
+    day, last = min(rows), max(rows)
+    while day <= last:
+        objects.append(DailyMetrics(day=day, **rows.get(day, {})))
+        day += timedelta(days=1)
+    DailyMetrics.objects.bulk_create(objects, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_bookinglocks_day'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_metrics, migrations.RunPython.noop),
+    ]
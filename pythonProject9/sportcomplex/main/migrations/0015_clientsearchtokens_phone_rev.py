@@ -0,0 +1,44 @@
+import re
+
+from django.db import migrations, models
+
+
+def phone_rev_token(phone):
+    """Полный номер из цифр (8 в начале -> 7) задом наперед, как в main.search на момент миграции"""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    return digits[::-1][:100]
+
+
+def fill_phone_rev_tokens(apps, schema_editor):
+    """Токены для поиска по последним цифрам телефона у уже существующих клиентов"""
+    Clients = apps.get_model('main', 'Clients')
+    ClientSearchTokens = apps.get_model('main', 'ClientSearchTokens')
+
+    last_pk = 0
+    while True:
+        batch = list(Clients.objects.filter(pk__gt=last_pk).order_by('pk').only('phone')[:1000])
+        if not batch:
+            break
+        ClientSearchTokens.objects.bulk_create([
+            ClientSearchTokens(client_id=client.pk, token=phone_rev_token(client.phone), kind='phone_rev')
+            for client in batch if phone_rev_token(client.phone)
+        ])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_backfill_daily_metrics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clientsearchtokens',
+            name='kind',
+            field=models.CharField(choices=[('name', 'Имя'), ('phone', 'Телефон'), ('phone_rev', 'Телефон с конца'), ('email', 'Email')], max_length=10, verbose_name='Тип'),
+        ),
+        migrations.RunPython(fill_phone_rev_tokens, migrations.RunPython.noop),
+    ]
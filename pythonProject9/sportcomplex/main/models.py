@@ -46,6 +46,10 @@ class Clients(models.Model):
         verbose_name = 'Клиент'
         verbose_name_plural = 'Клиенты'
         ordering = ['-created_at']
+        indexes = [
+            # Новые клиенты за день (DailyMetrics) и сортировка списка
+            models.Index(fields=['created_at'], name='clients_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -208,6 +212,10 @@ class Services(models.Model):
         verbose_name = 'Услуга'
         verbose_name_plural = 'Услуги'
         ordering = ['service_name']
+        indexes = [
+            # Автодополнение по началу названия
+            models.Index(fields=['service_name'], name='services_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.service_name} - {self.price} руб."
@@ -256,10 +264,25 @@ class Subscriptions(models.Model):
         verbose_name = 'Абонемент'
         verbose_name_plural = 'Абонементы'
         ordering = ['-created_at']
+        indexes = [
+            # Абонементы клиента по статусу (личный кабинет, формы записи)
+            models.Index(fields=['client', 'status'], name='subs_client_status_idx'),
+            # Выручка за день (DailyMetrics) и сортировка списка
+            models.Index(fields=['created_at'], name='subs_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"Абонемент #{self.subscription_id} - {self.client.full_name}"
 
+    @staticmethod
+    def active_q(today=None):
+        """
+        Условие действующего абонемента для запросов: статус active и срок не истек
+        (одно определение для статистики, сравнения и фильтров отчетов)
+        """
+        from datetime import date
+        return models.Q(status='active', end_date__gte=today or date.today())
+
     @property
     def is_active(self):
         """Проверяем, активен ли абонемент"""
@@ -347,6 +370,16 @@ class Bookings(models.Model):
         verbose_name = 'Запись на занятие'
         verbose_name_plural = 'Записи на занятия'
         ordering = ['booking_date', 'start_time']
+        indexes = [
+            # Занятость залов на день (проверка пересечений, свободные слоты, управление записями)
+            models.Index(fields=['booking_date', 'room', 'status'], name='bookings_date_room_status_idx'),
+            # Расписание клиента
+            models.Index(fields=['client', 'booking_date', 'status'], name='bookings_client_date_idx'),
+            # Занятость тренера на день
+            models.Index(fields=['trainer', 'booking_date', 'status'], name='bookings_trainer_date_idx'),
+            # Список записей по дате и времени (пагинация по курсору)
+            models.Index(fields=['booking_date', 'start_time'], name='bookings_date_time_idx'),
+        ]
 
     def __str__(self):
         return f"Запись #{self.booking_id} - {self.client.full_name} - {self.booking_date}"
@@ -393,4 +426,180 @@ class Bookings(models.Model):
         booking_datetime = datetime.combine(self.booking_date, self.start_time)
         current_datetime = datetime.now()
 
-        return (booking_datetime - current_datetime).seconds // 3600 >= 2
\ No newline at end of file
+        return (booking_datetime - current_datetime).seconds // 3600 >= 2
+
+
+# ============== ТАБЛИЦА BookingLocks (блокировки слотов) ==============
+class BookingLocks(models.Model):
+    """
+    Строки-блокировки для атомарного создания записей.
+
+    На каждый ресурс в конкретный день (зал, тренер, клиент) заводится одна строка.
+    Транзакция создания записи сначала захватывает эти строки на запись,
+    поэтому параллельные запросы на тот же ресурс выполняются строго по очереди.
+    Строки за прошедшие дни удаляет команда cleanup_booking_locks.
+    """
+    lock_key = models.CharField(max_length=100, unique=True, verbose_name='Ключ блокировки')
+    day = models.DateField(db_index=True, verbose_name='День')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Последний захват')
+
+    class Meta:
+        db_table = 'BookingLocks'
+        verbose_name = 'Блокировка слота'
+        verbose_name_plural = 'Блокировки слотов'
+
+    def __str__(self):
+        return self.lock_key
+
+
+# ============== ТАБЛИЦА DailyMetrics (дневные итоги для отчетов) ==============
+class DailyMetrics(models.Model):
+    """
+    Предрасчитанные итоги за день: выручка, новые клиенты и абонементы,
+    записи на занятия по статусам и залам. Обновляются сигналами при изменении
+    данных (см. metrics.py), история заполняется командой backfill_daily_metrics.
+    """
+    day = models.DateField(unique=True, verbose_name='День')
+
+    # Клиенты и абонементы - по дате создания
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Выручка')
+    new_clients = models.IntegerField(default=0, verbose_name='Новые клиенты')
+    new_subscriptions = models.IntegerField(default=0, verbose_name='Новые абонементы')
+
+    # Записи - по дате занятия
+    bookings_scheduled = models.IntegerField(default=0, verbose_name='Запланировано')
+    bookings_completed = models.IntegerField(default=0, verbose_name='Завершено')
+    bookings_cancelled = models.IntegerField(default=0, verbose_name='Отменено')
+    bookings_no_show = models.IntegerField(default=0, verbose_name='Не явился')
+    bookings_hall1 = models.IntegerField(default=0, verbose_name='Записи в зал 1')
+    bookings_hall2 = models.IntegerField(default=0, verbose_name='Записи в зал 2')
+    bookings_hall3 = models.IntegerField(default=0, verbose_name='Записи в зал 3')
+    bookings_pool = models.IntegerField(default=0, verbose_name='Записи в бассейн')
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата пересчета')
+
+    class Meta:
+        db_table = 'DailyMetrics'
+        verbose_name = 'Итоги дня'
+        verbose_name_plural = 'Итоги по дням'
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"Итоги за {self.day}"
+
+
+# ============== ТАБЛИЦА ClientSearchTokens (поиск клиентов) ==============
+class ClientSearchTokens(models.Model):
+    """
+    Нормализованные ключи поиска клиента: части имени в нижнем регистре
+    и латинице, телефон только из цифр (и задом наперед - для поиска по
+    последним цифрам), email. Поиск идет по префиксу токена
+    (индекс по token), а не по LIKE '%...%' в четырех колонках Clients.
+    Строки пересоздаются при сохранении клиента (см. search.py и signals.py).
+    """
+    KIND_CHOICES = [
+        ('name', 'Имя'),
+        ('phone', 'Телефон'),
+        ('phone_rev', 'Телефон с конца'),
+        ('email', 'Email'),
+    ]
+
+    client = models.ForeignKey(
+        Clients,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        verbose_name='Клиент'
+    )
+    token = models.CharField(max_length=100, verbose_name='Токен')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name='Тип')
+
+    class Meta:
+        db_table = 'ClientSearchTokens'
+        verbose_name = 'Токен поиска клиента'
+        verbose_name_plural = 'Токены поиска клиентов'
+        indexes = [
+            # Поиск по префиксу: token >= 'ivan' AND token < 'ivan\uffff' - диапазон по индексу, client_id берется из него же
+            models.Index(fields=['token', 'client'], name='client_search_token_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} ({self.get_kind_display()})"
+
+
+# ============== ТАБЛИЦА ReportJobs (фоновые отчеты) ==============
+class ReportJobs(models.Model):
+    """
+    Задание на построение отчета по тестовым данным (генерация + фильтр).
+    Выполняется в пуле потоков вне запроса (см. report_jobs.py), страница
+    фильтров опрашивает статус; результат лежит в ResultStore под result_token.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(
+        Users,
+        on_delete=models.CASCADE,
+        related_name='report_jobs',
+        verbose_name='Пользователь'
+    )
+    data_type = models.CharField(max_length=20, verbose_name='Тип данных')
+    count = models.IntegerField(verbose_name='Количество строк')
+    seed = models.BigIntegerField(verbose_name='Seed')
+    filter_type = models.CharField(max_length=10, blank=True, verbose_name='Фильтр')
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name='Статус')
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name='Прогресс, %')
+    message = models.CharField(max_length=255, blank=True, verbose_name='Сообщение')
+
+    filter_name = models.CharField(max_length=200, blank=True, verbose_name='Название фильтра')
+    filtered_count = models.IntegerField(null=True, blank=True, verbose_name='Найдено строк')
+    total_count = models.IntegerField(null=True, blank=True, verbose_name='Всего строк')
+    result_token = models.CharField(max_length=22, blank=True, verbose_name='Токен результата')
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начато')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершено')
+
+    class Meta:
+        db_table = 'ReportJobs'
+        verbose_name = 'Фоновый отчет'
+        verbose_name_plural = 'Фоновые отчеты'
+        ordering = ['-created_at']
+        indexes = [
+            # Незавершенные задания пользователя (ограничение очереди)
+            models.Index(fields=['user', 'status'], name='report_job_user_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Отчет #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+
+# ============== ТАБЛИЦА ReportBaselines (снимки тестовых данных) ==============
+class ReportBaselines(models.Model):
+    """
+    Показатели тестового набора пользователей за день - эталон для страницы
+    сравнения. Считаются командой build_report_baseline (раз в день по расписанию
+    или вручную), страница читает последний снимок, а не генерирует данные.
+    """
+    day = models.DateField(unique=True, verbose_name='День')
+    seed = models.BigIntegerField(verbose_name='Seed')
+    count = models.IntegerField(verbose_name='Количество строк')
+    stats = models.JSONField(default=dict, verbose_name='Показатели')
+    computed_at = models.DateTimeField(auto_now=True, verbose_name='Дата расчета')
+
+    class Meta:
+        db_table = 'ReportBaselines'
+        verbose_name = 'Снимок тестовых данных'
+        verbose_name_plural = 'Снимки тестовых данных'
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"Снимок за {self.day}"
@@ -0,0 +1,215 @@
+# pagination.py
+import base64
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    """Курсор поврежден или не подходит к текущей сортировке"""
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод по ключу сортировки (keyset) вместо COUNT + OFFSET.
+
+    Следующая страница выбирается условием "строки после последней показанной"
+    по полям сортировки (первичный ключ добавляется для однозначности), поэтому
+    глубокие страницы выбираются так же быстро, как первая. Позиция передается
+    в параметре cursor, номер страницы хранится в курсоре только для отображения.
+    Сортировать можно и по числовой аннотации (ранг поиска).
+    """
+
+    ELLIPSIS = '…'
+
+    def __init__(self, queryset, per_page, ordering, count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        pk_name = queryset.model._meta.pk.name
+        ordering = list(ordering)
+        if ordering[-1].lstrip('-') not in ('pk', pk_name):
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        # (имя поля, по убыванию)
+        self.ordering = [
+            (pk_name if field.lstrip('-') == 'pk' else field.lstrip('-'), field.startswith('-'))
+            for field in ordering
+        ]
+        self._count = count
+
+    # ============== КУРСОРЫ ==============
+    @staticmethod
+    def encode_cursor(values, direction, number):
+        payload = json.dumps({'v': values, 'd': direction, 'n': number}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, number = data['d'], int(data['n'])
+            if direction == 'last':
+                return None, direction, number
+            if direction not in ('next', 'prev') or len(data['v']) != len(self.ordering) or number < 1:
+                raise InvalidCursor(cursor)
+            values = [self.to_python(name, value) for (name, _), value in zip(self.ordering, data['v'])]
+        except (ValueError, TypeError, KeyError, binascii.Error, InvalidCursor) as e:
+            raise InvalidCursor(cursor) from e
+        return values, direction, number
+
+    def model_field(self, name):
+        """Поле модели или None для аннотации (например, ранга поиска)"""
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def to_python(self, name, value):
+        field = self.model_field(name)
+        if field is None:
+            if not isinstance(value, (int, float)):
+                raise InvalidCursor(value)
+            return value
+        return field.to_python(value)
+
+    def cursor_for(self, obj, direction, number):
+        values = []
+        for name, _ in self.ordering:
+            field = self.model_field(name)
+            value = getattr(obj, field.attname if field else name)
+            if field is None:
+                values.append(value)
+            else:
+                values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return self.encode_cursor(values, direction, number)
+
+    # ============== ЗАПРОСЫ ==============
+    def _order_by(self, reverse=False):
+        return [('-' if descending != reverse else '') + name for name, descending in self.ordering]
+
+    def _after(self, values, reverse=False):
+        """Условие "строка идет после values" в порядке сортировки (или до него при reverse)"""
+        condition = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for j in range(i):
+                step &= Q(**{self.ordering[j][0]: values[j]})
+            condition |= step
+        return condition
+
+    @cached_property
+    def count(self):
+        return self._count if self._count is not None else self.queryset.count()
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.count // self.per_page))
+
+    # ============== СТРАНИЦА ==============
+    def get_page(self, cursor=None):
+        """Страница по курсору; поврежденный курсор открывает первую страницу"""
+        if cursor:
+            try:
+                values, direction, number = self.decode_cursor(cursor)
+            except InvalidCursor:
+                return self.first_page()
+            if direction == 'last':
+                return self.last_page()
+            if direction == 'prev':
+                return self._page_before(values, number)
+            return self._page_after(values, number)
+        return self.first_page()
+
+    def first_page(self):
+        return self._page_after(None, 1)
+
+    def _page_after(self, values, number):
+        queryset = self.queryset.order_by(*self._order_by())
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+        rows = list(queryset[:self.per_page + 1])
+        return KeysetPage(self, rows[:self.per_page], number,
+                          has_previous=number > 1, has_next=len(rows) > self.per_page)
+
+    def _page_before(self, values, number):
+        queryset = self.queryset.order_by(*self._order_by(reverse=True)).filter(self._after(values, reverse=True))
+        rows = list(queryset[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        # Если страниц перед этой не осталось - это первая страница
+        return KeysetPage(self, rows, number if has_previous else 1,
+                          has_previous=has_previous, has_next=True)
+
+    def last_page(self):
+        number = self.num_pages
+        size = self.count - (number - 1) * self.per_page or self.per_page
+        rows = list(self.queryset.order_by(*self._order_by(reverse=True))[:size])[::-1]
+        return KeysetPage(self, rows, number, has_previous=number > 1, has_next=False)
+
+
+class KeysetPage:
+    """Страница KeysetPaginator (интерфейс близок к django.core.paginator.Page)"""
+
+    def __init__(self, paginator, object_list, number, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self._has_previous = has_previous and bool(object_list)
+        self._has_next = has_next and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.cursor_for(self.object_list[-1], 'next', self.number + 1)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.cursor_for(self.object_list[0], 'prev', max(1, self.number - 1))
+        return None
+
+    @property
+    def last_cursor(self):
+        return self.paginator.encode_cursor([], 'last', self.paginator.num_pages)
+
+    def page_bar(self):
+        """
+        Сокращенная панель страниц: первая, соседние, последняя и многоточия.
+        Элементы - (номер, курсор) или (ELLIPSIS, None); у первой страницы курсора нет.
+        """
+        last = max(self.paginator.num_pages, self.number)
+        items = [(1, None)]
+        if self.number - 1 > 2:
+            items.append((KeysetPaginator.ELLIPSIS, None))
+        if self.number - 1 > 1 and self.previous_cursor:
+            items.append((self.number - 1, self.previous_cursor))
+        if self.number != 1:
+            items.append((self.number, None))
+        if self.number + 1 < last and self.next_cursor:
+            items.append((self.number + 1, self.next_cursor))
+        if last - (self.number + 1) > 1:
+            items.append((KeysetPaginator.ELLIPSIS, None))
+        if last != self.number:
+            items.append((last, self.last_cursor))
+        return items
@@ -0,0 +1,503 @@
+# report_filters.py
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from django.db import models
+from django.db.models import Exists, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Clients, Subscriptions, Bookings
+
+RELATIVE_DATE_RE = re.compile(r'^today(?:([+-])(\d+))?$')
+
+
+class FilterSpecError(ValueError):
+    """Спецификация фильтра не подходит к данным (нет поля, неизвестная операция)"""
+
+
+# Готовые фильтры страницы "Фильтрация данных" (номер -> спецификация).
+#
+# Спецификация: {'name': ..., 'where': условие, 'sort': 'поле' или '-поле', 'limit': N}
+# Условие - {'field': ..., 'op': ..., 'value': ...} или {'and': [условия]} / {'or': [условия]}.
+# Значения дат: 'ГГГГ-ММ-ДД', 'today', 'today+N' / 'today-N' (дней от текущего дня)
+STORED_FILTERS = {
+    '1': {
+        'name': 'Кошелек > 100000',
+        'where': {'field': 'wallet', 'op': 'gt', 'value': 100000},
+    },
+    '2': {
+        'name': 'Возраст 18-25 и кошелек > 125000',
+        'where': {'and': [
+            {'field': 'age', 'op': 'between', 'value': [18, 25]},
+            {'field': 'wallet', 'op': 'gt', 'value': 125000},
+        ]},
+    },
+    '3': {
+        'name': 'Возраст > 50 и регистрация 2018-2023',
+        'where': {'and': [
+            {'field': 'age', 'op': 'gt', 'value': 50},
+            {'field': 'registration_date', 'op': 'between', 'value': ['2018-01-01', '2023-01-01']},
+        ]},
+    },
+    '4': {
+        'name': 'Gmail, кошелек > 50000, с подпиской',
+        'where': {'and': [
+            {'field': 'email', 'op': 'contains', 'value': 'gmail'},
+            {'field': 'wallet', 'op': 'gt', 'value': 50000},
+            {'field': 'is_subscribed', 'op': 'eq', 'value': True},
+        ]},
+    },
+    '5': {
+        'name': 'Возраст 18, Yahoo, кошелек < 25000',
+        'where': {'and': [
+            {'field': 'age', 'op': 'eq', 'value': 18},
+            {'field': 'email', 'op': 'contains', 'value': 'yahoo'},
+            {'field': 'wallet', 'op': 'lt', 'value': 25000},
+        ]},
+    },
+    '6': {
+        'name': 'Возраст > 100 и был сегодня',
+        'where': {'and': [
+            {'field': 'age', 'op': 'gt', 'value': 100},
+            {'field': 'last_online', 'op': 'on_date', 'value': 'today'},
+        ]},
+    },
+    '7': {
+        'name': 'Кошелек > 100000 (первые 50 по дате регистрации)',
+        'where': {'field': 'wallet', 'op': 'gt', 'value': 100000},
+        'sort': 'registration_date',
+        'limit': 50,
+    },
+    '8': {
+        'name': 'День рождения сегодня, возраст > 21',
+        'where': {'and': [
+            {'field': 'birth_date', 'op': 'anniversary', 'value': 'today'},
+            {'field': 'age', 'op': 'gt', 'value': 21},
+        ]},
+    },
+    '9': {
+        'name': 'С подпиской, потратил > 400000, возраст > 25',
+        'where': {'and': [
+            {'field': 'is_subscribed', 'op': 'eq', 'value': True},
+            {'field': 'total_spent', 'op': 'gt', 'value': 400000},
+            {'field': 'age', 'op': 'gt', 'value': 25},
+        ]},
+        'sort': 'registration_date',
+        'limit': 10,
+    },
+}
+
+
+def resolve_date(value):
+    """'today', 'today+7', 'today-30' - в дату; остальные значения без изменений"""
+    match = RELATIVE_DATE_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return value
+    days = int(match.group(2) or 0)
+    return date.today() + timedelta(days=-days if match.group(1) == '-' else days)
+
+
+class FilterEngine:
+    """
+    Декларативные фильтры DataFrame.
+
+    Условия спецификации собираются в одну булеву маску (numpy), и строки
+    выбираются из DataFrame один раз - без копии на каждое условие.
+    Ошибки спецификации не проглатываются, а поднимаются как FilterSpecError.
+    """
+
+    OPERATIONS = ('eq', 'ne', 'gt', 'gte', 'lt', 'lte', 'between', 'in', 'contains', 'on_date', 'anniversary')
+
+    @staticmethod
+    def value_for(column, value):
+        """Значение условия в типе столбца: строки-даты и 'today' для столбцов дат"""
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return np.datetime64(pd.Timestamp(resolve_date(value)), 'us')
+        return value
+
+    @staticmethod
+    def condition_mask(df, condition):
+        field, op, value = condition.get('field'), condition.get('op'), condition.get('value')
+        if field not in df.columns:
+            raise FilterSpecError(f'Нет поля {field}')
+        if op not in FilterEngine.OPERATIONS:
+            raise FilterSpecError(f'Неизвестная операция {op}')
+
+        column = df[field]
+        if op == 'contains':
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                return FilterEngine.categorical_contains(column, str(value))
+            return column.astype(str).str.contains(str(value), regex=False).to_numpy(dtype=bool)
+        if op == 'in':
+            return column.isin(list(value)).to_numpy()
+        if op in ('on_date', 'anniversary'):
+            if not pd.api.types.is_datetime64_any_dtype(column):
+                raise FilterSpecError(f'Операция {op} только для дат, поле {field}')
+            day = pd.Timestamp(FilterEngine.value_for(column, value))
+            if op == 'on_date':
+                return column.to_numpy().astype('datetime64[D]') == np.datetime64(day.date(), 'D')
+            return ((column.dt.month == day.month) & (column.dt.day == day.day)).to_numpy()
+
+        if op == 'between':
+            if len(value) != 2:
+                raise FilterSpecError(f'Для between нужны две границы, поле {field}')
+            low, high = (FilterEngine.value_for(column, bound) for bound in value)
+            values = column.to_numpy()
+            return (values >= low) & (values <= high)
+
+        values = column.to_numpy() if not isinstance(column.dtype, pd.CategoricalDtype) else column
+        value = FilterEngine.value_for(column, value)
+        try:
+            if op == 'eq':
+                return np.asarray(values == value)
+            if op == 'ne':
+                return np.asarray(values != value)
+            if op == 'gt':
+                return np.asarray(values > value)
+            if op == 'gte':
+                return np.asarray(values >= value)
+            if op == 'lt':
+                return np.asarray(values < value)
+            return np.asarray(values <= value)
+        except TypeError as e:
+            raise FilterSpecError(f'Нельзя сравнить поле {field} со значением {value!r}') from e
+
+    @staticmethod
+    def categorical_contains(column, value):
+        """Подстрока ищется один раз по справочнику категорий, а не в каждой строке"""
+        matches = np.asarray(column.cat.categories.astype(str).str.contains(value, regex=False), dtype=bool)
+        codes = column.cat.codes.to_numpy()
+        return np.where(codes >= 0, matches[codes], False)
+
+    @staticmethod
+    def mask(df, where):
+        """Булева маска условия (вложенные and/or)"""
+        if where is None:
+            return np.ones(len(df), dtype=bool)
+        if 'and' in where or 'or' in where:
+            parts = where.get('and', where.get('or'))
+            if not parts:
+                raise FilterSpecError('Пустой список условий')
+            combine = np.logical_and if 'and' in where else np.logical_or
+            result = FilterEngine.mask(df, parts[0])
+            for part in parts[1:]:
+                result = combine(result, FilterEngine.mask(df, part))
+            return result
+        return FilterEngine.condition_mask(df, where)
+
+    @staticmethod
+    def apply(df, spec):
+        """
+        Строки DataFrame по спецификации: маска, сортировка и limit считаются
+        по позициям строк, а сами строки выбираются из DataFrame один раз
+        """
+        positions = np.flatnonzero(FilterEngine.mask(df, spec.get('where')))
+        sort = spec.get('sort')
+        if sort:
+            field = sort.lstrip('-')
+            if field not in df.columns:
+                raise FilterSpecError(f'Нет поля {field} для сортировки')
+            keys = pd.Series(df[field].to_numpy()[positions])
+            order = keys.sort_values(ascending=not sort.startswith('-'), kind='stable').index.to_numpy()
+            positions = positions[order]
+        if spec.get('limit'):
+            positions = positions[:spec['limit']]
+        return df.iloc[positions]
+
+
+# ============== ФИЛЬТРЫ ПО БАЗЕ ДАННЫХ ==============
+def client_annotations(queryset):
+    """Вычисляемые поля клиента: сумма абонементов и наличие действующего абонемента"""
+    spent = (
+        Subscriptions.objects.filter(client=OuterRef('pk'))
+        .values('client')
+        .annotate(total=Sum('price_paid'))
+        .values('total')
+    )
+    active = Subscriptions.objects.filter(Subscriptions.active_q(), client=OuterRef('pk'))
+    return queryset.annotate(
+        total_spent=Coalesce(
+            Subquery(spent, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0.00')),
+        ),
+        is_subscribed=Exists(active),
+    )
+
+
+# Таблицы БД для фильтров: имя поля в спецификации -> поле ORM, выводимые столбцы.
+# Поле age вычисляется из birth_date: условия по возрасту переводятся в диапазоны дат рождения
+DB_SOURCES = {
+    'clients': {
+        'model': Clients,
+        'annotate': client_annotations,
+        'datetime_fields': {'created_at'},
+        'fields': {
+            'id': 'client_id',
+            'name': 'first_name',
+            'last_name': 'last_name',
+            'phone': 'phone',
+            'email': 'email',
+            'birth_date': 'birth_date',
+            'registration_date': 'created_at',
+            'total_spent': 'total_spent',
+            'is_subscribed': 'is_subscribed',
+        },
+        'age_field': 'birth_date',
+        'columns': ['client_id', 'last_name', 'first_name', 'phone', 'email', 'birth_date', 'created_at',
+                    'total_spent', 'is_subscribed'],
+    },
+    'subscriptions': {
+        'model': Subscriptions,
+        'annotate': None,
+        'datetime_fields': set(),
+        'fields': {
+            'id': 'subscription_id',
+            'client': 'client__last_name',
+            'service': 'service__service_name',
+            'start_date': 'start_date',
+            'end_date': 'end_date',
+            'price_paid': 'price_paid',
+            'status': 'status',
+        },
+        'age_field': 'client__birth_date',
+        'columns': ['subscription_id', 'client__last_name', 'client__first_name', 'service__service_name',
+                    'start_date', 'end_date', 'price_paid', 'status'],
+    },
+    'bookings': {
+        'model': Bookings,
+        'annotate': None,
+        'datetime_fields': set(),
+        'fields': {
+            'id': 'booking_id',
+            'client_name': 'client__last_name',
+            'service': 'service__service_name',
+            'trainer': 'trainer__full_name',
+            'booking_date': 'booking_date',
+            'start_time': 'start_time',
+            'room': 'room',
+            'status': 'status',
+        },
+        'age_field': 'client__birth_date',
+        'columns': ['booking_id', 'booking_date', 'start_time', 'end_time', 'client__last_name',
+                    'client__first_name', 'service__service_name', 'trainer__full_name', 'room', 'status'],
+    },
+}
+
+# Готовые фильтры по реальным данным (спецификации как в STORED_FILTERS + таблица)
+DB_FILTERS = {
+    'clients_over_50': {
+        'table': 'clients',
+        'name': 'Клиенты старше 50 лет, зарегистрированные с 2018 года',
+        'where': {'and': [
+            {'field': 'age', 'op': 'gt', 'value': 50},
+            {'field': 'registration_date', 'op': 'gte', 'value': '2018-01-01'},
+        ]},
+        'sort': 'last_name',
+    },
+    'clients_young': {
+        'table': 'clients',
+        'name': 'Клиенты 18-25 лет с действующим абонементом',
+        'where': {'and': [
+            {'field': 'age', 'op': 'between', 'value': [18, 25]},
+            {'field': 'is_subscribed', 'op': 'eq', 'value': True},
+        ]},
+        'sort': 'last_name',
+    },
+    'clients_gmail': {
+        'table': 'clients',
+        'name': 'Gmail и действующий абонемент',
+        'where': {'and': [
+            {'field': 'email', 'op': 'contains', 'value': 'gmail'},
+            {'field': 'is_subscribed', 'op': 'eq', 'value': True},
+        ]},
+        'sort': 'last_name',
+    },
+    'clients_top_spent': {
+        'table': 'clients',
+        'name': 'Топ-50 клиентов по сумме абонементов',
+        'where': {'field': 'total_spent', 'op': 'gt', 'value': 0},
+        'sort': '-total_spent',
+        'limit': 50,
+    },
+    'clients_birthday': {
+        'table': 'clients',
+        'name': 'День рождения сегодня',
+        'where': {'field': 'birth_date', 'op': 'anniversary', 'value': 'today'},
+        'sort': 'last_name',
+    },
+    'subscriptions_expiring': {
+        'table': 'subscriptions',
+        'name': 'Активные абонементы, истекающие в ближайшие 7 дней',
+        'where': {'and': [
+            {'field': 'status', 'op': 'eq', 'value': 'active'},
+            {'field': 'end_date', 'op': 'between', 'value': ['today', 'today+7']},
+        ]},
+        'sort': 'end_date',
+    },
+    'subscriptions_expensive': {
+        'table': 'subscriptions',
+        'name': 'Абонементы дороже 10000',
+        'where': {'field': 'price_paid', 'op': 'gt', 'value': 10000},
+        'sort': '-price_paid',
+    },
+    'bookings_today': {
+        'table': 'bookings',
+        'name': 'Записи на сегодня',
+        'where': {'and': [
+            {'field': 'booking_date', 'op': 'on_date', 'value': 'today'},
+            {'field': 'status', 'op': 'eq', 'value': 'scheduled'},
+        ]},
+        'sort': 'start_time',
+    },
+    'bookings_no_show': {
+        'table': 'bookings',
+        'name': 'Неявки за последние 30 дней',
+        'where': {'and': [
+            {'field': 'status', 'op': 'eq', 'value': 'no_show'},
+            {'field': 'booking_date', 'op': 'gte', 'value': 'today-30'},
+        ]},
+        'sort': '-booking_date',
+    },
+}
+
+
+def years_ago(years, today=None):
+    """Дата years лет назад (29 февраля -> 28 февраля)"""
+    today = today or date.today()
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:
+        return today.replace(year=today.year - years, day=28)
+
+
+class QueryFilter:
+    """
+    Те же спецификации фильтров для таблиц БД: условия компилируются в Q,
+    и фильтрация, сортировка и limit выполняются в SQL.
+    """
+
+    LOOKUPS = {'eq': 'exact', 'gt': 'gt', 'gte': 'gte', 'lt': 'lt', 'lte': 'lte', 'in': 'in', 'contains': 'icontains'}
+
+    @staticmethod
+    def age_q(birth_field, op, value):
+        """
+        Условие по возрасту как диапазон дат рождения (без вычисления возраста
+        в SQL, поэтому работает индекс по дате и одинаково на MySQL и SQLite)
+        """
+        def at_least(years):
+            return Q(**{f'{birth_field}__lte': years_ago(years)})
+
+        def younger_than(years):
+            return Q(**{f'{birth_field}__gt': years_ago(years)})
+
+        try:
+            if op == 'between':
+                low, high = (int(bound) for bound in value)
+                return at_least(low) & younger_than(high + 1)
+            if op == 'in':
+                condition = Q(pk__in=[])
+                for years in value:
+                    condition |= QueryFilter.age_q(birth_field, 'eq', years)
+                return condition
+            years = int(value)
+        except (TypeError, ValueError) as e:
+            raise FilterSpecError(f'Неверный возраст {value!r}') from e
+
+        conditions = {
+            'eq': lambda: at_least(years) & younger_than(years + 1),
+            'ne': lambda: ~(at_least(years) & younger_than(years + 1)),
+            'gt': lambda: at_least(years + 1),
+            'gte': lambda: at_least(years),
+            'lt': lambda: younger_than(years),
+            'lte': lambda: younger_than(years + 1),
+        }
+        if op not in conditions:
+            raise FilterSpecError(f'Операция {op} не поддерживается для возраста')
+        return conditions[op]()
+
+    @staticmethod
+    def condition_q(source, condition):
+        field, op, value = condition.get('field'), condition.get('op'), condition.get('value')
+        if op not in FilterEngine.OPERATIONS:
+            raise FilterSpecError(f'Неизвестная операция {op}')
+        if field == 'age':
+            return QueryFilter.age_q(source['age_field'], op, value)
+        if field not in source['fields']:
+            raise FilterSpecError(f'Нет поля {field}')
+
+        lookup = source['fields'][field]
+        if lookup in source['datetime_fields']:
+            # Даты в спецификации сравниваются с датой (без времени и часового пояса)
+            lookup = f'{lookup}__date'
+        if op == 'between':
+            if len(value) != 2:
+                raise FilterSpecError(f'Для between нужны две границы, поле {field}')
+            return Q(**{f'{lookup}__range': [resolve_date(bound) for bound in value]})
+        if op == 'on_date':
+            return Q(**{lookup: resolve_date(value)})
+        if op == 'anniversary':
+            day = resolve_date(value)
+            return Q(**{f'{lookup}__month': day.month, f'{lookup}__day': day.day})
+        if op == 'ne':
+            return ~Q(**{lookup: resolve_date(value)})
+        return Q(**{f'{lookup}__{QueryFilter.LOOKUPS[op]}': resolve_date(value)})
+
+    @staticmethod
+    def to_q(source, where):
+        """Условие спецификации (вложенные and/or) в Q"""
+        if where is None:
+            return Q()
+        if 'and' in where or 'or' in where:
+            parts = where.get('and', where.get('or'))
+            if not parts:
+                raise FilterSpecError('Пустой список условий')
+            result = QueryFilter.to_q(source, parts[0])
+            for part in parts[1:]:
+                part_q = QueryFilter.to_q(source, part)
+                result = result & part_q if 'and' in where else result | part_q
+            return result
+        return QueryFilter.condition_q(source, where)
+
+    @staticmethod
+    def queryset(spec):
+        """Строки (values) по спецификации: фильтр, сортировка (+ первичный ключ) и limit"""
+        source = DB_SOURCES[spec['table']]
+        queryset = source['model'].objects.all()
+        if source['annotate']:
+            queryset = source['annotate'](queryset)
+        queryset = queryset.filter(QueryFilter.to_q(source, spec.get('where')))
+
+        ordering = ['pk']
+        sort = spec.get('sort')
+        if sort:
+            field, descending = sort.lstrip('-'), sort.startswith('-')
+            if field == 'age':
+                # Старше - раньше родился
+                field, descending = source['age_field'], not descending
+            elif field in source['fields']:
+                field = source['fields'][field]
+            else:
+                raise FilterSpecError(f'Нет поля {field} для сортировки')
+            ordering.insert(0, ('-' if descending else '') + field)
+        queryset = queryset.order_by(*ordering).values(*source['columns'])
+
+        if spec.get('limit'):
+            queryset = queryset[:spec['limit']]
+        return queryset
+
+    @staticmethod
+    def page_dataframe(spec, rows):
+        """
+        DataFrame страницы результата (rows - строки страницы из queryset): в pandas
+        попадают только показываемые строки; возраст клиентов считается для них же
+        """
+        source = DB_SOURCES[spec['table']]
+        df = pd.DataFrame.from_records(list(rows), columns=source['columns'])
+        if spec['table'] == 'clients' and not df.empty:
+            today = date.today()
+            df.insert(3, 'age', [
+                today.year - born.year - ((today.month, today.day) < (born.month, born.day)) if born else None
+                for born in df['birth_date']
+            ])
+        return df
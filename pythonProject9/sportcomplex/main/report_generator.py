@@ -1,85 +1,304 @@
 # report_generator.py
+import os
 import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from .models import Users, Clients, Trainers, Services, Subscriptions, Bookings
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from .models import Users, Clients, Trainers, Services, Subscriptions, Bookings, ReportBaselines
+from .stats import DashboardStats
+from .report_filters import FilterEngine
+from .shards import fill_shard, setup_worker
 from django.utils import timezone
 import io
 import base64
 from django.db import models
 
 
+# Значения категориальных столбцов тестовых данных
+USER_NAMES = ["Иван", "Анна", "Петр", "Ольга", "Сергей", "Мария", "Дмитрий", "Елена", "Алексей", "Татьяна"]
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "mail.ru", "yandex.ru", "bk.ru"]
+CITIES = ["Москва", "СПб", "Казань", "Новосибирск", "Екатеринбург"]
+SUBSCRIPTION_TYPES = ["Базовый", "Стандарт", "Премиум", "VIP"]
+USER_TRAINERS = ["Александр", "Екатерина", "Максим", "Юлия", "Денис"]
+CLIENT_NAMES = ["Иван", "Анна", "Петр", "Ольга", "Сергей", "Мария"]
+SERVICE_NAMES = ["Персональная тренировка", "Групповое занятие", "Йога", "Пилатес", "Кроссфит", "Бассейн"]
+BOOKING_TRAINERS = ["Александр", "Екатерина", "Максим", "Юлия", "Денис", "Анна"]
+ROOMS = ["Зал 1", "Зал 2", "Зал 3", "Бассейн"]
+BOOKING_STATUSES = ["scheduled", "completed", "cancelled", "no_show"]
+SUBSCRIPTION_STATUSES = ['active', 'expired', 'cancelled']
+
+# Схемы DataFrame тестовых данных: категории для строк с малым числом значений,
+# datetime64[ns] для дат и минимальные целые типы по диапазонам генераторов.
+# Суммы остаются float64: во float32 при значениях до 500000 теряются копейки
+REPORT_SCHEMAS = {
+    'users': {
+        'id': 'int32',
+        'name': pd.CategoricalDtype(USER_NAMES),
+        'age': 'int8',
+        'wallet': 'float64',
+        'email': 'str',  # почти уникален: категория заняла бы больше строк
+        'is_subscribed': 'bool',
+        'registration_date': 'datetime64[ns]',
+        'last_online': 'datetime64[ns]',
+        'total_spent': 'float64',
+        'birth_date': 'datetime64[ns]',
+        'city': pd.CategoricalDtype(CITIES),
+        'subscription_type': pd.CategoricalDtype(SUBSCRIPTION_TYPES),
+        'visits_count': 'int16',
+        'trainer_name': pd.CategoricalDtype(USER_TRAINERS),
+    },
+    'bookings': {
+        'id': 'int32',
+        'client_name': pd.CategoricalDtype(CLIENT_NAMES),
+        'service': pd.CategoricalDtype(SERVICE_NAMES),
+        'trainer': pd.CategoricalDtype(BOOKING_TRAINERS),
+        'booking_date': 'datetime64[ns]',
+        'start_time': 'datetime64[ns]',
+        'end_time': 'datetime64[ns]',
+        'room': pd.CategoricalDtype(ROOMS),
+        'status': pd.CategoricalDtype(BOOKING_STATUSES),
+        'price': 'float64',
+        'duration': 'int16',
+    },
+    'subscriptions': {
+        'id': 'int32',
+        'client': pd.CategoricalDtype(CLIENT_NAMES),
+        'service': pd.CategoricalDtype(SERVICE_NAMES),
+        'start_date': 'datetime64[ns]',
+        'end_date': 'datetime64[ns]',
+        'price_paid': 'float64',
+        'status': pd.CategoricalDtype(SUBSCRIPTION_STATUSES),
+        'months': 'int8',
+        'visits_left': 'int8',
+    },
+}
+
+
+def generation_anchor():
+    """
+    Точка отсчета относительных дат тестовых данных - начало текущего дня
+    (а не datetime.now()), чтобы один seed давал одинаковые данные весь день
+    """
+    return datetime.combine(date.today(), datetime.min.time())
+
+
+class DatasetCache:
+    """
+    LRU-кэш DataFrame тестовых данных в памяти процесса.
+
+    Ключ - (тип данных, количество, seed, день генерации); здесь же держатся
+    загруженные результаты отчетов (см. result_table.py). Размер ограничен
+    REPORT_DATASET_CACHE_MB: при превышении вытесняются давно не использованные
+    наборы. DataFrame хранятся в памяти процесса, а не в кэше Django, чтобы
+    не сериализовать их на каждый запрос. Размер набора считается один раз
+    при добавлении (вне блокировки), общий размер ведется счетчиком.
+    """
+
+    _frames = OrderedDict()  # ключ -> (DataFrame, байт)
+    _bytes = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(key):
+        with DatasetCache._lock:
+            entry = DatasetCache._frames.get(key)
+            if entry is None:
+                return None
+            DatasetCache._frames.move_to_end(key)
+            return entry[0]
+
+    @staticmethod
+    def put(key, df):
+        limit = settings.REPORT_DATASET_CACHE_MB * 1024 * 1024
+        size = int(df.memory_usage(deep=True).sum())
+        with DatasetCache._lock:
+            previous = DatasetCache._frames.pop(key, None)
+            if previous is not None:
+                DatasetCache._bytes -= previous[1]
+            DatasetCache._frames[key] = (df, size)
+            DatasetCache._bytes += size
+            # Последний добавленный набор остается, даже если он один больше лимита
+            while len(DatasetCache._frames) > 1 and DatasetCache._bytes > limit:
+                _, (_, evicted) = DatasetCache._frames.popitem(last=False)
+                DatasetCache._bytes -= evicted
+
+    @staticmethod
+    def info():
+        """Наборы в кэше (от давно использованных к недавним) и занятая память в байтах"""
+        with DatasetCache._lock:
+            return list(DatasetCache._frames), DatasetCache._bytes
+
+    @staticmethod
+    def clear():
+        with DatasetCache._lock:
+            DatasetCache._frames.clear()
+            DatasetCache._bytes = 0
+
+
+class BaselineSnapshot:
+    """
+    Снимок показателей тестовых пользователей (ReportBaselines) для страницы
+    сравнения. Набор генерируется только при построении снимка (команда
+    build_report_baseline); страница читает последний снимок из кэша Django.
+    """
+
+    CACHE_KEY = 'report_baseline'
+
+    @staticmethod
+    def stats(df):
+        """Средние показатели набора пользователей"""
+        return {
+            'total_count': len(df),
+            'avg_age': round(float(df['age'].mean()), 1),
+            'avg_wallet': round(float(df['wallet'].mean()), 2),
+            'avg_total_spent': round(float(df['total_spent'].mean()), 2),
+            'avg_visits': round(float(df['visits_count'].mean()), 1),
+            'subscribed_percent': round(float(df['is_subscribed'].mean()) * 100, 1),
+        }
+
+    @staticmethod
+    def as_dict(snapshot):
+        return {
+            'day': snapshot.day,
+            'seed': snapshot.seed,
+            'count': snapshot.count,
+            'stats': snapshot.stats,
+            'computed_at': snapshot.computed_at,
+        }
+
+    @staticmethod
+    def build(day=None, count=None, seed=None):
+        """Генерирует набор, сохраняет снимок за день (заменяя прежний) и кладет его в кэш"""
+        day = day or timezone.localdate()
+        count = count or settings.REPORT_BASELINE_ROWS
+        seed = settings.REPORT_DATASET_SEED if seed is None else seed
+
+        df = ReportGenerator.create_report_dataframe('users', count, seed)
+        snapshot, _ = ReportBaselines.objects.update_or_create(
+            day=day, defaults={'seed': seed, 'count': count, 'stats': BaselineSnapshot.stats(df)}
+        )
+        BaselineSnapshot.invalidate()
+        return snapshot
+
+    @staticmethod
+    def latest():
+        """
+        Последний снимок (словарь as_dict) из кэша или None, если снимков еще нет.
+        Данные здесь не генерируются: снимок строит build_report_baseline
+        """
+        data = cache.get(BaselineSnapshot.CACHE_KEY)
+        if data is None:
+            snapshot = ReportBaselines.objects.first()
+            if snapshot is None:
+                return None
+            data = BaselineSnapshot.as_dict(snapshot)
+            cache.set(BaselineSnapshot.CACHE_KEY, data, settings.STATS_CACHE_TIMEOUT)
+        return data
+
+    @staticmethod
+    def invalidate():
+        cache.delete(BaselineSnapshot.CACHE_KEY)
+
+    @staticmethod
+    def compare(real_stats, baseline):
+        """Строки сравнения реальных клиентов с тестовыми пользователями: (показатель, реальные, тестовые)"""
+        clients = real_stats['clients']
+        subscriptions = real_stats['subscriptions']
+        stats = baseline['stats']
+        total = clients['total']
+        return [
+            ('Количество', total, stats['total_count']),
+            ('Средний возраст, лет', clients['avg_age'], stats['avg_age']),
+            ('С действующим абонементом, %',
+             round(subscriptions['active_clients'] / total * 100, 1) if total else 0, stats['subscribed_percent']),
+            ('Потрачено в среднем, руб.',
+             round(float(subscriptions['total_revenue']) / total, 2) if total else 0, stats['avg_total_spent']),
+        ]
+
+
 class ReportGenerator:
     """Генератор отчетов и тестовых данных"""
 
+    DATA_TYPES = ('users', 'bookings', 'subscriptions')
+
     @staticmethod
-    def generate_test_users(count=100):
-        """Генерирует тестовых пользователей (аналог UserGenerator)"""
-        names = ["Иван", "Анна", "Петр", "Ольга", "Сергей", "Мария", "Дмитрий", "Елена", "Алексей", "Татьяна"]
-        domains = ["gmail.com", "yahoo.com", "mail.ru", "yandex.ru", "bk.ru"]
+    def generate_test_users(count=100, seed=None):
+        """Генерирует тестовых пользователей (аналог UserGenerator); одинаковый seed - одинаковые данные"""
+        rng = random.Random(seed)
+        names = USER_NAMES
+        domains = EMAIL_DOMAINS
 
         def random_date(start_year, end_year):
             start = datetime(start_year, 1, 1)
             end = datetime(end_year, 12, 31)
-            return start + timedelta(days=random.randint(0, (end - start).days))
+            return start + timedelta(days=rng.randint(0, (end - start).days))
 
         def random_email(name):
-            return f"{name.lower()}{random.randint(1, 9999)}@{random.choice(domains)}"
+            return f"{name.lower()}{rng.randint(1, 9999)}@{rng.choice(domains)}"
 
+        today = generation_anchor()
         users = []
         for i in range(1, count + 1):
-            name = random.choice(names)
-            age = random.randint(16, 80)
-            birth_date = datetime.now() - timedelta(days=age * 365)
+            name = rng.choice(names)
+            age = rng.randint(16, 80)
+            birth_date = today - timedelta(days=age * 365)
 
             user = {
                 'id': i,
                 'name': name,
                 'age': age,
-                'wallet': round(random.uniform(0, 200000), 2),
+                'wallet': round(rng.uniform(0, 200000), 2),
                 'email': random_email(name),
-                'is_subscribed': random.choice([True, False]),
+                'is_subscribed': rng.choice([True, False]),
                 'registration_date': random_date(2015, 2024),
-                'last_online': datetime.now() - timedelta(days=random.randint(0, 30)),
-                'total_spent': round(random.uniform(0, 500000), 2),
+                'last_online': today - timedelta(days=rng.randint(0, 30)),
+                'total_spent': round(rng.uniform(0, 500000), 2),
                 'birth_date': birth_date,
-                'city': random.choice(["Москва", "СПб", "Казань", "Новосибирск", "Екатеринбург"]),
-                'subscription_type': random.choice(["Базовый", "Стандарт", "Премиум", "VIP"]),
-                'visits_count': random.randint(0, 200),
-                'trainer_name': random.choice(["Александр", "Екатерина", "Максим", "Юлия", "Денис"])
+                'city': rng.choice(CITIES),
+                'subscription_type': rng.choice(SUBSCRIPTION_TYPES),
+                'visits_count': rng.randint(0, 200),
+                'trainer_name': rng.choice(USER_TRAINERS)
             }
             users.append(user)
 
         return users
 
     @staticmethod
-    def generate_test_bookings(count=500):
+    def generate_test_bookings(count=500, seed=None):
         """Генерирует тестовые записи на занятия"""
-        services = ["Персональная тренировка", "Групповое занятие", "Йога", "Пилатес", "Кроссфит", "Бассейн"]
-        trainers = ["Александр", "Екатерина", "Максим", "Юлия", "Денис", "Анна"]
-        rooms = ["Зал 1", "Зал 2", "Зал 3", "Бассейн"]
-        statuses = ["scheduled", "completed", "cancelled", "no_show"]
+        rng = random.Random(seed)
+        services = SERVICE_NAMES
+        trainers = BOOKING_TRAINERS
+        rooms = ROOMS
+        statuses = BOOKING_STATUSES
 
         bookings = []
-        today = datetime.now()
+        today = generation_anchor()
 
         for i in range(1, count + 1):
-            booking_date = today - timedelta(days=random.randint(-30, 30))
-            start_hour = random.randint(8, 20)
+            booking_date = today - timedelta(days=rng.randint(-30, 30))
+            start_hour = rng.randint(8, 20)
             start_time = datetime(booking_date.year, booking_date.month, booking_date.day, start_hour, 0)
-            end_time = start_time + timedelta(minutes=random.choice([60, 90, 120]))
+            end_time = start_time + timedelta(minutes=rng.choice([60, 90, 120]))
 
             booking = {
                 'id': i,
-                'client_name': random.choice(["Иван", "Анна", "Петр", "Ольга", "Сергей", "Мария"]),
-                'service': random.choice(services),
-                'trainer': random.choice(trainers),
+                'client_name': rng.choice(CLIENT_NAMES),
+                'service': rng.choice(services),
+                'trainer': rng.choice(trainers),
                 'booking_date': booking_date,
                 'start_time': start_time,
                 'end_time': end_time,
-                'room': random.choice(rooms),
-                'status': random.choice(statuses),
-                'price': round(random.uniform(1000, 5000), 2),
+                'room': rng.choice(rooms),
+                'status': rng.choice(statuses),
+                'price': round(rng.uniform(1000, 5000), 2),
                 'duration': (end_time - start_time).seconds // 60
             }
             bookings.append(booking)
@@ -87,135 +306,418 @@ class ReportGenerator:
         return bookings
 
     @staticmethod
-    def generate_subscriptions_data(count=300):
+    def generate_subscriptions_data(count=300, seed=None):
         """Генерирует тестовые абонементы"""
-        clients = ["Иван", "Анна", "Петр", "Ольга", "Сергей", "Мария"]
-        services = ["Персональная тренировка", "Групповое занятие", "Йога", "Пилатес", "Кроссфит", "Бассейн"]
+        rng = random.Random(seed)
+        clients = CLIENT_NAMES
+        services = SERVICE_NAMES
 
         subscriptions = []
-        today = datetime.now()
+        today = generation_anchor()
 
         for i in range(1, count + 1):
-            start_date = today - timedelta(days=random.randint(0, 365))
-            months = random.choice([1, 3, 6, 12])
+            start_date = today - timedelta(days=rng.randint(0, 365))
+            months = rng.choice([1, 3, 6, 12])
             end_date = start_date + timedelta(days=30 * months)
 
             sub = {
                 'id': i,
-                'client': random.choice(clients),
-                'service': random.choice(services),
+                'client': rng.choice(clients),
+                'service': rng.choice(services),
                 'start_date': start_date,
                 'end_date': end_date,
-                'price_paid': round(random.uniform(3000, 50000), 2),
-                'status': random.choice(['active', 'expired', 'cancelled']),
+                'price_paid': round(rng.uniform(3000, 50000), 2),
+                'status': rng.choice(SUBSCRIPTION_STATUSES),
                 'months': months,
-                'visits_left': random.randint(0, 50)
+                'visits_left': rng.randint(0, 50)
             }
             subscriptions.append(sub)
 
         return subscriptions
 
+    # ============== ВЕКТОРНАЯ ГЕНЕРАЦИЯ ==============
+    # Те же наборы, что и generate_*, но столбцами через numpy.random.Generator:
+    # без словаря на строку и datetime-арифметики в цикле Python.
+    # *_columns возвращают "сырые" массивы (коды категорий вместо строк), из которых
+    # frame_from_columns собирает DataFrame; в таком виде столбцы можно заполнять
+    # по частям в общей памяти (create_report_dataframe_sharded)
+
+    SHARD_ROWS = 250000
+
+    @staticmethod
+    def _codes(rng, values, count):
+        """Коды случайных значений из списка (для категориального столбца)"""
+        return rng.integers(0, len(values), count)
+
+    @staticmethod
+    def _days_before(anchor, days):
+        return anchor - days.astype('timedelta64[D]')
+
+    @staticmethod
+    def users_columns(count=100, seed=None, start=0):
+        """Столбцы тестовых пользователей (векторный аналог generate_test_users); id с start + 1"""
+        rng = np.random.default_rng(seed)
+        today = np.datetime64(generation_anchor(), 'ns')
+        registration_start = np.datetime64('2015-01-01', 'ns')
+        registration_days = (np.datetime64('2024-12-31') - np.datetime64('2015-01-01')).astype(int)
+
+        name_codes = rng.integers(0, len(USER_NAMES), count)
+        age = rng.integers(16, 80, count, endpoint=True)
+
+        # email = имя + номер + домен, в столбце - числовой код сочетания (см. email_strings)
+        email_numbers = rng.integers(1, 9999, count, endpoint=True)
+        domain_codes = rng.integers(0, len(EMAIL_DOMAINS), count)
+
+        return {
+            'id': np.arange(start + 1, start + count + 1),
+            'name': name_codes,
+            'age': age,
+            'wallet': np.round(rng.uniform(0, 200000, count), 2),
+            'email': (name_codes * 10000 + email_numbers) * len(EMAIL_DOMAINS) + domain_codes,
+            'is_subscribed': rng.integers(0, 2, count).astype(bool),
+            'registration_date': registration_start + rng.integers(0, registration_days, count, endpoint=True).astype('timedelta64[D]'),
+            'last_online': ReportGenerator._days_before(today, rng.integers(0, 30, count, endpoint=True)),
+            'total_spent': np.round(rng.uniform(0, 500000, count), 2),
+            'birth_date': ReportGenerator._days_before(today, age * 365),
+            'city': ReportGenerator._codes(rng, CITIES, count),
+            'subscription_type': ReportGenerator._codes(rng, SUBSCRIPTION_TYPES, count),
+            'visits_count': rng.integers(0, 200, count, endpoint=True),
+            'trainer_name': ReportGenerator._codes(rng, USER_TRAINERS, count),
+        }
+
+    @staticmethod
+    def bookings_columns(count=500, seed=None, start=0):
+        """Столбцы тестовых записей (векторный аналог generate_test_bookings)"""
+        rng = np.random.default_rng(seed)
+        today = np.datetime64(generation_anchor(), 'ns')
+
+        booking_date = ReportGenerator._days_before(today, rng.integers(-30, 30, count, endpoint=True))
+        start_time = booking_date + rng.integers(8, 20, count, endpoint=True).astype('timedelta64[h]')
+        duration = rng.choice(np.array([60, 90, 120]), count)
+
+        return {
+            'id': np.arange(start + 1, start + count + 1),
+            'client_name': ReportGenerator._codes(rng, CLIENT_NAMES, count),
+            'service': ReportGenerator._codes(rng, SERVICE_NAMES, count),
+            'trainer': ReportGenerator._codes(rng, BOOKING_TRAINERS, count),
+            'booking_date': booking_date,
+            'start_time': start_time,
+            'end_time': start_time + duration.astype('timedelta64[m]'),
+            'room': ReportGenerator._codes(rng, ROOMS, count),
+            'status': ReportGenerator._codes(rng, BOOKING_STATUSES, count),
+            'price': np.round(rng.uniform(1000, 5000, count), 2),
+            'duration': duration,
+        }
+
+    @staticmethod
+    def subscriptions_columns(count=300, seed=None, start=0):
+        """Столбцы тестовых абонементов (векторный аналог generate_subscriptions_data)"""
+        rng = np.random.default_rng(seed)
+        today = np.datetime64(generation_anchor(), 'ns')
+
+        start_date = ReportGenerator._days_before(today, rng.integers(0, 365, count, endpoint=True))
+        months = rng.choice(np.array([1, 3, 6, 12]), count)
+
+        return {
+            'id': np.arange(start + 1, start + count + 1),
+            'client': ReportGenerator._codes(rng, CLIENT_NAMES, count),
+            'service': ReportGenerator._codes(rng, SERVICE_NAMES, count),
+            'start_date': start_date,
+            'end_date': start_date + (months * 30).astype('timedelta64[D]'),
+            'price_paid': np.round(rng.uniform(3000, 50000, count), 2),
+            'status': ReportGenerator._codes(rng, SUBSCRIPTION_STATUSES, count),
+            'months': months,
+            'visits_left': rng.integers(0, 50, count, endpoint=True),
+        }
+
     @staticmethod
-    def create_report_dataframe(data_type='users', count=1000):
-        """Создает DataFrame с данными"""
+    def raw_columns(data_type, count, seed=None, start=0):
+        """Сырые столбцы набора, приведенные к типам storage_dtypes"""
+        generate = {
+            'users': ReportGenerator.users_columns,
+            'bookings': ReportGenerator.bookings_columns,
+            'subscriptions': ReportGenerator.subscriptions_columns,
+        }[data_type]
+        dtypes = ReportGenerator.storage_dtypes(data_type)
+        return {column: values.astype(dtypes[column], copy=False)
+                for column, values in generate(count, seed, start).items()}
+
+    @staticmethod
+    def storage_dtypes(data_type):
+        """Типы сырых столбцов: int8-коды для категорий, int32-код для email, остальные - по схеме"""
+        dtypes = {}
+        for column, dtype in REPORT_SCHEMAS[data_type].items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                dtypes[column] = np.dtype('int8')
+            elif column == 'email':
+                dtypes[column] = np.dtype('int32')
+            else:
+                dtypes[column] = np.dtype(dtype)
+        return dtypes
+
+    @staticmethod
+    def email_strings(codes):
+        """
+        Коды email в строки. Строки собираются только для встретившихся
+        сочетаний и раскладываются по строкам через индекс
+        """
+        unique_codes, index = np.unique(codes, return_inverse=True)
+        unique_pairs, unique_domains = np.divmod(unique_codes, len(EMAIL_DOMAINS))
+        unique_names, unique_numbers = np.divmod(unique_pairs, 10000)
+        lower_names = [name.lower() for name in USER_NAMES]
+        emails = [
+            f'{lower_names[name]}{number}@{EMAIL_DOMAINS[domain]}'
+            for name, number, domain in zip(unique_names.tolist(), unique_numbers.tolist(), unique_domains.tolist())
+        ]
+        return np.array(emails, dtype=object)[index.reshape(-1)]
+
+    @staticmethod
+    def frame_from_columns(data_type, columns):
+        """DataFrame по схеме из сырых столбцов (массивы используются без копирования)"""
+        data = {}
+        for column, dtype in REPORT_SCHEMAS[data_type].items():
+            values = columns[column]
+            if isinstance(dtype, pd.CategoricalDtype):
+                data[column] = pd.Categorical.from_codes(values, dtype=dtype)
+            elif column == 'email':
+                data[column] = ReportGenerator.email_strings(values)
+            else:
+                data[column] = values
+        return ReportGenerator.apply_schema(pd.DataFrame(data, copy=False), data_type)
+
+    @staticmethod
+    def users_frame(count=100, seed=None):
+        """DataFrame тестовых пользователей"""
+        return ReportGenerator.frame_from_columns('users', ReportGenerator.raw_columns('users', count, seed))
+
+    @staticmethod
+    def bookings_frame(count=500, seed=None):
+        """DataFrame тестовых записей"""
+        return ReportGenerator.frame_from_columns('bookings', ReportGenerator.raw_columns('bookings', count, seed))
+
+    @staticmethod
+    def subscriptions_frame(count=300, seed=None):
+        """DataFrame тестовых абонементов"""
+        return ReportGenerator.frame_from_columns(
+            'subscriptions', ReportGenerator.raw_columns('subscriptions', count, seed)
+        )
+
+    @staticmethod
+    def apply_schema(df, data_type):
+        """Приводит столбцы к REPORT_SCHEMAS (даты преобразуются один раз - здесь)"""
+        schema = REPORT_SCHEMAS[data_type]
+        return df.astype({column: dtype for column, dtype in schema.items() if column in df.columns})
+
+    @staticmethod
+    def memory_report(before, after):
+        """Память по столбцам двух вариантов одного набора: типы, байты и доля after от before"""
+        report = pd.DataFrame({
+            'dtype_before': before.dtypes.astype(str),
+            'dtype_after': after.dtypes.astype(str),
+            'bytes_before': before.memory_usage(deep=True, index=False),
+            'bytes_after': after.memory_usage(deep=True, index=False),
+        })
+        report.loc['ИТОГО'] = ['', '', report['bytes_before'].sum(), report['bytes_after'].sum()]
+        report['ratio'] = (report['bytes_after'] / report['bytes_before']).round(3)
+        return report
+
+    @staticmethod
+    def create_report_dataframe(data_type='users', count=1000, seed=None):
+        """Создает DataFrame с данными (векторная генерация)"""
+        if data_type == 'users':
+            return ReportGenerator.users_frame(count, seed)
+        if data_type == 'bookings':
+            return ReportGenerator.bookings_frame(count, seed)
+        if data_type == 'subscriptions':
+            return ReportGenerator.subscriptions_frame(count, seed)
+        return pd.DataFrame()
+
+    @staticmethod
+    def create_report_dataframe_sharded(data_type='users', count=1000, seed=None, workers=None, shard_rows=None):
+        """
+        Большой набор тестовых данных в нескольких процессах.
+
+        Строки делятся на части по shard_rows (SHARD_ROWS). У каждой части свой
+        поток случайных чисел из SeedSequence(seed).spawn, поэтому результат зависит
+        от seed и shard_rows, но не от числа процессов. Процессы пишут сырые столбцы
+        прямо в блоки общей памяти (по блоку на столбец), DataFrame собирается из
+        них одним копированием - без передачи частей через pickle и pd.concat.
+        """
+        if data_type not in ReportGenerator.DATA_TYPES:
+            return pd.DataFrame()
+        shard_rows = shard_rows or ReportGenerator.SHARD_ROWS
+        starts = list(range(0, count, shard_rows))
+        sizes = [min(shard_rows, count - start) for start in starts]
+        seeds = np.random.SeedSequence(seed).spawn(len(starts))
+        workers = min(workers or os.cpu_count() or 1, len(starts)) or 1
+
+        dtypes = ReportGenerator.storage_dtypes(data_type)
+        blocks = {}
+        try:
+            for column, dtype in dtypes.items():
+                blocks[column] = SharedMemory(create=True, size=max(count * dtype.itemsize, 1))
+            buffers = {column: (blocks[column].name, dtype.str, count) for column, dtype in dtypes.items()}
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker) as pool:
+                list(pool.map(fill_shard, repeat(data_type), seeds, starts, sizes, repeat(buffers)))
+
+            columns = {
+                column: np.ndarray((count,), dtype=dtype, buffer=blocks[column].buf).copy()
+                for column, dtype in dtypes.items()
+            }
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+        return ReportGenerator.frame_from_columns(data_type, columns)
+
+    @staticmethod
+    def create_report_dataframe_rows(data_type='users', count=1000, seed=None):
+        """Прежняя построчная генерация через generate_* без схемы (для сравнения в benchmark_reports)"""
         if data_type == 'users':
-            data = ReportGenerator.generate_test_users(count)
+            data = ReportGenerator.generate_test_users(count, seed)
         elif data_type == 'bookings':
-            data = ReportGenerator.generate_test_bookings(count)
+            data = ReportGenerator.generate_test_bookings(count, seed)
         elif data_type == 'subscriptions':
-            data = ReportGenerator.generate_subscriptions_data(count)
+            data = ReportGenerator.generate_subscriptions_data(count, seed)
         else:
             data = []
 
         return pd.DataFrame(data)
 
     @staticmethod
-    def apply_filters(df, filters):
-        """Применяет фильтры к DataFrame (аналог LINQ-запросов)"""
-        result_df = df.copy()
+    def parse_seed(value):
+        """Seed из формы; пустое или неверное значение - REPORT_DATASET_SEED"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return settings.REPORT_DATASET_SEED
 
-        for field, condition in filters.items():
-            if field in df.columns:
-                try:
-                    if isinstance(condition, dict):
-                        if 'gt' in condition:
-                            result_df = result_df[result_df[field] > condition['gt']]
-                        if 'lt' in condition:
-                            result_df = result_df[result_df[field] < condition['lt']]
-                        if 'gte' in condition:
-                            result_df = result_df[result_df[field] >= condition['gte']]
-                        if 'lte' in condition:
-                            result_df = result_df[result_df[field] <= condition['lte']]
-                        if 'eq' in condition:
-                            result_df = result_df[result_df[field] == condition['eq']]
-                        if 'contains' in condition:
-                            result_df = result_df[result_df[field].str.contains(condition['contains'], na=False)]
-                        if 'between' in condition:
-                            result_df = result_df[
-                                result_df[field].between(condition['between'][0], condition['between'][1])]
-                    else:
-                        result_df = result_df[result_df[field] == condition]
-                except:
-                    pass
-
-        return result_df
+    @staticmethod
+    def get_report_dataframe(data_type='users', count=1000, seed=None):
+        """
+        DataFrame тестовых данных из DatasetCache (создается при первом запросе).
+        Без seed используется REPORT_DATASET_SEED. Наборы от REPORT_SHARD_MIN_ROWS
+        строк генерируются в нескольких процессах. Возвращается неглубокая копия:
+        новые и замененные столбцы не меняют набор в кэше.
+        """
+        if seed is None:
+            seed = settings.REPORT_DATASET_SEED
+        key = (data_type, count, seed, date.today())
+        df = DatasetCache.get(key)
+        if df is None:
+            if count >= settings.REPORT_SHARD_MIN_ROWS:
+                df = ReportGenerator.create_report_dataframe_sharded(data_type, count, seed)
+            else:
+                df = ReportGenerator.create_report_dataframe(data_type, count, seed)
+            DatasetCache.put(key, df)
+        return df.copy(deep=False)
 
     @staticmethod
-    def get_real_data_stats():
-        """Получает реальную статистику из базы данных"""
-        stats = {}
-
-        # Статистика по услугам
-        services = Services.objects.all()
-        active_services = Services.objects.filter(is_active=True)
-        stats['services'] = {
-            'total': services.count(),
-            'active': active_services.count(),
-            'avg_price': active_services.aggregate(avg=models.Avg('price'))['avg'] or 0,
-            'avg_duration': active_services.aggregate(avg=models.Avg('duration'))['avg'] or 0,
-        }
+    def filters_to_spec(filters):
+        """
+        Фильтры вида {поле: значение или {операция: значение}} - в спецификацию
+        FilterEngine (все условия через AND)
+        """
+        conditions = []
+        for field, condition in filters.items():
+            if isinstance(condition, dict):
+                conditions += [{'field': field, 'op': op, 'value': value} for op, value in condition.items()]
+            else:
+                conditions.append({'field': field, 'op': 'eq', 'value': condition})
+        return {'where': {'and': conditions} if conditions else None}
 
-        # Статистика по тренерам
-        trainers = Trainers.objects.all()
-        active_trainers = Trainers.objects.filter(is_active=True)
-        stats['trainers'] = {
-            'total': trainers.count(),
-            'active': active_trainers.count(),
-            'avg_experience': active_trainers.aggregate(avg=models.Avg('experience_years'))['avg'] or 0,
-        }
+    @staticmethod
+    def apply_filters(df, filters):
+        """
+        Применяет фильтры к DataFrame (аналог LINQ-запросов) одной маской.
+        Поля, которых нет в DataFrame, пропускаются; неверные условия
+        поднимают FilterSpecError.
+        """
+        filters = {field: condition for field, condition in filters.items() if field in df.columns}
+        return FilterEngine.apply(df, ReportGenerator.filters_to_spec(filters))
 
-        # Статистика по клиентам
-        clients = Clients.objects.all()
-        clients_with_birthdate = clients.exclude(birth_date__isnull=True)
-        stats['clients'] = {
-            'total': clients.count(),
-            'with_email': clients.exclude(email='').exclude(email__isnull=True).count(),
-            'with_birthdate': clients_with_birthdate.count(),
+    @staticmethod
+    def get_real_data_stats():
+        """Получает реальную статистику из базы данных (через кэш статистики)"""
+        service_stats = DashboardStats.cached('services')
+        trainer_stats = DashboardStats.cached('trainers')
+        client_stats = DashboardStats.cached('clients')
+        subscription_stats = DashboardStats.cached('subscriptions')
+        booking_stats = DashboardStats.cached('bookings')
+
+        stats = {
+            # Статистика по услугам
+            'services': {
+                'total': service_stats['total'],
+                'active': service_stats['active'],
+                'avg_price': service_stats['avg_price'],
+                'avg_duration': service_stats['avg_duration'],
+            },
+            # Статистика по тренерам
+            'trainers': {
+                'total': trainer_stats['total'],
+                'active': trainer_stats['active'],
+                'avg_experience': trainer_stats['avg_experience'],
+            },
+            # Статистика по клиентам
+            'clients': {
+                'total': client_stats['total'],
+                'with_email': client_stats['with_email'],
+                'with_birthdate': client_stats['with_birthdate'],
+                'avg_age': client_stats['avg_age'],
+            },
+            # Статистика по абонементам
+            'subscriptions': {
+                'total': subscription_stats['total'],
+                'active': subscription_stats['active'],
+                'expired': subscription_stats['expired'],
+                'cancelled': subscription_stats['cancelled'],
+                'total_revenue': subscription_stats['total_revenue'],
+                'active_clients': subscription_stats['active_clients'],
+            },
+            # Статистика по записям
+            'bookings': {
+                'total': booking_stats['total'],
+                'today': booking_stats['today'],
+                'scheduled': booking_stats['scheduled'],
+                'completed': booking_stats['completed'],
+                'cancelled': booking_stats['cancelled'],
+                'no_show': booking_stats['no_show'],
+            },
         }
 
-        # Статистика по абонементам
-        subscriptions = Subscriptions.objects.all()
-        stats['subscriptions'] = {
-            'total': subscriptions.count(),
-            'active': subscriptions.filter(status='active').count(),
-            'expired': subscriptions.filter(status='expired').count(),
-            'cancelled': subscriptions.filter(status='cancelled').count(),
-            'total_revenue': subscriptions.aggregate(total=models.Sum('price_paid'))['total'] or 0,
-        }
+        return stats
 
-        # Статистика по записям
-        bookings = Bookings.objects.all()
-        today = datetime.now().date()
-        stats['bookings'] = {
-            'total': bookings.count(),
-            'today': bookings.filter(booking_date=today).count(),
-            'scheduled': bookings.filter(status='scheduled').count(),
-            'completed': bookings.filter(status='completed').count(),
-            'cancelled': bookings.filter(status='cancelled').count(),
-            'no_show': bookings.filter(status='no_show').count(),
-        }
+    @staticmethod
+    def format_column(column):
+        """
+        Столбец для отображения - массив строк, по столбцу целиком: числа с
+        плавающей точкой с двумя знаками, даты без времени, если оно везде 00:00,
+        категории форматируются по справочнику; пропуски - пустая строка
+        """
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            labels = np.append(column.cat.categories.astype(str).to_numpy(dtype=object), '')
+            return labels[column.cat.codes.to_numpy()]
+        values = column.to_numpy()
+        if pd.api.types.is_float_dtype(column):
+            return np.where(np.isnan(values), '', np.char.mod('%.2f', values)).astype(object)
+        if pd.api.types.is_datetime64_any_dtype(column):
+            present = column.dropna()
+            only_dates = (present == present.dt.normalize()).all()
+            text = column.dt.strftime('%Y-%m-%d' if only_dates else '%Y-%m-%d %H:%M:%S')
+            return text.fillna('').to_numpy(dtype=object)
+        if pd.api.types.is_bool_dtype(column):
+            return np.where(values, 'True', 'False').astype(object)
+        return column.astype(str).where(column.notna(), '').to_numpy(dtype=object)
 
-        return stats
+    @staticmethod
+    def format_frame(df):
+        """Новый DataFrame строк для отображения (исходный DataFrame не меняется)"""
+        return pd.DataFrame(
+            {column: ReportGenerator.format_column(df[column]) for column in df.columns},
+            index=df.index,
+        )
 
     @staticmethod
     def dataframe_to_html(df, max_rows=100):
@@ -223,16 +725,11 @@ class ReportGenerator:
         if df.empty:
             return "<p class='text-muted'>Нет данных для отображения</p>"
 
-        # Ограничиваем количество строк
-        display_df = df.head(max_rows)
-
-        # Форматируем числа
-        for col in display_df.select_dtypes(include=['float64']).columns:
-            display_df[col] = display_df[col].map(lambda x: f"{x:.2f}")
+        # Ограничиваем количество строк и форматируем значения столбцами
+        display_df = ReportGenerator.format_frame(df.head(max_rows))
 
-        # Генерируем HTML
+        # Генерируем HTML (значения экранируются: в реальных данных могут быть любые строки)
         return display_df.to_html(
             classes='table table-striped table-hover table-bordered',
-            escape=False,
             index=False
-        )
\ No newline at end of file
+        )
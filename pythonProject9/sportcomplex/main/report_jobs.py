@@ -0,0 +1,200 @@
+# report_jobs.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import ReportJobs
+from .report_filters import STORED_FILTERS, FilterEngine, FilterSpecError
+from .report_generator import ReportGenerator
+from .result_store import ResultStore
+
+logger = logging.getLogger('main.report_jobs')
+
+
+class ReportJobLimitError(Exception):
+    """У пользователя уже REPORT_JOB_MAX_ACTIVE незавершенных заданий"""
+    pass
+
+
+class ReportJobRunner:
+    """
+    Фоновое построение отчетов по тестовым данным.
+
+    Задание записывается в ReportJobs и выполняется в пуле из REPORT_JOB_WORKERS
+    потоков процесса: запрос только ставит задание в очередь и сразу отвечает,
+    а страница опрашивает статус. Генерация и фильтрация идут в numpy/pandas,
+    которые на больших массивах отпускают GIL, поэтому задания из разных
+    потоков выполняются параллельно на разных ядрах.
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def executor():
+        """Пул потоков процесса; при создании в него возвращаются задания, ждущие в очереди"""
+        with ReportJobRunner._lock:
+            created = ReportJobRunner._executor is None
+            if created:
+                ReportJobRunner._executor = ThreadPoolExecutor(
+                    max_workers=settings.REPORT_JOB_WORKERS, thread_name_prefix='report-job'
+                )
+        if created:
+            ReportJobRunner.recover(ReportJobRunner._executor)
+        return ReportJobRunner._executor
+
+    @staticmethod
+    def recover(executor):
+        """
+        Ставит в пул задания в статусе queued: после перезапуска процесса они
+        остались только в таблице. Задание, которое уже стоит в пуле другого
+        процесса, выполнится один раз - его забирает первый исполнитель (см. run)
+        """
+        ReportJobRunner.expire_stale()
+        job_ids = list(ReportJobs.objects.filter(status='queued').order_by('pk').values_list('pk', flat=True))
+        for job_id in job_ids:
+            executor.submit(ReportJobRunner.work, job_id)
+        return len(job_ids)
+
+    @staticmethod
+    def max_rows():
+        """Наибольшее количество строк в задании (REPORT_MAX_ROWS)"""
+        return settings.REPORT_MAX_ROWS
+
+    @staticmethod
+    def params(data):
+        """
+        Параметры задания из формы: (тип данных, количество, seed, фильтр; предупреждение).
+        Количество больше REPORT_MAX_ROWS ограничивается, и тогда возвращается
+        предупреждение для пользователя, иначе None
+        """
+        data_type = data.get('data_type', 'users')
+        if data_type not in ReportGenerator.DATA_TYPES:
+            data_type = 'users'
+        notice = None
+        try:
+            requested = int(data.get('count', 1000))
+        except (TypeError, ValueError):
+            requested = 1000
+        count = min(max(requested, 1), ReportJobRunner.max_rows())
+        if count < requested:
+            notice = f'Запрошено строк: {requested}, отчет строится по {count} (больше не поддерживается)'
+        return {
+            'data_type': data_type,
+            'count': count,
+            'seed': ReportGenerator.parse_seed(data.get('seed')),
+            'filter_type': str(data.get('filter_type') or '')[:10],
+        }, notice
+
+    @staticmethod
+    def expire_stale():
+        """
+        Задания, которые ждут в очереди или выполняются дольше REPORT_JOB_TIMEOUT,
+        - ошибка (например, процесс перезапустили во время выполнения). Очередь
+        считается от создания задания, выполнение - от его начала. Заодно удаляются
+        давно завершенные задания (purge_finished). Возвращает число прерванных
+        """
+        deadline = timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+        expired = ReportJobs.objects.filter(
+            Q(status='queued', created_at__lt=deadline) | Q(status='running', started_at__lt=deadline)
+        ).update(status='failed', message='Задание прервано', finished_at=timezone.now())
+        ReportJobRunner.purge_finished()
+        return expired
+
+    @staticmethod
+    def purge_finished(batch_size=500):
+        """
+        Удаляет до batch_size заданий, завершенных раньше REPORT_RESULTS_TTL назад:
+        их результат уже устарел. Файлы результатов удаляет сигнал post_delete.
+        Возвращает число удаленных заданий
+        """
+        deadline = timezone.now() - timedelta(seconds=settings.REPORT_RESULTS_TTL)
+        job_ids = list(
+            ReportJobs.objects.filter(status__in=['done', 'failed'], finished_at__lt=deadline)
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not job_ids:
+            return 0
+        return ReportJobs.objects.filter(pk__in=job_ids).delete()[0]
+
+    @staticmethod
+    def submit(user, data_type='users', count=1000, seed=None, filter_type=''):
+        """Создает задание и ставит его в пул после фиксации транзакции"""
+        ReportJobRunner.expire_stale()
+        active = ReportJobs.objects.filter(user=user, status__in=['queued', 'running']).count()
+        if active >= settings.REPORT_JOB_MAX_ACTIVE:
+            raise ReportJobLimitError(f'Уже выполняется отчетов: {active}. Дождитесь их завершения')
+
+        if seed is None:
+            seed = settings.REPORT_DATASET_SEED
+        job = ReportJobs.objects.create(
+            user=user, data_type=data_type, count=count, seed=seed, filter_type=filter_type
+        )
+        transaction.on_commit(lambda: ReportJobRunner.executor().submit(ReportJobRunner.work, job.pk))
+        return job
+
+    @staticmethod
+    def work(job_id):
+        """Точка входа потока пула: у потока свое соединение с БД, оно закрывается после задания"""
+        try:
+            ReportJobRunner.run(job_id)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def update(job_id, **fields):
+        """
+        Обновляет выполняемое задание. Если его уже признали прерванным
+        (expire_stale), статус не меняется и возвращается False
+        """
+        return bool(ReportJobs.objects.filter(pk=job_id, status='running').update(**fields))
+
+    @staticmethod
+    def run(job_id):
+        """Выполняет задание: генерация (или кэш), фильтр, сохранение результата в ResultStore"""
+        # Задание забирает только один исполнитель: queued -> running одним UPDATE
+        claimed = ReportJobs.objects.filter(pk=job_id, status='queued').update(
+            status='running', progress=5, message='Генерация данных', started_at=timezone.now()
+        )
+        if not claimed:
+            return
+        job = ReportJobs.objects.get(pk=job_id)
+
+        try:
+            df = ReportGenerator.get_report_dataframe(job.data_type, job.count, job.seed)
+            ReportJobRunner.update(job_id, progress=50, message='Фильтрация')
+
+            spec = STORED_FILTERS.get(job.filter_type)
+            if spec is None:
+                df_filtered = df.head(100)
+                filter_name = 'Первые 100 записей'
+            else:
+                df_filtered = FilterEngine.apply(df, spec)
+                filter_name = spec['name']
+            ReportJobRunner.update(job_id, progress=80, message='Сохранение результата')
+
+            token = ResultStore.save(df_filtered, name=filter_name)
+        except FilterSpecError as e:
+            ReportJobRunner.update(
+                job_id, status='failed', message=f'Фильтр не подходит к данным: {e}'[:255],
+                finished_at=timezone.now()
+            )
+        except Exception:
+            # Ошибка не должна оставить задание "выполняется" навсегда
+            logger.exception('Отчет #%s завершился с ошибкой', job_id)
+            ReportJobRunner.update(
+                job_id, status='failed', message='Не удалось построить отчет', finished_at=timezone.now()
+            )
+        else:
+            finished = ReportJobRunner.update(
+                job_id, status='done', progress=100, message='', result_token=token,
+                filter_name=filter_name, filtered_count=len(df_filtered), total_count=len(df),
+                finished_at=timezone.now()
+            )
+            if not finished:
+                # Задание прервано по таймауту: результат никому не достанется
+                ResultStore.delete(token)
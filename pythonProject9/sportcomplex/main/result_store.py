@@ -0,0 +1,162 @@
+# result_store.py
+import itertools
+import json
+import os
+import re
+import secrets
+import stat
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+
+class ResultStore:
+    """
+    Результаты фильтрации отчетов на локальном диске.
+
+    Каждый результат - файл .npz в REPORT_RESULTS_DIR под случайным токеном:
+    столбцы DataFrame массивами numpy и описание (схема столбцов, name и т.п.)
+    в JSON. Файл читается без pickle, поэтому подложенный файл не может
+    выполнить код. Каталог доступен только владельцу процесса. В сессии
+    хранится только токен. Файлы старше REPORT_RESULTS_TTL секунд считаются
+    устаревшими и удаляются при следующем сохранении.
+    """
+
+    @staticmethod
+    def directory():
+        """Каталог результатов; создается с правами 0700, чужой или открытый каталог - ошибка"""
+        path = Path(settings.REPORT_RESULTS_DIR)
+        if not path.is_dir():
+            path.mkdir(mode=0o700, parents=True, exist_ok=True)
+            os.chmod(path, 0o700)
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode):
+            raise ImproperlyConfigured(f'REPORT_RESULTS_DIR не каталог: {path}')
+        # На Windows владельца и режим так не проверить
+        if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+            raise ImproperlyConfigured(f'REPORT_RESULTS_DIR должен принадлежать процессу и иметь права 0700: {path}')
+        return path
+
+    @staticmethod
+    def path(token):
+        if not token or not TOKEN_RE.match(token):
+            return None
+        return ResultStore.directory() / f'{token}.npz'
+
+    @staticmethod
+    def pack(df):
+        """Столбцы DataFrame массивами numpy (без object) и схема для восстановления типов"""
+        arrays, columns = {}, []
+        for i, name in enumerate(df.columns):
+            column = df[name]
+            dtype = column.dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                arrays[f'c{i}'] = column.cat.codes.to_numpy()
+                arrays[f'c{i}_categories'] = np.asarray(dtype.categories.astype(str), dtype=str)
+                kind = 'category' if not dtype.ordered else 'ordered_category'
+            elif isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+                arrays[f'c{i}'] = column.to_numpy()
+                kind = 'array'
+            else:
+                # Строки и прочее: текст и маска пропусков
+                missing = column.isna().to_numpy()
+                arrays[f'c{i}'] = np.where(missing, '', column.astype(str).to_numpy()).astype(str)
+                arrays[f'c{i}_missing'] = missing
+                kind = 'text'
+            columns.append({'name': str(name), 'kind': kind, 'dtype': str(dtype)})
+        arrays['index'] = df.index.to_numpy() if df.index.dtype.kind in 'iu' else np.arange(len(df))
+        return arrays, columns
+
+    @staticmethod
+    def unpack(arrays, columns):
+        data = {}
+        for i, column in enumerate(columns):
+            values = arrays[f'c{i}']
+            if column['kind'] in ('category', 'ordered_category'):
+                data[column['name']] = pd.Categorical.from_codes(
+                    values, categories=arrays[f'c{i}_categories'], ordered=column['kind'] == 'ordered_category'
+                )
+            elif column['kind'] == 'array':
+                data[column['name']] = values
+            else:
+                series = pd.Series(values, dtype=object).where(~arrays[f'c{i}_missing'], None)
+                data[column['name']] = series.astype(column['dtype']).to_numpy()
+        return pd.DataFrame(data, index=arrays['index'])
+
+    @staticmethod
+    def save(df, **meta):
+        """Сохраняет DataFrame с описанием (name и т.п.), возвращает токен"""
+        ResultStore.purge_expired()
+        token = secrets.token_urlsafe(16)
+        path = ResultStore.path(token)
+        arrays, columns = ResultStore.pack(df)
+        header = json.dumps({'meta': meta, 'columns': columns}, ensure_ascii=False)
+        # Запись во временный файл и переименование: читатель не увидит недописанный файл
+        tmp_path = path.with_suffix('.tmp')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o600)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, header=np.array(header), **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return token
+
+    @staticmethod
+    def load(token):
+        """{'meta': ..., 'df': DataFrame} или None, если токена нет или срок истек"""
+        path = ResultStore.path(token)
+        if path is None:
+            return None
+        try:
+            if time.time() - path.stat().st_mtime > settings.REPORT_RESULTS_TTL:
+                path.unlink(missing_ok=True)
+                return None
+            with np.load(path, allow_pickle=False) as archive:
+                header = json.loads(str(archive['header']))
+                df = ResultStore.unpack(archive, header['columns'])
+            return {'meta': header['meta'], 'df': df}
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def exists(token):
+        """Есть ли действующий результат (без чтения файла)"""
+        path = ResultStore.path(token)
+        if path is None:
+            return False
+        try:
+            return time.time() - path.stat().st_mtime <= settings.REPORT_RESULTS_TTL
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def delete(token):
+        path = ResultStore.path(token)
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+    @staticmethod
+    def purge_expired():
+        """
+        Удаляет устаревшие результаты и временные файлы записи, оставшиеся после
+        падения процесса (старше того же срока: свежий .tmp может еще писаться).
+        Возвращает число удаленных файлов
+        """
+        deadline = time.time() - settings.REPORT_RESULTS_TTL
+        removed = 0
+        directory = ResultStore.directory()
+        for path in itertools.chain(directory.glob('*.npz'), directory.glob('*.tmp')):
+            try:
+                if path.stat().st_mtime < deadline:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
@@ -0,0 +1,96 @@
+# result_table.py
+import numpy as np
+import pandas as pd
+from .report_generator import DatasetCache, ReportGenerator
+from .result_store import ResultStore
+
+
+class ResultTableError(ValueError):
+    """Неверные параметры страницы результата (столбец сортировки и т.п.)"""
+    pass
+
+
+class ResultTable:
+    """
+    Постраничный просмотр сохраненного результата отчета (ResultStore).
+
+    Результат загружается с диска один раз и держится в DatasetCache вместе
+    с порядком строк для каждой сортировки, поэтому запрос страницы - это
+    выборка per_page позиций и форматирование только этих строк.
+    """
+
+    PER_PAGE = 50
+    MAX_PER_PAGE = 500
+
+    @staticmethod
+    def frame(token):
+        """DataFrame результата по токену или None (нет или срок истек)"""
+        # Удаленный или устаревший результат не отдается и из кэша
+        if not ResultStore.exists(token):
+            return None
+        key = ('result', token)
+        df = DatasetCache.get(key)
+        if df is None:
+            result = ResultStore.load(token)
+            if result is None:
+                return None
+            df = result['df']
+            DatasetCache.put(key, df)
+        return df
+
+    @staticmethod
+    def sort_keys(column):
+        """Ключи сортировки: категории - по алфавиту значений, а не по порядку справочника"""
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            ranks = np.argsort(np.argsort(column.cat.categories.astype(str).to_numpy()))
+            codes = column.cat.codes.to_numpy()
+            return pd.Series(np.where(codes >= 0, ranks[codes], np.nan))
+        return pd.Series(column.to_numpy())
+
+    @staticmethod
+    def order(token, df, sort, descending):
+        """Позиции строк в порядке сортировки (устойчивой, пропуски в конце)"""
+        key = ('result_order', token, sort, descending)
+        cached = DatasetCache.get(key)
+        if cached is None:
+            keys = ResultTable.sort_keys(df[sort])
+            positions = keys.sort_values(ascending=not descending, kind='stable', na_position='last').index
+            cached = pd.DataFrame({'position': positions.to_numpy()})
+            DatasetCache.put(key, cached)
+        return cached['position'].to_numpy()
+
+    @staticmethod
+    def page(df, token, page=1, per_page=None, sort=None, descending=False):
+        """
+        Страница результата для JSON: столбцы, строки (уже отформатированные),
+        номер и число страниц. Номер страницы вне диапазона приводится к границам
+        """
+        if sort and sort not in df.columns:
+            raise ResultTableError(f'Нет столбца {sort}')
+        try:
+            per_page = min(max(int(per_page or ResultTable.PER_PAGE), 1), ResultTable.MAX_PER_PAGE)
+            page = int(page or 1)
+        except (TypeError, ValueError) as e:
+            raise ResultTableError('Неверный номер или размер страницы') from e
+
+        total = len(df)
+        num_pages = max((total + per_page - 1) // per_page, 1)
+        page = min(max(page, 1), num_pages)
+        start = (page - 1) * per_page
+
+        if sort:
+            positions = ResultTable.order(token, df, sort, descending)[start:start + per_page]
+        else:
+            positions = np.arange(start, min(start + per_page, total))
+        rows = ReportGenerator.format_frame(df.iloc[positions])
+
+        return {
+            'columns': [str(column) for column in df.columns],
+            'rows': rows.to_numpy().tolist(),
+            'page': page,
+            'num_pages': num_pages,
+            'per_page': per_page,
+            'total': total,
+            'sort': sort or '',
+            'order': 'desc' if descending else 'asc',
+        }
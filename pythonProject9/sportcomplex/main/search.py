@@ -0,0 +1,168 @@
+# search.py
+import re
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Clients, ClientSearchTokens, Services
+
+# Транслитерация кириллицы: "Иванов" и "ivanov" дают один и тот же токен
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+}
+TOKEN_MAX_LENGTH = ClientSearchTokens._meta.get_field('token').max_length
+
+
+def prefix_range(field, value):
+    """
+    Строки field, начинающиеся с value. Диапазон field >= value AND field < value + U+FFFF
+    читается по индексу на field; LIKE 'value%' (startswith, istartswith) индекс
+    не использует ни в SQLite (ESCAPE, UPPER), ни в MySQL (LIKE BINARY)
+    """
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + '\uffff'})
+
+
+def transliterate(text):
+    return ''.join(TRANSLIT.get(char, char) for char in text.lower())
+
+
+def name_tokens(text):
+    """Части имени в нижнем регистре и латинице ("Анна-Мария" -> anna, mariya)"""
+    return [transliterate(word) for word in re.findall(r'\w+', text or '') if word]
+
+
+def phone_tokens(phone):
+    """Телефон только из цифр: полный номер (8 в начале -> 7) и номер без кода страны"""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    tokens = [digits] if digits else []
+    if len(digits) == 11:
+        tokens.append(digits[1:])
+    return tokens
+
+
+def client_tokens(first_name, last_name, phone, email):
+    """
+    Токены поиска клиента: [(token, kind), ...] без повторов. Телефон хранится
+    еще и задом наперед (phone_rev): поиск по последним цифрам номера - это
+    поиск по префиксу перевернутого токена
+    """
+    tokens = [(token, 'name') for token in name_tokens(first_name) + name_tokens(last_name)]
+    phones = phone_tokens(phone)
+    tokens += [(token, 'phone') for token in phones]
+    tokens += [(token[::-1], 'phone_rev') for token in phones[:1]]
+    if email:
+        tokens.append((email.strip().lower(), 'email'))
+    return list(dict.fromkeys((token[:TOKEN_MAX_LENGTH], kind) for token, kind in tokens))
+
+
+class ClientSearch:
+    """Индекс поиска клиентов по префиксам нормализованных токенов"""
+
+    @staticmethod
+    def query_words(query):
+        """
+        Слова запроса в том же виде, что и токены: [[вариант, ...], ...].
+        Номер телефона можно вводить с пробелами и скобками: если в запросе есть
+        цифры и нет букв, это одно слово; ведущая 8 может быть и кодом страны (7).
+        """
+        if re.search(r'\d', query) and not re.search(r'[^\W\d_]', query):
+            digits = re.sub(r'\D', '', query)
+            variants = [digits, '7' + digits[1:]] if digits.startswith('8') else [digits]
+            return [variants]
+        words = []
+        for word in query.split():
+            if '@' in word:
+                words.append(word.lower())
+            else:
+                words += name_tokens(word)
+        return [[word] for word in dict.fromkeys(words)]
+
+    @staticmethod
+    def build_tokens(clients):
+        return [
+            ClientSearchTokens(client_id=client.pk, token=token, kind=kind)
+            for client in clients
+            for token, kind in client_tokens(client.first_name, client.last_name, client.phone, client.email)
+        ]
+
+    @staticmethod
+    def index_client(client):
+        """Пересоздает токены одного клиента (вызывается при сохранении)"""
+        with transaction.atomic():
+            ClientSearchTokens.objects.filter(client_id=client.pk).delete()
+            ClientSearchTokens.objects.bulk_create(ClientSearch.build_tokens([client]))
+
+    @staticmethod
+    def rebuild(batch_size=1000, stdout=None):
+        """Пересоздает весь индекс пачками по batch_size клиентов"""
+        ClientSearchTokens.objects.all().delete()
+        total = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Clients.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('first_name', 'last_name', 'phone', 'email')[:batch_size]
+            )
+            if not batch:
+                break
+            ClientSearchTokens.objects.bulk_create(ClientSearch.build_tokens(batch), batch_size=batch_size)
+            total += len(batch)
+            last_pk = batch[-1].pk
+            if stdout:
+                stdout.write(f'Проиндексировано клиентов: {total}')
+        return total
+
+    @staticmethod
+    def filter(queryset, query):
+        """
+        Клиенты, у которых каждое слово запроса - префикс одного из токенов
+        (цифры - еще и окончание телефона). Добавляет search_rank - число слов,
+        совпавших с токеном целиком (полное совпадение фамилии или телефона
+        выше частичного).
+        """
+        words = ClientSearch.query_words(query)
+        if not words:
+            return queryset.none()
+
+        for variants in words:
+            prefix = Q()
+            for variant in variants:
+                prefix |= prefix_range('token', variant) & ~Q(kind='phone_rev')
+            if variants[0].isdigit():
+                prefix |= prefix_range('token', variants[0][::-1]) & Q(kind='phone_rev')
+            queryset = queryset.filter(pk__in=ClientSearchTokens.objects.filter(prefix).values('client_id'))
+
+        exact_matches = (
+            ClientSearchTokens.objects.filter(
+                client=OuterRef('pk'), token__in=[variant for variants in words for variant in variants]
+            )
+            .exclude(kind='phone_rev')
+            .values('client')
+            .annotate(matches=Count('pk'))
+            .values('matches')
+        )
+        return queryset.annotate(
+            search_rank=Coalesce(Subquery(exact_matches, output_field=IntegerField()), Value(0))
+        )
+
+
+class ServiceSearch:
+    """Поиск услуг по началу названия (индекс services_name_idx)"""
+
+    @staticmethod
+    def filter(queryset, query):
+        """
+        Услуги, название которых начинается с query. Названия пишутся с заглавной
+        буквы, поэтому "йога" ищется и как "Йога"; в MySQL сравнение по умолчанию
+        и так без учета регистра
+        """
+        variants = dict.fromkeys([query, query[:1].upper() + query[1:]])
+        condition = Q()
+        for variant in variants:
+            condition |= prefix_range('service_name', variant)
+        return queryset.filter(condition)
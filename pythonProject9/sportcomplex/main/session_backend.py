@@ -0,0 +1,50 @@
+# session_backend.py
+import time
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.utils import timezone
+
+
+class SessionStore(CachedDBStore):
+    """
+    Сессии в кэше с записью в БД (cached_db), без сохранения на каждый запрос.
+
+    Сессия пишется в django_session, только если ее данные изменились или
+    срок действия не продлевался дольше SESSION_REFRESH_MINUTES: тогда срок
+    сдвигается на SESSION_COOKIE_AGE, как при SESSION_SAVE_EVERY_REQUEST,
+    но не чаще одного раза за период.
+    """
+
+    REFRESHED_KEY = '_session_refreshed_at'
+
+    def load(self):
+        data = super().load()
+        refreshed_at = data.get(self.REFRESHED_KEY)
+        if data and (refreshed_at is None or time.time() - refreshed_at > settings.SESSION_REFRESH_MINUTES * 60):
+            # Срок пора продлить: SessionMiddleware сохранит сессию и обновит cookie
+            self.modified = True
+        return data
+
+    def save(self, must_create=False):
+        self._get_session(no_load=must_create)[self.REFRESHED_KEY] = int(time.time())
+        super().save(must_create)
+
+    @classmethod
+    def clear_expired(cls, batch_size=1000):
+        """
+        Удаляет просроченные сессии пачками по batch_size строк,
+        чтобы не держать долгую блокировку таблицы одним DELETE.
+        """
+        model = cls.get_model_class()
+        now = timezone.now()
+        total = 0
+        while True:
+            keys = list(
+                model.objects.filter(expire_date__lt=now)
+                .order_by('expire_date')
+                .values_list('session_key', flat=True)[:batch_size]
+            )
+            if not keys:
+                return total
+            model.objects.filter(session_key__in=keys).delete()
+            total += len(keys)
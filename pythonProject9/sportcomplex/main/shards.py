@@ -0,0 +1,32 @@
+# shards.py
+# Процессы пула для create_report_dataframe_sharded. Модуль не импортирует
+# Django на уровне модуля: при запуске процессов через spawn/forkserver он
+# загружается до django.setup(), который выполняет setup_worker
+from multiprocessing.shared_memory import SharedMemory
+import django
+import numpy as np
+
+
+def setup_worker():
+    """Инициализатор процесса пула: приложения Django (модели нужны report_generator)"""
+    django.setup()
+
+
+def fill_shard(data_type, seed, start, count, buffers):
+    """
+    Генерирует строки [start, start + count) и пишет каждый столбец в свой
+    блок общей памяти: buffers = {столбец: (имя блока, тип, всего строк)}
+    """
+    from .report_generator import ReportGenerator
+
+    columns = ReportGenerator.raw_columns(data_type, count, seed, start)
+    for column, (name, dtype, total) in buffers.items():
+        # Процессы пула используют resource_tracker родителя: блок удаляет только родитель
+        block = SharedMemory(name=name)
+        try:
+            target = np.ndarray((total,), dtype=dtype, buffer=block.buf)
+            target[start:start + count] = columns[column]
+            del target
+        finally:
+            block.close()
+    return count
@@ -0,0 +1,81 @@
+# signals.py
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Clients, Trainers, Services, Subscriptions, Bookings, ReportJobs
+from .stats import DashboardStats
+from .metrics import MetricsRollup, RevenueSeries
+from .search import ClientSearch
+from .result_store import ResultStore
+
+
+# ============== СБРОС КЭША СТАТИСТИКИ ==============
+@receiver(post_save, sender=Clients)
+@receiver(post_save, sender=Trainers)
+@receiver(post_save, sender=Services)
+@receiver(post_save, sender=Subscriptions)
+@receiver(post_save, sender=Bookings)
+@receiver(post_delete, sender=Clients)
+@receiver(post_delete, sender=Trainers)
+@receiver(post_delete, sender=Services)
+@receiver(post_delete, sender=Subscriptions)
+@receiver(post_delete, sender=Bookings)
+def invalidate_dashboard_stats(sender, **kwargs):
+    """Любое изменение строки сбрасывает зависящие от таблицы разделы статистики"""
+    # После коммита: иначе параллельный запрос успеет закэшировать старые данные
+    transaction.on_commit(lambda: DashboardStats.invalidate(sender))
+
+
+# ============== ДНЕВНЫЕ ИТОГИ ==============
+def schedule_metrics_refresh(days, source):
+    """Пересчитывает итоги затронутых дней после коммита транзакции"""
+    days = [day for day in days if day]
+    if days:
+        transaction.on_commit(lambda: MetricsRollup.refresh_days(days, (source,)))
+
+
+@receiver(post_save, sender=Clients)
+@receiver(post_delete, sender=Clients)
+def refresh_client_metrics(sender, instance, **kwargs):
+    schedule_metrics_refresh([timezone.localdate(instance.created_at)], 'clients')
+
+
+@receiver(post_save, sender=Subscriptions)
+@receiver(post_delete, sender=Subscriptions)
+def refresh_subscription_metrics(sender, instance, **kwargs):
+    day = timezone.localdate(instance.created_at)
+    schedule_metrics_refresh([day], 'subscriptions')
+    transaction.on_commit(lambda: RevenueSeries.invalidate(day))
+
+
+@receiver(pre_save, sender=Bookings)
+def remember_booking_day(sender, instance, **kwargs):
+    """Запоминаем прежнюю дату занятия: при переносе нужно пересчитать оба дня"""
+    instance._metrics_previous_day = None
+    if instance.pk:
+        instance._metrics_previous_day = (
+            Bookings.objects.filter(pk=instance.pk).values_list('booking_date', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Bookings)
+@receiver(post_delete, sender=Bookings)
+def refresh_booking_metrics(sender, instance, **kwargs):
+    previous_day = getattr(instance, '_metrics_previous_day', None)
+    schedule_metrics_refresh({instance.booking_date, previous_day}, 'bookings')
+
+
+# ============== ПОИСК КЛИЕНТОВ ==============
+@receiver(post_save, sender=Clients)
+def index_client_search(sender, instance, **kwargs):
+    """Токены поиска обновляются в той же транзакции, что и клиент"""
+    ClientSearch.index_client(instance)
+
+
+# ============== ФОНОВЫЕ ОТЧЕТЫ ==============
+@receiver(post_delete, sender=ReportJobs)
+def delete_report_job_result(sender, instance, **kwargs):
+    """Файл результата удаляется вместе с заданием (после коммита удаления)"""
+    if instance.result_token:
+        transaction.on_commit(lambda: ResultStore.delete(instance.result_token))
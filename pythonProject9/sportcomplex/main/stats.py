@@ -0,0 +1,182 @@
+# stats.py
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Sum, Q, Case, When, Value, IntegerField, FloatField
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from .models import Clients, Trainers, Services, Subscriptions, Bookings
+
+
+class DashboardStats:
+    """
+    Сводная статистика для главной страницы, списков и отчетов.
+
+    Каждый раздел считается одним агрегирующим запросом (плюс небольшие топ-списки)
+    и хранится в кэше Django. Раздел сбрасывается сигналами post_save/post_delete
+    моделей, от которых он зависит (см. DEPENDENCIES и signals.py).
+    """
+
+    CACHE_PREFIX = 'dashboard_stats'
+
+    # Раздел статистики -> модели, изменение которых его сбрасывает
+    DEPENDENCIES = {
+        'clients': (Clients,),
+        'trainers': (Trainers,),
+        'services': (Services,),
+        'subscriptions': (Subscriptions,),
+        'bookings': (Bookings,),
+        'popular_services': (Services, Subscriptions),
+        'popular_services_booking': (Services, Bookings),
+    }
+
+    # ============== КЭШ ==============
+    @staticmethod
+    def cache_key(section, today):
+        # Дата в ключе: разделы с "сегодня" и возрастом сами обновляются в полночь
+        return f'{DashboardStats.CACHE_PREFIX}:{section}:{today.isoformat()}'
+
+    @staticmethod
+    def cached(section, today=None):
+        """Возвращает раздел статистики из кэша, вычисляя его при промахе"""
+        today = today or date.today()
+        compute = getattr(DashboardStats, section)
+        return cache.get_or_set(
+            DashboardStats.cache_key(section, today),
+            lambda: compute(today),
+            settings.STATS_CACHE_TIMEOUT
+        )
+
+    @staticmethod
+    def invalidate(model, today=None):
+        """Сбрасывает разделы, зависящие от модели"""
+        today = today or date.today()
+        keys = [
+            DashboardStats.cache_key(section, today)
+            for section, models in DashboardStats.DEPENDENCIES.items()
+            if model in models
+        ]
+        cache.delete_many(keys)
+
+    # ============== РАЗДЕЛЫ ==============
+    @staticmethod
+    def age_expression(today=None):
+        """SQL-выражение возраста клиента в полных годах на дату today"""
+        today = today or date.today()
+
+        # 1, если день рождения в этом году еще не наступил
+        birthday_ahead = Case(
+            When(
+                Q(birth_date__month__gt=today.month) |
+                Q(birth_date__month=today.month, birth_date__day__gt=today.day),
+                then=Value(1)
+            ),
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        return Value(today.year) - ExtractYear('birth_date') - birthday_ahead
+
+    @staticmethod
+    def clients(today=None):
+        """Количество клиентов, заполненность email, средний возраст и новые за неделю"""
+        with_email = Q(email__isnull=False) & ~Q(email='')
+        with_birthdate = Q(birth_date__isnull=False)
+        week_ago = timezone.now() - timedelta(days=7)
+
+        stats = Clients.objects.aggregate(
+            total=Count('pk'),
+            with_email=Count('pk', filter=with_email),
+            with_birthdate=Count('pk', filter=with_birthdate),
+            avg_age=Avg(DashboardStats.age_expression(today), filter=with_birthdate, output_field=FloatField()),
+            new_week=Count('pk', filter=Q(created_at__gte=week_ago)),
+        )
+
+        stats['email_percentage'] = round(stats['with_email'] / stats['total'] * 100, 1) if stats['total'] else 0
+        stats['avg_age'] = round(stats['avg_age'], 1) if stats['avg_age'] is not None else 0
+        return stats
+
+    @staticmethod
+    def trainers(today=None):
+        """Количество тренеров, средний стаж активных и специализации"""
+        week_ago = timezone.now() - timedelta(days=7)
+
+        stats = Trainers.objects.aggregate(
+            total=Count('pk'),
+            active=Count('pk', filter=Q(is_active=True)),
+            avg_experience=Avg('experience_years', filter=Q(is_active=True)),
+            new_week=Count('pk', filter=Q(created_at__gte=week_ago)),
+        )
+        stats['avg_experience'] = stats['avg_experience'] or 0
+        stats['specializations'] = list(Trainers.objects.values('specialization').annotate(
+            count=Count('specialization')
+        ).order_by('-count'))
+        return stats
+
+    @staticmethod
+    def services(today=None):
+        """Количество услуг, средняя цена и длительность активных, ценовой диапазон"""
+        week_ago = timezone.now() - timedelta(days=7)
+        active_services = Services.objects.filter(is_active=True)
+
+        stats = Services.objects.aggregate(
+            total=Count('pk'),
+            active=Count('pk', filter=Q(is_active=True)),
+            avg_price=Avg('price', filter=Q(is_active=True)),
+            avg_duration=Avg('duration', filter=Q(is_active=True)),
+            new_week=Count('pk', filter=Q(created_at__gte=week_ago)),
+        )
+        stats['avg_price'] = stats['avg_price'] or 0
+        stats['avg_duration'] = stats['avg_duration'] or 0
+        stats['most_expensive'] = active_services.order_by('-price').first()
+        stats['cheapest'] = active_services.order_by('price').first()
+        return stats
+
+    @staticmethod
+    def subscriptions(today=None):
+        """Количество абонементов по статусам, клиентов с действующим абонементом и общая выручка"""
+        stats = Subscriptions.objects.aggregate(
+            total=Count('pk'),
+            active=Count('pk', filter=Q(status='active')),
+            active_clients=Count('client', filter=Subscriptions.active_q(today), distinct=True),
+            expired=Count('pk', filter=Q(status='expired')),
+            cancelled=Count('pk', filter=Q(status='cancelled')),
+            total_revenue=Sum('price_paid'),
+        )
+        stats['total_revenue'] = stats['total_revenue'] or 0
+        return stats
+
+    @staticmethod
+    def bookings(today=None):
+        """Количество записей по статусам, на ближайшие дни и по залам"""
+        today = today or date.today()
+        scheduled = Q(status='scheduled')
+
+        stats = Bookings.objects.aggregate(
+            total=Count('pk'),
+            scheduled=Count('pk', filter=scheduled),
+            completed=Count('pk', filter=Q(status='completed')),
+            cancelled=Count('pk', filter=Q(status='cancelled')),
+            no_show=Count('pk', filter=Q(status='no_show')),
+            today=Count('pk', filter=Q(booking_date=today)),
+            tomorrow=Count('pk', filter=Q(booking_date=today + timedelta(days=1))),
+            today_scheduled=Count('pk', filter=scheduled & Q(booking_date=today)),
+            upcoming_scheduled=Count('pk', filter=scheduled & Q(booking_date__gte=today)),
+        )
+        stats['rooms'] = list(Bookings.objects.values('room').annotate(
+            count=Count('room')
+        ).order_by('-count'))
+        return stats
+
+    @staticmethod
+    def popular_services(today=None):
+        """Топ-3 услуг по количеству абонементов"""
+        return list(Services.objects.annotate(
+            sub_count=Count('subscriptions')
+        ).order_by('-sub_count')[:3])
+
+    @staticmethod
+    def popular_services_booking(today=None):
+        """Топ-3 услуг по количеству записей на занятия"""
+        return list(Services.objects.annotate(
+            booking_count=Count('bookings')
+        ).order_by('-booking_count')[:3])
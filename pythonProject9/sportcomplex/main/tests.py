@@ -1,3 +1,1947 @@
-from django.test import TestCase
+import importlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.apps import apps as django_apps
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .booking_service import BookingService, BookingConflictError
+from .forms import BookingForm
+from .metrics import MetricsRollup, PeriodComparison, RevenueSeries
+from .middleware import RequestStats
+from .pagination import KeysetPaginator
+from .report_generator import REPORT_SCHEMAS, BaselineSnapshot, ReportGenerator, DatasetCache
+from .result_store import ResultStore
+from .result_table import ResultTable
+from .exports import TableExport
+from .report_filters import STORED_FILTERS, DB_FILTERS, FilterEngine, FilterSpecError, QueryFilter, years_ago
+from .report_jobs import ReportJobRunner
+from .search import ClientSearch, ServiceSearch
+from .session_backend import SessionStore
+from .models import Users, Clients, Trainers, Services, Subscriptions, Bookings, DailyMetrics, ClientSearchTokens, \
+    ReportJobs, ReportBaselines, BookingLocks
+
+
+# ============== ПОТОКИ ==============
+class FileDatabaseTestCase(TransactionTestCase):
+    """
+    Тесты с несколькими потоками. Тестовая SQLite в памяти (по умолчанию) не
+    подходит: потоки делят ее в режиме shared cache и получают "table is locked"
+    вместо ожидания. На время класса тестовая БД копируется в файл, и все потоки
+    подключаются к нему; после класса возвращается БД в памяти
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            cls.use_file_database()
+
+    @classmethod
+    def use_file_database(cls):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        target.close()
+
+        memory_settings = connections.settings[DEFAULT_DB_ALIAS]
+        memory_connection = connections[DEFAULT_DB_ALIAS]
+        connections.settings[DEFAULT_DB_ALIAS] = dict(memory_settings, NAME=path)
+        connections[DEFAULT_DB_ALIAS] = connections.create_connection(DEFAULT_DB_ALIAS)
+
+        def restore():
+            connections[DEFAULT_DB_ALIAS].close()
+            connections.settings[DEFAULT_DB_ALIAS] = memory_settings
+            connections[DEFAULT_DB_ALIAS] = memory_connection
+            os.remove(path)
+
+        cls.addClassCleanup(restore)
+
+
+# ============== ЗАПИСЬ НА ЗАНЯТИЯ ==============
+class ConcurrentBookingTest(FileDatabaseTestCase):
+    """Параллельные запросы на один и тот же слот не должны создавать двойных записей"""
+
+    THREADS = 8
+
+    def setUp(self):
+        self.service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+        self.trainer = Trainers.objects.create(
+            full_name='Тренер', specialization='Йога', experience_years=3, phone='+7 (000) 000-00-01'
+        )
+        self.clients = [
+            Clients.objects.create(first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 000-00-{i:02d}')
+            for i in range(self.THREADS)
+        ]
+        self.booking_date = date.today() + timedelta(days=1)
+
+    def _run_concurrently(self, make_kwargs):
+        barrier = threading.Barrier(self.THREADS)
+        created, conflicts, errors = [], [], []
+
+        def worker(i):
+            try:
+                barrier.wait()
+                created.append(BookingService.create_booking(**make_kwargs(i)))
+            except BookingConflictError:
+                conflicts.append(i)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        return created, conflicts
+
+    def test_same_room_slot_is_booked_once(self):
+        created, conflicts = self._run_concurrently(lambda i: {
+            'client': self.clients[i],
+            'service': self.service,
+            'booking_date': self.booking_date,
+            'start_time': time(10, 0),
+            'end_time': time(11, 30),
+            'room': 'hall1',
+        })
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(conflicts), self.THREADS - 1)
+        self.assertEqual(Bookings.objects.filter(booking_date=self.booking_date, room='hall1').count(), 1)
+
+    def test_same_trainer_in_different_rooms_is_booked_once(self):
+        rooms = [room for room, _ in Bookings.ROOM_CHOICES]
+        created, conflicts = self._run_concurrently(lambda i: {
+            'client': self.clients[i],
+            'service': self.service,
+            'trainer': self.trainer,
+            'booking_date': self.booking_date,
+            'start_time': time(12, 0),
+            'end_time': time(13, 30),
+            'room': rooms[i % len(rooms)],
+        })
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual(Bookings.objects.filter(trainer=self.trainer).count(), 1)
+
+    def test_non_overlapping_slots_are_all_booked(self):
+        created, conflicts = self._run_concurrently(lambda i: {
+            'client': self.clients[i],
+            'service': self.service,
+            'booking_date': self.booking_date,
+            'start_time': time(8 + i, 0),
+            'end_time': time(8 + i, 45),
+            'room': 'hall2',
+        })
+
+        self.assertEqual(len(created), self.THREADS)
+        self.assertEqual(conflicts, [])
+
+
+class BookingFormTest(TestCase):
+    """Форма записи отклоняет пересечения по залу, тренеру и клиенту, но не встык"""
+
+    def setUp(self):
+        self.service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+        self.trainer = Trainers.objects.create(
+            full_name='Тренер', specialization='Йога', experience_years=3, phone='+7 (000) 000-00-01'
+        )
+        self.client_obj = Clients.objects.create(first_name='Анна', last_name='Тест', phone='+7 (000) 000-00-02')
+        self.other = Clients.objects.create(first_name='Иван', last_name='Тест', phone='+7 (000) 000-00-03')
+        self.booking_date = date.today() + timedelta(days=1)
+        Bookings.objects.create(
+            client=self.other, service=self.service, trainer=self.trainer, booking_date=self.booking_date,
+            start_time=time(10, 0), end_time=time(11, 30), room='hall1', status='scheduled'
+        )
+
+    def form(self, start, end, room='hall1', trainer=None, client=None):
+        return BookingForm(data={
+            'service': self.service.pk,
+            'trainer': trainer.pk if trainer else '',
+            'booking_date': self.booking_date.isoformat(),
+            'start_time': start,
+            'end_time': end,
+            'room': room,
+            'notes': '',
+        }, client=client or self.client_obj)
+
+    def test_overlap_is_rejected(self):
+        form = self.form('11:00', '12:00')
+        self.assertFalse(form.is_valid())
+        self.assertIn('Это время уже занято', form.errors['start_time'][0])
+
+        form = self.form('09:30', '10:30', room='hall2', trainer=self.trainer)
+        self.assertFalse(form.is_valid())
+        self.assertIn('Тренер уже занят', form.errors['start_time'][0])
+
+        form = self.form('10:30', '11:00', room='hall3', client=self.other)
+        self.assertFalse(form.is_valid())
+        self.assertIn('У вас уже есть запись', form.errors['start_time'][0])
+
+    def test_back_to_back_is_allowed(self):
+        self.assertTrue(self.form('11:30', '12:30', trainer=self.trainer).is_valid())
+        self.assertTrue(self.form('09:00', '10:00', trainer=self.trainer).is_valid())
+
+    def test_cancelled_booking_frees_slot(self):
+        Bookings.objects.update(status='cancelled')
+        self.assertTrue(self.form('10:00', '11:30').is_valid())
+
+
+class BookingLocksCleanupTest(TestCase):
+    """Строки блокировок за прошедшие дни удаляются, сегодняшние и будущие остаются"""
+
+    def test_past_locks_are_removed(self):
+        service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+        client = Clients.objects.create(first_name='Анна', last_name='Тест', phone='+7 (000) 000-00-01')
+        today = timezone.localdate()
+        for offset in (-3, -1, 0, 2):
+            BookingService.create_booking(
+                client, service, today + timedelta(days=offset), time(10, 0), time(11, 0), 'hall1'
+            )
+        self.assertEqual(BookingLocks.objects.count(), 8)
+
+        call_command('cleanup_booking_locks', batch_size=3, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(set(BookingLocks.objects.values_list('day', flat=True)), {today, today + timedelta(days=2)})
+        self.assertEqual(Bookings.objects.count(), 4)
+
+
+# ============== ИНДЕКСЫ ==============
+class QueryPlanTest(TestCase):
+    """EXPLAIN для горячих запросов: ни один не должен читать таблицу целиком"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+        cls.trainer = Trainers.objects.create(
+            full_name='Тренер', specialization='Йога', experience_years=3, phone='+7 (000) 000-00-01'
+        )
+        cls.clients = Clients.objects.bulk_create([
+            Clients(first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 000-{i:04d}')
+            for i in range(50)
+        ])
+        cls.client_obj = cls.clients[0]
+        ClientSearchTokens.objects.bulk_create(ClientSearch.build_tokens(cls.clients))
+
+        today = date.today()
+        rooms = [room for room, _ in Bookings.ROOM_CHOICES]
+        statuses = [status for status, _ in Bookings.STATUS_CHOICES]
+        Bookings.objects.bulk_create([
+            Bookings(
+                client=cls.clients[i % len(cls.clients)],
+                service=cls.service,
+                trainer=cls.trainer if i % 3 == 0 else None,
+                booking_date=today + timedelta(days=i % 60 - 30),
+                start_time=time(8 + i % 12, 0),
+                end_time=time(9 + i % 12, 0),
+                room=rooms[i % len(rooms)],
+                status=statuses[i % len(statuses)],
+            )
+            for i in range(500)
+        ])
+        Subscriptions.objects.bulk_create([
+            Subscriptions(
+                client=cls.clients[i % len(cls.clients)],
+                service=cls.service,
+                start_date=today - timedelta(days=30),
+                end_date=today + timedelta(days=i % 60 - 30),
+                price_paid=1000,
+                status='active' if i % 2 else 'expired',
+            )
+            for i in range(200)
+        ])
+
+    def full_scans(self, queryset):
+        """Список таблиц, которые план запроса читает целиком"""
+        if connection.vendor == 'mysql':
+            plan = json.loads(queryset.explain(format='json'))
+            scans = []
+
+            def walk(node):
+                if isinstance(node, dict):
+                    if node.get('access_type') == 'ALL':
+                        scans.append(node.get('table_name'))
+                    for value in node.values():
+                        walk(value)
+                elif isinstance(node, list):
+                    for value in node:
+                        walk(value)
+
+            walk(plan)
+            return scans
+
+        if connection.vendor == 'sqlite':
+            # SEARCH - поиск по индексу, SCAN - полный проход по таблице или индексу
+            scans = []
+            for line in queryset.explain().splitlines():
+                detail = line.split('SCAN ', 1)
+                if len(detail) == 2:
+                    scans.append(detail[1].strip())
+            return scans
+
+        self.skipTest(f'EXPLAIN не поддерживается для {connection.vendor}')
+
+    def assertIndexed(self, queryset):
+        self.assertEqual(self.full_scans(queryset), [], queryset.explain())
+
+    def test_room_day_occupancy(self):
+        # Проверка пересечений в формах и свободные слоты
+        self.assertIndexed(Bookings.objects.filter(
+            booking_date=date.today(), room='hall1', status='scheduled'
+        ))
+        self.assertIndexed(Bookings.objects.filter(booking_date=date.today(), status='scheduled'))
+
+    def test_conflict_check(self):
+        # Тот же запрос, что строит BookingService.find_conflict: зал ИЛИ тренер ИЛИ клиент
+        self.assertIndexed(BookingService.conflicts(
+            date.today(), time(10, 0), time(11, 30),
+            room='hall1', trainer=self.trainer, client=self.client_obj, exclude_pk=1
+        )[:1])
+        self.assertIndexed(BookingService.conflicts(date.today(), time(10, 0), time(11, 30), room='hall1')[:1])
+
+    def test_manage_bookings_by_date(self):
+        self.assertIndexed(Bookings.objects.filter(
+            booking_date=date.today(), status='completed'
+        ).order_by('-booking_date', '-start_time'))
+
+    def test_client_schedule(self):
+        self.assertIndexed(Bookings.objects.filter(
+            client=self.client_obj, booking_date__gte=date.today(), status='scheduled'
+        ).order_by('booking_date', 'start_time'))
+        self.assertIndexed(Bookings.objects.filter(
+            client=self.client_obj, booking_date=date.today(), status='scheduled'
+        ))
+
+    def test_trainer_day_occupancy(self):
+        self.assertIndexed(Bookings.objects.filter(
+            trainer=self.trainer, booking_date=date.today(), status='scheduled'
+        ))
+
+    def test_client_subscriptions_by_status(self):
+        self.assertIndexed(Subscriptions.objects.filter(client=self.client_obj, status='active'))
+
+    def test_client_search(self):
+        # Префикс имени, email и номера (в том числе окончание по phone_rev) - диапазоны по client_search_token_idx
+        for query in ['клиент1 тест', 'klient', 'test@example', '8000', '0012']:
+            with self.subTest(query=query):
+                self.assertIndexed(ClientSearch.filter(Clients.objects.all(), query))
+
+    def test_service_autocomplete(self):
+        self.assertIndexed(ServiceSearch.filter(Services.objects.all(), 'йо').order_by('service_name')[:20])
+
+
+# ============== ГЛАВНАЯ СТРАНИЦА ==============
+class DashboardQueriesTest(TestCase):
+    """Панель администратора собирается фиксированным числом запросов"""
+
+    MAX_QUERIES = 18
+    MAX_CACHED_QUERIES = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+        Services.objects.create(service_name='Бокс', price=3000, duration=60, is_active=False)
+        trainer = Trainers.objects.create(
+            full_name='Тренер', specialization='Йога', experience_years=4, phone='+7 (000) 000-00-01'
+        )
+
+        today = date.today()
+        birth_dates = [
+            date(today.year - 30, 1, 1),
+            date(today.year - 20, 12, 31),
+            today.replace(year=today.year - 40),
+            None,
+        ]
+        cls.clients = [
+            Clients.objects.create(
+                first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 000-00-{i:02d}',
+                email=f'client{i}@example.com' if i % 2 else '', birth_date=birth_date
+            )
+            for i, birth_date in enumerate(birth_dates)
+        ]
+        for i, client in enumerate(cls.clients):
+            Subscriptions.objects.create(
+                client=client, service=service, start_date=today,
+                end_date=today + timedelta(days=30), price_paid=1000 * (i + 1)
+            )
+            Bookings.objects.create(
+                client=client, service=service, trainer=trainer, booking_date=today,
+                start_time=time(10 + i, 0), end_time=time(11 + i, 0),
+                status='scheduled' if i % 2 else 'completed'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_query_budget(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), self.MAX_QUERIES, '\n'.join(q['sql'] for q in queries))
+
+    def test_cached_query_budget(self):
+        self.client.get(reverse('index'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+
+        self.assertLessEqual(len(queries), self.MAX_CACHED_QUERIES, '\n'.join(q['sql'] for q in queries))
+
+    def test_cache_invalidated_on_change(self):
+        self.assertEqual(self.client.get(reverse('index')).context['stats']['clients_count'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Clients.objects.create(first_name='Новый', last_name='Клиент', phone='+7 (000) 000-00-99')
+        self.assertEqual(self.client.get(reverse('index')).context['stats']['clients_count'], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clients[0].delete()
+        stats = self.client.get(reverse('index')).context['stats']
+        self.assertEqual(stats['clients_count'], 4)
+        # Каскадное удаление абонементов и записей тоже сбрасывает их разделы
+        self.assertEqual(stats['subscriptions_count'], 3)
+        self.assertEqual(stats['total_bookings'], 3)
+
+    def test_stats_values(self):
+        stats = self.client.get(reverse('index')).context['stats']
+
+        ages = [client.age for client in self.clients if client.birth_date]
+        self.assertEqual(stats['avg_age'], round(sum(ages) / len(ages), 1))
+        self.assertEqual(stats['clients_count'], 4)
+        self.assertEqual(stats['clients_with_email'], 2)
+        self.assertEqual(stats['email_percentage'], 50.0)
+        self.assertEqual(stats['services_count'], 2)
+        self.assertEqual(stats['active_services_count'], 1)
+        self.assertEqual(stats['avg_price'], 1000)
+        self.assertEqual(stats['total_revenue'], 10000)
+        self.assertEqual(stats['today_bookings'], 2)
+        self.assertEqual(stats['completed_bookings'], 2)
+        self.assertEqual(stats['total_bookings'], 4)
+
+
+# ============== ДНЕВНЫЕ ИТОГИ ==============
+class DailyMetricsTest(TestCase):
+    """DailyMetrics обновляется при изменении данных и совпадает с полным пересчетом"""
+
+    def setUp(self):
+        self.today = date.today()
+        self.service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_obj = Clients.objects.create(first_name='Иван', last_name='Тест', phone='+7 (000) 000-00-01')
+            Subscriptions.objects.create(
+                client=self.client_obj, service=self.service, start_date=self.today,
+                end_date=self.today + timedelta(days=30), price_paid=2500
+            )
+            self.booking = Bookings.objects.create(
+                client=self.client_obj, service=self.service, booking_date=self.today,
+                start_time=time(10, 0), end_time=time(11, 0), room='pool'
+            )
+
+    def metrics_for(self, day):
+        return DailyMetrics.objects.get(day=day)
+
+    def test_incremental_update(self):
+        metrics = self.metrics_for(self.today)
+        self.assertEqual(metrics.new_clients, 1)
+        self.assertEqual(metrics.new_subscriptions, 1)
+        self.assertEqual(metrics.revenue, 2500)
+        self.assertEqual(metrics.bookings_scheduled, 1)
+        self.assertEqual(metrics.bookings_pool, 1)
+
+    def test_booking_moved_to_another_day(self):
+        tomorrow = self.today + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.booking_date = tomorrow
+            self.booking.status = 'completed'
+            self.booking.save()
+
+        self.assertEqual(self.metrics_for(self.today).bookings_scheduled, 0)
+        self.assertEqual(self.metrics_for(self.today).bookings_pool, 0)
+        self.assertEqual(self.metrics_for(tomorrow).bookings_completed, 1)
+
+    def test_backfill_matches_incremental(self):
+        incremental = list(DailyMetrics.objects.values().order_by('day'))
+        DailyMetrics.objects.all().delete()
+
+        call_command('backfill_daily_metrics', batch_days=1, stdout=open(os.devnull, 'w'))
+
+        backfilled = list(DailyMetrics.objects.values().order_by('day'))
+        for row in incremental + backfilled:
+            row.pop('id')
+            row.pop('updated_at')
+        self.assertEqual(backfilled, incremental)
+
+    def test_backfill_from_start_without_history(self):
+        Clients.objects.all().delete()
+        DailyMetrics.objects.all().delete()
+        start = timezone.localdate() - timedelta(days=2)
+
+        call_command('backfill_daily_metrics', start=start.isoformat(), stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(list(DailyMetrics.objects.order_by('day').values_list('day', 'revenue')), [
+            (start + timedelta(days=offset), 0) for offset in range(3)
+        ])
+
+    def test_migration_backfill_matches_incremental(self):
+        migration = importlib.import_module('main.migrations.0014_backfill_daily_metrics')
+        incremental = list(DailyMetrics.objects.values().order_by('day'))
+        DailyMetrics.objects.all().delete()
+
+        migration.backfill_daily_metrics(django_apps, None)
+
+        backfilled = list(DailyMetrics.objects.values().order_by('day'))
+        for row in incremental + backfilled:
+            row.pop('id')
+            row.pop('updated_at')
+        self.assertEqual(backfilled, incremental)
+
+    def test_upsert_without_conflict_target(self):
+        # MySQL: ON DUPLICATE KEY UPDATE без unique_fields (иначе NotSupportedError)
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(DailyMetrics.objects, 'bulk_create') as bulk_create:
+            MetricsRollup.refresh_range(self.today, self.today)
+
+        kwargs = bulk_create.call_args.kwargs
+        self.assertTrue(kwargs['update_conflicts'])
+        self.assertIsNone(kwargs['unique_fields'])
+        self.assertIn('revenue', kwargs['update_fields'])
+
+
+# ============== ГРАФИК ВЫРУЧКИ ==============
+class RevenueSeriesTest(TestCase):
+    """График выручки считается из абонементов, закрытые месяцы берутся из кэша"""
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.this_month = self.today.replace(day=1)
+        self.last_month = (self.this_month - timedelta(days=1)).replace(day=1)
+
+        client = Clients.objects.create(first_name='Иван', last_name='Тест', phone='+7 (000) 000-00-01')
+        service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+        for day, price in [(self.last_month, 1000), (self.last_month + timedelta(days=10), 500), (self.today, 700)]:
+            subscription = Subscriptions.objects.create(
+                client=client, service=service, start_date=day,
+                end_date=day + timedelta(days=30), price_paid=price
+            )
+            Subscriptions.objects.filter(pk=subscription.pk).update(
+                created_at=timezone.make_aware(datetime.combine(day, time(12, 0)))
+            )
+
+    def test_monthly_series(self):
+        series = RevenueSeries.series(self.last_month, self.today, 'month')
+        self.assertEqual(series['data'], [1500.0, 700.0])
+        self.assertEqual(len(series['labels']), 2)
+
+    def test_closed_months_are_cached(self):
+        RevenueSeries.series(self.last_month, self.today, 'month')
+
+        # Прошлый месяц читается из кэша, запрос нужен только для текущего
+        with CaptureQueriesContext(connection) as queries:
+            series = RevenueSeries.series(self.last_month, self.today, 'month')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(series['data'], [1500.0, 700.0])
+
+    def test_partial_range_is_clipped(self):
+        series = RevenueSeries.series(self.last_month + timedelta(days=5), self.today, 'month')
+        self.assertEqual(series['data'], [500.0, 700.0])
+
+    def test_weekly_series_total(self):
+        series = RevenueSeries.series(self.last_month, self.today, 'week')
+        self.assertEqual(sum(series['data']), 2200.0)
+
+    def test_long_range_is_one_range_query(self):
+        start = self.today - timedelta(days=5 * 365)
+        with CaptureQueriesContext(connection) as queries:
+            series = RevenueSeries.series(start, self.today, 'week')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(sum(series['data']), 2200.0)
+        self.assertEqual(queries[0]['sql'].count('"created_at" >='), 1)
+
+        with self.assertRaises(ValueError):
+            RevenueSeries.series(date(1990, 1, 1), self.today, 'week')
+
+    def test_too_long_range_is_a_form_error(self):
+        admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('reports_statistics'), {'start': '1990-01-01', 'period': 'week'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('не больше 5 лет', response.context['range_error'])
+        # График строится за период по умолчанию (последние 12 месяцев)
+        self.assertGreater(response.context['start'], '2000-01-01')
+        self.assertTrue(json.loads(response.context['chart_data'])['revenue']['labels'])
+
+
+# ============== ПАГИНАЦИЯ ==============
+class KeysetPaginationTest(TestCase):
+    """Пагинация по курсору: порядок без пропусков и повторов, одинаковая стоимость страниц"""
+
+    def setUp(self):
+        cache.clear()
+        for i in range(23):
+            Clients.objects.create(first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 000-00-{i:02d}')
+        # Одинаковая дата регистрации у части клиентов: порядок добирается по pk
+        Clients.objects.filter(pk__in=Clients.objects.order_by('pk').values('pk')[:8]).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        self.expected = list(Clients.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(Clients.objects.all(), 5, ['-created_at'])
+
+    def test_forward_and_backward(self):
+        pages = [self.paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertEqual([obj.pk for page in pages for obj in page], self.expected)
+
+        page = pages[-1]
+        backward = [obj.pk for obj in page]
+        while page.has_previous():
+            page = self.paginator.get_page(page.previous_cursor)
+            backward = [obj.pk for obj in page] + backward
+        self.assertEqual(page.number, 1)
+        self.assertEqual(backward, self.expected)
+
+    def test_last_page_and_bar(self):
+        last = self.paginator.get_page(self.paginator.get_page().last_cursor)
+        self.assertEqual(last.number, 5)
+        self.assertEqual([obj.pk for obj in last], self.expected[20:])
+        self.assertFalse(last.has_next())
+
+        labels = [num for num, _ in last.page_bar()]
+        self.assertEqual(labels, [1, KeysetPaginator.ELLIPSIS, 4, 5])
+
+    def test_invalid_cursor_opens_first_page(self):
+        page = self.paginator.get_page('не-курсор')
+        self.assertEqual(page.number, 1)
+        self.assertEqual([obj.pk for obj in page], self.expected[:5])
+
+    def test_deep_page_is_single_query(self):
+        page = KeysetPaginator(Clients.objects.all(), 5, ['-created_at'], count=23).get_page()
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as queries:
+                page = page.paginator.get_page(page.next_cursor)
+                list(page)
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+    def test_list_views_follow_cursor(self):
+        admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(admin)
+        url = reverse('client_list')
+
+        first = self.client.get(url)
+        second = self.client.get(url, {'cursor': first.context['clients'].next_cursor})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual([obj.pk for obj in second.context['clients']], self.expected[10:20])
+
+
+# ============== ЗАПРОСЫ СПИСКОВ ==============
+class ListQueryCountTest(TestCase):
+    """Число запросов страниц со списками не зависит от количества строк"""
+
+    # Имя страницы -> (роль, аргументы URL, ожидаемое число запросов)
+    PAGES = {
+        'index': ('admin', [], 15),
+        'client_list': ('admin', [], 4),
+        'subscription_list': ('admin', [], 4),
+        'manage_bookings': ('admin', [], 6),
+        'schedule': ('admin', [], 3),
+        'client_detail': ('admin', ['client'], 4),
+        'trainer_detail': ('admin', ['trainer'], 3),
+        'service_detail_admin': ('admin', ['service'], 3),
+        'profile': ('client', [], 5),
+        'my_subscriptions': ('client', [], 7),
+        'my_schedule': ('client', [], 10),
+        'book_training': ('client', [], 10),
+        'quick_book': ('client', [], 7),
+        'buy_subscription': ('client', [], 5),
+        'service_detail': ('client', ['service'], 4),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        cls.user = Users.objects.create_user('client', 'client@example.com', 'password', role='client')
+        cls.me = Clients.objects.create(
+            first_name='Анна', last_name='Клиент', phone='+7 (000) 000-00-00', email='client@example.com'
+        )
+        cls.user.client_profile = cls.me
+        cls.user.save()
+        cls.service = Services.objects.create(service_name='Йога', price=1000, duration=60)
+        cls.trainer = Trainers.objects.create(
+            full_name='Тренер', specialization='Йога', experience_years=4, phone='+7 (000) 000-00-01'
+        )
+        cls.rows = 0
+        cls.add_rows(1)
+
+    @classmethod
+    def add_rows(cls, count):
+        """Добавляет абонементы и записи (прошедшие и будущие) для чужих клиентов и для себя"""
+        today = date.today()
+        for i in range(cls.rows, cls.rows + count):
+            other = Clients.objects.create(first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 100-00-{i:02d}')
+            for client in (other, cls.me):
+                Subscriptions.objects.create(
+                    client=client, service=cls.service, start_date=today,
+                    end_date=today + timedelta(days=30), price_paid=1000
+                )
+                for offset in (-2, 0, 2):
+                    Bookings.objects.create(
+                        client=client, service=cls.service, trainer=cls.trainer,
+                        booking_date=today + timedelta(days=offset + 7 * i), start_time=time(8 + i % 10, 0),
+                        end_time=time(9 + i % 10, 0), room='hall2' if client == cls.me else 'hall1'
+                    )
+        cls.rows += count
+
+    def url(self, name, args):
+        objects = {'client': self.me, 'trainer': self.trainer, 'service': self.service}
+        return reverse(name, args=[objects[arg].pk for arg in args])
+
+    def assert_page_queries(self, name):
+        role, args, expected = self.PAGES[name]
+        self.client.force_login(self.admin if role == 'admin' else self.user)
+        # Статистика считается заново, чтобы число запросов не зависело от кэша
+        cache.clear()
+        with self.assertNumQueries(expected):
+            response = self.client.get(self.url(name, args))
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_count_does_not_grow(self):
+        for name in self.PAGES:
+            with self.subTest(page=name, rows=self.rows):
+                self.assert_page_queries(name)
+
+        self.add_rows(8)
+
+        for name in self.PAGES:
+            with self.subTest(page=name, rows=self.rows):
+                self.assert_page_queries(name)
+
+
+# ============== ЗАМЕРЫ ЗАПРОСОВ ==============
+class QueryBudgetMiddlewareTest(TestCase):
+    """Middleware считает SQL и время, копит статистику по страницам и следит за бюджетом"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        cls.manager = Users.objects.create_user('manager', 'manager@example.com', 'password', role='manager')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('client_list'))
+
+        self.assertIn(f'desc="SQL: {len(queries)}"', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_stats_aggregated_by_url_name(self):
+        self.client.get(reverse('client_list'))
+        self.client.get(reverse('client_list'), {'search': 'Иван'})
+        self.client.get(reverse('schedule'))
+
+        stats = {row['url_name']: row for row in RequestStats.all()}
+        self.assertEqual(stats['client_list']['requests'], 2)
+        self.assertEqual(stats['schedule']['requests'], 1)
+        self.assertGreater(stats['client_list']['avg_queries'], 0)
+
+    def test_streaming_response_measured_until_last_chunk(self):
+        for i in range(3):
+            Clients.objects.create(first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 000-00-{i:02d}')
+
+        with CaptureQueriesContext(connection) as view_queries:
+            response = self.client.get(reverse('export_table', args=['clients']))
+        self.assertEqual(RequestStats.all(), [])
+        self.assertNotIn('Server-Timing', response)
+
+        with CaptureQueriesContext(connection) as stream_queries:
+            b''.join(response.streaming_content)
+        stats = {row['url_name']: row for row in RequestStats.all()}
+        self.assertGreater(len(stream_queries), 0)
+        self.assertEqual(stats['export_table']['queries'], len(view_queries) + len(stream_queries))
+
+    @override_settings(REQUEST_QUERY_BUDGET=1)
+    def test_warning_over_budget(self):
+        with self.assertLogs('main.performance', 'WARNING') as logs:
+            self.client.get(reverse('client_list'))
+
+        self.assertIn('client_list', logs.output[0])
+        self.assertEqual(RequestStats.all()[0]['over_budget'], 1)
+
+    def test_page_is_admin_only(self):
+        self.client.get(reverse('client_list'))
+        response = self.client.get(reverse('performance_stats'))
+        self.assertContains(response, 'client_list')
+
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(reverse('performance_stats')).status_code, 302)
+
+
+# ============== ПОИСК КЛИЕНТОВ ==============
+class ClientSearchTest(TestCase):
+    """Поиск по токенам: транслитерация, телефон цифрами, email и ранжирование"""
+
+    def setUp(self):
+        cache.clear()
+        self.petrov = Clients.objects.create(
+            first_name='Иван', last_name='Петров', phone='+7 (999) 123-45-67', email='Ivan.Petrov@Mail.ru'
+        )
+        self.petrovsky = Clients.objects.create(
+            first_name='Юлия', last_name='Петровская', phone='+7 (912) 000-00-01'
+        )
+        self.smith = Clients.objects.create(first_name='John', last_name='Smith', phone='8 (495) 555-12-12')
+
+    def search(self, query):
+        return list(ClientSearch.filter(Clients.objects.all(), query).order_by('-search_rank', '-created_at'))
+
+    def test_name_in_any_layout(self):
+        self.assertEqual(self.search('ivan'), [self.petrov])
+        self.assertEqual(self.search('Петр иван'), [self.petrov])
+        self.assertEqual(self.search('yuliya'), [self.petrovsky])
+        self.assertEqual(self.search('smi'), [self.smith])
+
+    def test_phone_digits(self):
+        self.assertEqual(self.search('8 (999) 123'), [self.petrov])
+        self.assertEqual(self.search('999-123-45'), [self.petrov])
+        self.assertEqual(self.search('7495'), [self.smith])
+
+    def test_phone_last_digits(self):
+        self.assertEqual(self.search('45-67'), [self.petrov])
+        self.assertEqual(self.search('1212'), [self.smith])
+        self.assertEqual(self.search('00-01'), [self.petrovsky])
+        # Перевернутый номер не ищется как обычный префикс
+        self.assertEqual(self.search('7654'), [])
+
+    def test_phone_rev_migration(self):
+        migration = importlib.import_module('main.migrations.0015_clientsearchtokens_phone_rev')
+        expected = set(ClientSearchTokens.objects.filter(kind='phone_rev').values_list('client_id', 'token'))
+        ClientSearchTokens.objects.filter(kind='phone_rev').delete()
+
+        migration.fill_phone_rev_tokens(django_apps, None)
+
+        self.assertEqual(set(ClientSearchTokens.objects.filter(kind='phone_rev').values_list('client_id', 'token')), expected)
+        self.assertEqual(len(expected), 3)
+
+    def test_email_prefix(self):
+        self.assertEqual(self.search('ivan.petrov@'), [self.petrov])
+
+    def test_exact_match_ranked_first(self):
+        self.assertEqual(self.search('петров'), [self.petrov, self.petrovsky])
+        self.assertEqual(self.search('петровская'), [self.petrovsky])
+
+    def test_tokens_follow_save(self):
+        self.petrov.last_name = 'Сидоров'
+        self.petrov.save()
+
+        self.assertEqual(self.search('петров'), [self.petrovsky])
+        self.assertEqual(self.search('sidorov'), [self.petrov])
+
+    def test_rebuild_command(self):
+        ClientSearchTokens.objects.all().delete()
+        call_command('rebuild_client_search', batch_size=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.search('smith'), [self.smith])
+
+    def test_client_list_search(self):
+        admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('client_list'), {'search': 'петров'})
+        self.assertEqual(list(response.context['clients']), [self.petrov, self.petrovsky])
+        self.assertEqual(response.context['total_clients'], 2)
+
+
+# ============== АВТОДОПОЛНЕНИЕ ==============
+class AutocompleteTest(TestCase):
+    """API автодополнения и формы, которые не выводят в HTML всех клиентов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        cls.clients = [
+            Clients.objects.create(first_name=f'Клиент{i}', last_name='Тестов', phone=f'+7 (000) 000-00-{i:02d}')
+            for i in range(25)
+        ]
+        cls.yoga = Services.objects.create(service_name='Йога', price=1000, duration=60)
+        cls.boxing = Services.objects.create(service_name='Бокс', price=1500, duration=60, is_active=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_clients_pages(self):
+        first = self.client.get(reverse('autocomplete_clients')).json()
+        self.assertEqual(len(first['results']), 20)
+        second = self.client.get(reverse('autocomplete_clients'), {'cursor': first['next_cursor']}).json()
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next_cursor'])
+
+        ids = [item['id'] for item in first['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(client.pk for client in self.clients))
+
+    def test_clients_search_and_cache(self):
+        data = self.client.get(reverse('autocomplete_clients'), {'q': 'klient7'}).json()
+        self.assertEqual(data['results'], [{'id': self.clients[7].pk, 'text': 'Клиент7 Тестов, +7 (000) 000-00-07'}])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('autocomplete_clients'), {'q': 'klient7'})
+        self.assertFalse([query for query in queries if '"Clients"' in query['sql']])
+
+    def test_services_prefix(self):
+        data = self.client.get(reverse('autocomplete_services'), {'q': 'Бо'}).json()
+        self.assertEqual([item['id'] for item in data['results']], [self.boxing.pk])
+        self.assertIn('неактивна', data['results'][0]['text'])
+        data = self.client.get(reverse('autocomplete_services'), {'q': 'бо'}).json()
+        self.assertEqual([item['id'] for item in data['results']], [self.boxing.pk])
+
+    def test_subscription_form_renders_selected_only(self):
+        response = self.client.get(reverse('subscription_create'))
+        self.assertNotContains(response, 'Клиент3 Тестов')
+        self.assertContains(response, reverse('autocomplete_clients'))
+
+        subscription = Subscriptions.objects.create(
+            client=self.clients[3], service=self.yoga, start_date=date.today(),
+            end_date=date.today() + timedelta(days=30), price_paid=1000
+        )
+        response = self.client.get(reverse('subscription_edit', args=[subscription.pk]))
+        self.assertContains(response, 'Клиент3 Тестов')
+        self.assertNotContains(response, 'Клиент4 Тестов')
+
+    def test_form_queries_do_not_depend_on_client_count(self):
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse('subscription_create'))
+        Clients.objects.bulk_create([
+            Clients(first_name=f'Новый{i}', last_name='Клиент', phone='+7 (000) 000-00-00') for i in range(50)
+        ])
+        with self.assertNumQueries(len(before)):
+            self.client.get(reverse('subscription_create'))
+
+    def test_link_client_to_user(self):
+        user = Users.objects.create_user('client', 'client@example.com', 'password', role='client')
+        url = reverse('link_client_to_user', args=[user.pk])
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'client_id': self.clients[5].pk})
+        user.refresh_from_db()
+        self.assertEqual(user.client_profile, self.clients[5])
+
+
+# ============== ПРОФИЛЬ КЛИЕНТА ==============
+class ClientProfileLookupTest(TestCase):
+    """Профиль клиента определяется один раз за запрос (декоратор + view + base.html)"""
+
+    PAGES = ['my_schedule', 'my_subscriptions', 'book_training', 'quick_book', 'buy_subscription']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = Clients.objects.create(
+            first_name='Анна', last_name='Клиент', phone='+7 (000) 000-00-00', email='anna@example.com'
+        )
+
+    def profile_queries(self, queries):
+        """Выборки из Clients с условием - поиск или загрузка профиля"""
+        return [query['sql'] for query in queries if 'FROM "Clients" WHERE' in query['sql'].replace('`', '"')]
+
+    def test_linked_profile_loaded_once(self):
+        user = Users.objects.create_user('anna', 'anna@example.com', 'password', role='client')
+        user.client_profile = self.profile
+        user.save()
+        self.client.force_login(user)
+
+        for name in self.PAGES:
+            with self.subTest(page=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(self.profile_queries(queries)), 1, self.profile_queries(queries))
+
+    def test_unlinked_profile_resolved_once(self):
+        user = Users.objects.create_user('anna', 'anna@example.com', 'password', role='client')
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('my_schedule'))
+
+        self.assertEqual(response.context['client'], self.profile)
+        self.assertEqual(len([sql for sql in self.profile_queries(queries) if '"email" =' in sql]), 1)
+        user.refresh_from_db()
+        self.assertEqual(user.client_profile, self.profile)
+
+
+# ============== СЕССИИ ==============
+@override_settings(SESSION_REFRESH_MINUTES=15)
+class SessionRefreshTest(TestCase):
+    """Сессия пишется в django_session только при изменении или устаревании срока"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+
+    def session_writes(self, queries):
+        return [
+            query['sql'] for query in queries
+            if '"django_session"' in query['sql'].replace('`', '"') and not query['sql'].startswith('SELECT')
+        ]
+
+    def get_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        return response, self.session_writes(queries)
+
+    def test_fresh_session_not_saved(self):
+        self.client.force_login(self.user)
+        response, writes = self.get_index()
+
+        self.assertEqual(writes, [])
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_stale_session_refreshed(self):
+        self.client.force_login(self.user)
+        expire_date = Session.objects.get().expire_date
+        stale = timezone.now().timestamp() + 16 * 60
+
+        with mock.patch('main.session_backend.time.time', return_value=stale):
+            response, writes = self.get_index()
+
+        self.assertEqual(len(writes), 1)
+        self.assertIn('sessionid', response.cookies)
+        self.assertGreaterEqual(Session.objects.get().expire_date, expire_date)
+
+        # Следующий запрос в пределах периода снова ничего не пишет
+        with mock.patch('main.session_backend.time.time', return_value=stale + 60):
+            response, writes = self.get_index()
+        self.assertEqual(writes, [])
+
+    def test_clear_expired_in_batches(self):
+        for i in range(5):
+            store = SessionStore()
+            store['n'] = i
+            store.create()
+        Session.objects.update(expire_date=timezone.now() - timedelta(days=1))
+        alive = SessionStore()
+        alive['n'] = 'alive'
+        alive.create()
+
+        call_command('cleanup_sessions', batch_size=2, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [alive.session_key])
+
+
+# ============== НАБОРЫ ДАННЫХ ОТЧЕТОВ ==============
+class ImmediateExecutor:
+    """Пул для тестов: задание выполняется сразу в текущем потоке и транзакции теста"""
+
+    def submit(self, func, job_id):
+        ReportJobRunner.run(job_id)
+
+
+def run_report_job(test, data):
+    """Отправляет форму фильтров и выполняет поставленное задание; ответ - редирект на страницу задания"""
+    with mock.patch.object(ReportJobRunner, 'executor', return_value=ImmediateExecutor()):
+        with test.captureOnCommitCallbacks(execute=True):
+            return test.client.post(reverse('reports_filter'), data)
+
+
+class ReportDatasetCacheTest(TestCase):
+    """Детерминированная генерация тестовых данных и LRU-кэш DataFrame"""
+
+    def setUp(self):
+        DatasetCache.clear()
+        self.addCleanup(DatasetCache.clear)
+
+    def test_same_seed_same_data(self):
+        for data_type in ReportGenerator.DATA_TYPES:
+            with self.subTest(data_type=data_type):
+                first = ReportGenerator.create_report_dataframe(data_type, 50, seed=7)
+                second = ReportGenerator.create_report_dataframe(data_type, 50, seed=7)
+                other = ReportGenerator.create_report_dataframe(data_type, 50, seed=8)
+                self.assertTrue(first.equals(second))
+                self.assertFalse(first.equals(other))
+
+    def test_vectorized_matches_row_generator(self):
+        """Векторная генерация дает те же столбцы и значения из тех же диапазонов, что и построчная"""
+        for data_type in ReportGenerator.DATA_TYPES:
+            rows = ReportGenerator.create_report_dataframe_rows(data_type, 2000, seed=3)
+            vectorized = ReportGenerator.create_report_dataframe(data_type, 2000, seed=3)
+            self.assertEqual(list(vectorized.columns), list(rows.columns))
+
+            for column in rows.columns:
+                with self.subTest(data_type=data_type, column=column):
+                    expected, actual = rows[column], vectorized[column]
+                    if column == 'email':
+                        self.assertTrue(actual.astype(str).str.fullmatch(r'[а-я]+\d{1,4}@[a-z.]+').all())
+                    elif expected.dtype.kind in 'iufM':
+                        self.assertEqual(actual.dtype.kind, expected.dtype.kind)
+                        margin = (expected.max() - expected.min()) * 0.05
+                        self.assertGreaterEqual(actual.min(), expected.min() - margin)
+                        self.assertLessEqual(actual.max(), expected.max() + margin)
+                    else:
+                        self.assertEqual(set(actual.astype(str)), set(expected.astype(str)))
+
+    def test_frames_follow_schema(self):
+        for data_type in ReportGenerator.DATA_TYPES:
+            with self.subTest(data_type=data_type):
+                df = ReportGenerator.create_report_dataframe(data_type, 3000, seed=4)
+                schema = REPORT_SCHEMAS[data_type]
+                self.assertEqual(list(df.columns), list(schema))
+                self.assertEqual({column: str(dtype) for column, dtype in df.dtypes.items()},
+                                 {column: str(pd.Series(dtype=dtype).dtype) for column, dtype in schema.items()})
+
+                # Прежний построчный набор, приведенный к схеме, совпадает по типам и сокращается по памяти
+                rows = ReportGenerator.create_report_dataframe_rows(data_type, 3000, seed=4)
+                report = ReportGenerator.memory_report(rows, ReportGenerator.apply_schema(rows, data_type))
+                self.assertTrue(report['dtype_after'].iloc[:-1].equals(df.dtypes.astype(str)))
+                self.assertLess(report.loc['ИТОГО', 'ratio'], 0.5)
+
+    def test_sharded_generation(self):
+        """Части в процессах: результат не зависит от числа процессов, id сквозные, типы - по схеме"""
+        for data_type in ReportGenerator.DATA_TYPES:
+            with self.subTest(data_type=data_type):
+                one = ReportGenerator.create_report_dataframe_sharded(data_type, 2500, seed=6, workers=1, shard_rows=1000)
+                two = ReportGenerator.create_report_dataframe_sharded(data_type, 2500, seed=6, workers=2, shard_rows=1000)
+                self.assertTrue(one.equals(two))
+                self.assertEqual(one['id'].tolist(), list(range(1, 2501)))
+                self.assertTrue(one.dtypes.equals(ReportGenerator.create_report_dataframe(data_type, 10, seed=6).dtypes))
+                # У каждой части свой поток случайных чисел
+                column = one.columns[-1]
+                self.assertFalse(one[column].iloc[:1000].reset_index(drop=True).equals(
+                    one[column].iloc[1000:2000].reset_index(drop=True)))
+
+    def test_repeated_request_uses_cache(self):
+        first = ReportGenerator.get_report_dataframe('users', 100, 7)
+        with mock.patch.object(ReportGenerator, 'create_report_dataframe') as create:
+            second = ReportGenerator.get_report_dataframe('users', 100, 7)
+        create.assert_not_called()
+        self.assertTrue(first.equals(second))
+
+        # Изменение копии (как в фильтрах отчетов) не портит набор в кэше
+        second['last_online_date'] = second['last_online'].dt.date
+        self.assertNotIn('last_online_date', ReportGenerator.get_report_dataframe('users', 100, 7).columns)
+
+    def test_memory_cap_evicts_least_recently_used(self):
+        size = ReportGenerator.create_report_dataframe('users', 500, 1).memory_usage(deep=True).sum()
+        with override_settings(REPORT_DATASET_CACHE_MB=2.5 * size / 1024 / 1024):
+            ReportGenerator.get_report_dataframe('users', 500, 1)
+            ReportGenerator.get_report_dataframe('users', 500, 2)
+            ReportGenerator.get_report_dataframe('users', 500, 1)
+            ReportGenerator.get_report_dataframe('users', 500, 3)
+
+            keys, used = DatasetCache.info()
+        self.assertEqual([key[2] for key in keys], [1, 3])
+        self.assertLessEqual(used, 2.5 * size)
+
+    def test_put_measures_only_new_frame(self):
+        frames = [ReportGenerator.create_report_dataframe('users', 200, seed) for seed in range(3)]
+        sizes = [int(df.memory_usage(deep=True).sum()) for df in frames]
+        DatasetCache.put('a', frames[0])
+        DatasetCache.put('b', frames[1])
+
+        with mock.patch.object(pd.DataFrame, 'memory_usage', autospec=True,
+                               side_effect=pd.DataFrame.memory_usage) as memory_usage:
+            DatasetCache.put('a', frames[2])
+        self.assertEqual(memory_usage.call_count, 1)
+        self.assertEqual(DatasetCache.info(), (['b', 'a'], sizes[1] + sizes[2]))
+
+        with override_settings(REPORT_DATASET_CACHE_MB=sizes[2] / 1024 / 1024):
+            DatasetCache.put('c', frames[2])
+        self.assertEqual(DatasetCache.info(), (['c'], sizes[2]))
+
+    def test_filter_page_seed(self):
+        user = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(user)
+        data = {'filter_type': '1', 'data_type': 'users', 'count': '300', 'seed': '11'}
+
+        first = self.client.get(run_report_job(self, data).url)
+        first_rows = self.client.get(first.context['rows_url']).json()
+        second = self.client.get(run_report_job(self, data).url)
+        second_rows = self.client.get(second.context['rows_url']).json()
+
+        self.assertEqual(first.context['seed'], 11)
+        self.assertEqual(first_rows['rows'], second_rows['rows'])
+        self.assertEqual(len([key for key in DatasetCache.info()[0] if key[0] == 'users']), 1)
+
+
+# ============== ХРАНИЛИЩЕ РЕЗУЛЬТАТОВ ==============
+class ResultStoreTest(TestCase):
+    """Результаты фильтрации на диске: в сессии только токен, экспорт потоком"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = override_settings(REPORT_RESULTS_DIR=directory.name, REPORT_RESULTS_TTL=60)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_save_and_load(self):
+        df = ReportGenerator.create_report_dataframe('users', 100, seed=1)
+        token = ResultStore.save(df, name='Фильтр')
+
+        result = ResultStore.load(token)
+        self.assertEqual(result['meta'], {'name': 'Фильтр'})
+        self.assertTrue(result['df'].equals(df))
+        self.assertIsNone(ResultStore.load('../../etc/passwd'))
+        self.assertIsNone(ResultStore.load(None))
+
+    def test_types_survive_without_pickle(self):
+        df = pd.DataFrame({
+            'id': pd.array([3, 1], dtype='int32'),
+            'price': [1.5, float('nan')],
+            'flag': [True, False],
+            'day': pd.to_datetime(['2024-01-01', None]),
+            'status': pd.Categorical(['active', None], categories=['active', 'expired']),
+            'name': pd.array(['Анна', None], dtype='str'),
+        }, index=[10, 4])
+        token = ResultStore.save(df)
+
+        self.assertTrue(ResultStore.load(token)['df'].equals(df))
+        self.assertEqual(list(ResultStore.load(token)['df'].dtypes), list(df.dtypes))
+        self.assertEqual(list(ResultStore.load(token)['df'].index), [10, 4])
+        # Файл читается без pickle: объектные массивы не принимаются
+        with np.load(ResultStore.path(token), allow_pickle=False) as archive:
+            self.assertNotIn(object, [archive[name].dtype.type for name in archive.files])
+
+    @skipUnless(hasattr(os, 'getuid'), 'Права каталога проверяются только в POSIX')
+    def test_directory_is_private(self):
+        parent = tempfile.TemporaryDirectory()
+        self.addCleanup(parent.cleanup)
+        path = os.path.join(parent.name, 'results')
+
+        with override_settings(REPORT_RESULTS_DIR=path):
+            ResultStore.save(pd.DataFrame({'id': [1]}))
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+            self.assertEqual([os.stat(os.path.join(path, name)).st_mode & 0o777 for name in os.listdir(path)], [0o600])
+
+            # Каталог, открытый другим пользователям, не используется
+            os.chmod(path, 0o777)
+            with self.assertRaises(ImproperlyConfigured):
+                ResultStore.save(pd.DataFrame({'id': [1]}))
+
+    def test_expired_results_removed(self):
+        token = ResultStore.save(ReportGenerator.create_report_dataframe('users', 10, seed=1))
+        old = time_module.time() - 120
+        os.utime(ResultStore.path(token), (old, old))
+
+        self.assertIsNone(ResultStore.load(token))
+        self.assertFalse(ResultStore.path(token).exists())
+
+        stale = ResultStore.save(ReportGenerator.create_report_dataframe('users', 10, seed=2))
+        os.utime(ResultStore.path(stale), (old, old))
+        fresh = ResultStore.save(ReportGenerator.create_report_dataframe('users', 10, seed=3))
+        self.assertFalse(ResultStore.path(stale).exists())
+        self.assertTrue(ResultStore.path(fresh).exists())
+
+    def test_leftover_temp_files_removed(self):
+        # Процесс упал между записью временного файла и переименованием
+        directory = ResultStore.directory()
+        stale, fresh = directory / 'stale.tmp', directory / 'fresh.tmp'
+        stale.write_bytes(b'x')
+        fresh.write_bytes(b'x')
+        old = time_module.time() - 120
+        os.utime(stale, (old, old))
+
+        self.assertEqual(ResultStore.purge_expired(), 1)
+        self.assertEqual(os.listdir(directory), ['fresh.tmp'])
+
+        # Ошибка записи не оставляет временный файл
+        fresh.unlink()
+        with mock.patch('main.result_store.np.savez', side_effect=OSError):
+            with self.assertRaises(OSError):
+                ResultStore.save(pd.DataFrame({'id': [1]}))
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_filter_and_export(self):
+        user = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(user)
+        data = {'filter_type': '1', 'data_type': 'users', 'count': '12000', 'seed': '4'}
+
+        self.client.get(run_report_job(self, data).url)
+        self.assertNotIn('last_filter_df', self.client.session)
+        first_token = self.client.session['last_filter_token']
+        response = self.client.get(run_report_job(self, data).url)
+        # Прежний результат остается: его может листать другая вкладка
+        self.assertNotEqual(self.client.session['last_filter_token'], first_token)
+        first_job = ReportJobs.objects.get(result_token=first_token)
+        rows = self.client.get(reverse('report_job_rows', args=[first_job.pk]))
+        self.assertEqual(rows.status_code, 200)
+
+        # Файл результата удаляется вместе с заданием
+        with self.captureOnCommitCallbacks(execute=True):
+            first_job.delete()
+        self.assertFalse(ResultStore.exists(first_token))
+
+        export = self.client.get(reverse('export_filter_to_csv'))
+        self.assertTrue(export.streaming)
+        content = b''.join(export.streaming_content).decode('utf-8')
+        lines = content.splitlines()
+        self.assertTrue(lines[0].startswith('\ufeffid;name;age;wallet'))
+        self.assertEqual(len(lines) - 1, response.context['filtered_count'])
+
+    def test_export_without_result(self):
+        user = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(user)
+        response = self.client.get(reverse('export_filter_to_csv'))
+        self.assertRedirects(response, reverse('reports_filter'))
+
+
+# ============== ВЫГРУЗКА ТАБЛИЦ ==============
+class TableExportTest(TestCase):
+    """Потоковая выгрузка клиентов, абонементов и записей в CSV"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        cls.yoga = Services.objects.create(service_name='Йога', price=1000, duration=60)
+        cls.boxing = Services.objects.create(service_name='Бокс', price=1500, duration=60)
+        today = date.today()
+        for i in range(7):
+            client = Clients.objects.create(first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 200-00-{i:02d}')
+            service = cls.yoga if i % 2 else cls.boxing
+            Subscriptions.objects.create(
+                client=client, service=service, start_date=today - timedelta(days=i),
+                end_date=today + timedelta(days=30), price_paid=1000
+            )
+            Bookings.objects.create(
+                client=client, service=service, booking_date=today + timedelta(days=i),
+                start_time=time(10, 0), end_time=time(11, 0), status='completed' if i % 3 == 0 else 'scheduled'
+            )
+        Subscriptions.objects.filter(client__first_name__in=['Клиент5', 'Клиент6']).update(status='expired')
+
+    def export(self, table, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export_table', args=[table]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        return lines[0], [line.split(';') for line in lines[1:]]
+
+    def test_rows_continue_by_primary_key(self):
+        queryset = Bookings.objects.all()
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(TableExport.rows(queryset, ['booking_id', 'status'], chunk_size=3))
+        self.assertEqual([row[0] for row in rows], list(queryset.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual(len(queries), 3)
+
+    def test_export_filters(self):
+        today = date.today()
+        header, rows = self.export('bookings', status='completed')
+        self.assertEqual(header, '\ufeffID;Дата;Начало;Окончание;Фамилия;Имя;Услуга;Тренер;Зал;Статус')
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[-1] for row in rows}, {'Завершено'})
+
+        _, rows = self.export('bookings', start=today + timedelta(days=2), end=today + timedelta(days=4))
+        self.assertEqual([row[1] for row in rows], [str(today + timedelta(days=d)) for d in (2, 3, 4)])
+
+        _, rows = self.export('subscriptions', service=self.yoga.pk, status='active')
+        self.assertEqual([row[2] for row in rows], ['Клиент1', 'Клиент3'])
+
+        _, rows = self.export('clients', service=self.boxing.pk)
+        self.assertEqual(len(rows), 4)
+
+        # Неверные значения фильтров игнорируются
+        _, rows = self.export('subscriptions', status='unknown', start='вчера')
+        self.assertEqual(len(rows), 7)
+
+    def test_unknown_table_and_access(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('export_table', args=['users'])).status_code, 404)
+
+        client_user = Users.objects.create_user('client', 'client@example.com', 'password', role='client')
+        self.client.force_login(client_user)
+        self.assertNotEqual(self.client.get(reverse('export_table', args=['clients'])).status_code, 200)
+
+
+# ============== ФИЛЬТРЫ ОТЧЕТОВ ==============
+class FilterEngineTest(TestCase):
+    """Декларативные фильтры: одна маска вместо цепочки выборок"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = ReportGenerator.create_report_dataframe('users', 20000, seed=5)
+        # Пара строк для фильтров "сегодня" (возраст > 100 в генераторе не встречается)
+        today = pd.Timestamp(date.today())
+        cls.df.loc[0, ['age', 'last_online']] = [101, today]
+        cls.df.loc[1, ['age', 'birth_date']] = [30, today - pd.DateOffset(years=30)]
+
+    def expected(self, number):
+        """Прежние условия фильтров 1-9 (как в reports_filter до спецификаций)"""
+        df = self.df
+        today = pd.Timestamp(date.today())
+        return {
+            '1': lambda: df[df['wallet'] > 100000],
+            '2': lambda: df[(df['age'] >= 18) & (df['age'] <= 25) & (df['wallet'] > 125000)],
+            '3': lambda: df[(df['age'] > 50) & df['registration_date'].between('2018-01-01', '2023-01-01')],
+            '4': lambda: df[df['email'].str.contains('gmail') & (df['wallet'] > 50000) & df['is_subscribed']],
+            '5': lambda: df[(df['age'] == 18) & df['email'].str.contains('yahoo') & (df['wallet'] < 25000)],
+            '6': lambda: df[(df['age'] > 100) & (df['last_online'].dt.normalize() == today)],
+            '7': lambda: df[df['wallet'] > 100000].sort_values('registration_date', kind='stable').head(50),
+            '8': lambda: df[(df['birth_date'].dt.day == today.day) & (df['birth_date'].dt.month == today.month) & (df['age'] > 21)],
+            '9': lambda: df[df['is_subscribed'] & (df['total_spent'] > 400000) & (df['age'] > 25)]
+            .sort_values('registration_date', kind='stable').head(10),
+        }[number]()
+
+    def test_stored_filters(self):
+        for number, spec in STORED_FILTERS.items():
+            with self.subTest(filter=number):
+                result = FilterEngine.apply(self.df, spec)
+                self.assertEqual(result['id'].tolist(), self.expected(number)['id'].tolist())
+        self.assertEqual(len(FilterEngine.apply(self.df, STORED_FILTERS['6'])), 1)
+        self.assertEqual(len(FilterEngine.apply(self.df, STORED_FILTERS['8'])), 1)
+
+    def test_or_and_descending_sort(self):
+        spec = {
+            'where': {'or': [
+                {'field': 'city', 'op': 'eq', 'value': 'Казань'},
+                {'and': [{'field': 'age', 'op': 'lt', 'value': 20}, {'field': 'visits_count', 'op': 'gte', 'value': 150}]},
+            ]},
+            'sort': '-wallet',
+            'limit': 20,
+        }
+        df = self.df
+        expected = df[(df['city'] == 'Казань') | ((df['age'] < 20) & (df['visits_count'] >= 150))]
+        expected = expected.sort_values('wallet', ascending=False, kind='stable').head(20)
+        self.assertEqual(FilterEngine.apply(df, spec)['id'].tolist(), expected['id'].tolist())
+
+    def test_invalid_specs_raise(self):
+        invalid = [
+            {'where': {'field': 'salary', 'op': 'gt', 'value': 1}},
+            {'where': {'field': 'age', 'op': 'like', 'value': 1}},
+            {'where': {'field': 'city', 'op': 'gt', 'value': 'Казань'}},
+            {'where': {'field': 'age', 'op': 'on_date', 'value': 'today'}},
+            {'where': {'and': []}},
+            {'where': None, 'sort': 'salary'},
+        ]
+        for spec in invalid:
+            with self.subTest(spec=spec):
+                with self.assertRaises(FilterSpecError):
+                    FilterEngine.apply(self.df, spec)
+
+    def test_apply_filters_dict(self):
+        result = ReportGenerator.apply_filters(self.df, {
+            'age': {'between': [30, 40]}, 'city': 'Москва', 'salary': {'gt': 1},
+        })
+        df = self.df
+        expected = df[df['age'].between(30, 40) & (df['city'] == 'Москва')]
+        self.assertEqual(result['id'].tolist(), expected['id'].tolist())
+
+
+# ============== ФИЛЬТРЫ ПО БАЗЕ ==============
+class QueryFilterTest(TestCase):
+    """Спецификации фильтров выполняются в SQL по реальным таблицам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        cls.service = Services.objects.create(service_name='Йога', price=1000, duration=60)
+        today = date.today()
+        # Возрасты вокруг границ: день рождения вчера, сегодня и завтра
+        cls.clients = []
+        for i, years in enumerate([17, 18, 25, 26, 50, 51, 60]):
+            for shift in (-1, 0, 1):
+                cls.clients.append(Clients.objects.create(
+                    first_name=f'Клиент{i}{shift + 1}', last_name=f'Фамилия{len(cls.clients):02d}',
+                    phone=f'+7 (000) 300-{i:02d}-{shift + 1:02d}',
+                    email=f'c{i}{shift + 1}@{"gmail.com" if i % 2 else "mail.ru"}',
+                    birth_date=years_ago(years) + timedelta(days=shift),
+                ))
+        for price, client in zip([500, 12000, 3000], cls.clients[:3]):
+            Subscriptions.objects.create(
+                client=client, service=cls.service, start_date=today - timedelta(days=20),
+                end_date=today + timedelta(days=5), price_paid=price
+            )
+        Subscriptions.objects.create(
+            client=cls.clients[0], service=cls.service, start_date=today - timedelta(days=60),
+            end_date=today - timedelta(days=30), price_paid=700
+        )
+
+    @staticmethod
+    def age(born):
+        today = date.today()
+        return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+    def ids(self, spec):
+        return [row['client_id'] for row in QueryFilter.queryset(spec)]
+
+    def test_age_conditions_match_python(self):
+        for op, value, check in [
+            ('eq', 18, lambda age: age == 18),
+            ('ne', 18, lambda age: age != 18),
+            ('gt', 50, lambda age: age > 50),
+            ('gte', 50, lambda age: age >= 50),
+            ('lt', 18, lambda age: age < 18),
+            ('lte', 25, lambda age: age <= 25),
+            ('between', [18, 25], lambda age: 18 <= age <= 25),
+            ('in', [17, 60], lambda age: age in (17, 60)),
+        ]:
+            with self.subTest(op=op, value=value):
+                spec = {'table': 'clients', 'where': {'field': 'age', 'op': op, 'value': value}}
+                expected = [client.pk for client in self.clients if check(self.age(client.birth_date))]
+                self.assertEqual(self.ids(spec), expected)
+
+    def test_annotations_or_and_limit(self):
+        spec = {'table': 'clients', 'where': {'field': 'total_spent', 'op': 'gt', 'value': 0}, 'sort': '-total_spent'}
+        rows = list(QueryFilter.queryset(spec))
+        self.assertEqual([row['total_spent'] for row in rows], [12000, 3000, 1200])
+        self.assertTrue(all(row['is_subscribed'] for row in rows))
+
+        spec = {'table': 'clients', 'limit': 2, 'sort': 'age', 'where': {'or': [
+            {'field': 'is_subscribed', 'op': 'eq', 'value': True},
+            {'field': 'age', 'op': 'gte', 'value': 60},
+        ]}}
+        # Сортировка по возрасту - по дате рождения в обратном порядке
+        self.assertEqual(self.ids(spec), [self.clients[2].pk, self.clients[1].pk])
+
+        spec = {'table': 'subscriptions', 'where': {'and': [
+            {'field': 'status', 'op': 'eq', 'value': 'active'},
+            {'field': 'end_date', 'op': 'between', 'value': ['today', 'today+7']},
+        ]}}
+        self.assertEqual(QueryFilter.queryset(spec).count(), 3)
+        self.assertEqual(QueryFilter.queryset(DB_FILTERS['subscriptions_expensive']).get()['price_paid'], 12000)
+
+    def test_invalid_specs_raise(self):
+        for spec in [
+            {'table': 'clients', 'where': {'field': 'salary', 'op': 'gt', 'value': 1}},
+            {'table': 'clients', 'where': {'field': 'age', 'op': 'like', 'value': 1}},
+            {'table': 'clients', 'where': {'field': 'age', 'op': 'gt', 'value': 'много'}},
+            {'table': 'clients', 'where': {'or': []}},
+            {'table': 'bookings', 'where': None, 'sort': 'wallet'},
+        ]:
+            with self.subTest(spec=spec):
+                with self.assertRaises(FilterSpecError):
+                    QueryFilter.queryset(spec)
+
+    def test_view_loads_one_page(self):
+        self.client.force_login(self.admin)
+        for key in DB_FILTERS:
+            with self.subTest(filter=key):
+                self.assertEqual(self.client.get(reverse('reports_filter_db'), {'filter': key}).status_code, 200)
+
+        with mock.patch.dict(DB_FILTERS, {'all': {'table': 'clients', 'name': 'Все', 'where': None}}):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('reports_filter_db'), {'filter': 'all'})
+        page = response.context['page_obj']
+        self.assertEqual(page.paginator.count, len(self.clients))
+        self.assertContains(response, 'Фамилия00')
+        # Один COUNT и одна выборка страницы, а не вся таблица
+        client_queries = [q['sql'] for q in queries.captured_queries if '"Clients"' in q['sql']]
+        self.assertEqual(len(client_queries), 2)
+        self.assertIn('LIMIT', client_queries[-1])
+
+
+# ============== ФОНОВЫЕ ОТЧЕТЫ ==============
+class ReportJobTest(TestCase):
+    """Отчеты строятся заданиями вне запроса; страница опрашивает статус и забирает результат"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(REPORT_RESULTS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(self.admin)
+        self.data = {'filter_type': '1', 'data_type': 'users', 'count': '5000', 'seed': '3'}
+
+    def submit(self, data=None, execute=True):
+        with mock.patch.object(ReportJobRunner, 'executor', return_value=ImmediateExecutor()):
+            with self.captureOnCommitCallbacks(execute=execute):
+                return self.client.post(reverse('report_job_submit'), data or self.data)
+
+    def test_submit_status_result(self):
+        with mock.patch.object(ReportJobRunner, 'run') as run:
+            response = self.submit()
+        run.assert_called_once()
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'queued')
+
+        ReportJobRunner.run(job['id'])
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual((status['status'], status['progress'], status['finished']), ('done', 100, True))
+
+        result = self.client.get(job['result_url']).json()
+        df = ReportGenerator.create_report_dataframe('users', 5000, seed=3)
+        self.assertEqual(result['filtered_count'], FilterEngine.apply(df, STORED_FILTERS['1']).shape[0])
+        self.assertEqual(result['total_count'], 5000)
+        self.assertIn('Экспорт в CSV', result['html'])
+        self.assertEqual(self.client.session['last_filter_token'], ReportJobs.objects.get().result_token)
+
+        # Задание выполняется только один раз, чужие задания не видны
+        ReportJobRunner.run(job['id'])
+        self.assertEqual(ReportJobs.objects.get().progress, 100)
+        other = Users.objects.create_user('manager', 'manager@example.com', 'password', role='manager')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(job['status_url']).status_code, 404)
+        self.assertEqual(self.client.get(job['result_url']).status_code, 404)
+
+    def test_filter_page_shows_progress_and_result(self):
+        response = self.client.post(reverse('reports_filter'), self.data)
+        job = ReportJobs.objects.get()
+        self.assertRedirects(response, f"{reverse('reports_filter')}?job={job.pk}")
+
+        page = self.client.get(response.url)
+        self.assertContains(page, reverse('report_job_status', args=[job.pk]))
+        self.assertIsNone(page.context['rows_url'])
+
+        ReportJobRunner.run(job.pk)
+        page = self.client.get(response.url)
+        self.assertEqual(page.context['rows_url'], reverse('report_job_rows', args=[job.pk]))
+        self.assertEqual(page.context['filter_name'], STORED_FILTERS['1']['name'])
+
+    def test_failed_job(self):
+        with mock.patch.dict(STORED_FILTERS, {'x': {'name': 'Ошибка', 'where': {'field': 'salary', 'op': 'gt', 'value': 1}}}):
+            job = self.submit(dict(self.data, filter_type='x')).json()
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'failed')
+        self.assertIn('salary', status['message'])
+        self.assertEqual(self.client.get(job['result_url']).status_code, 409)
+
+        with mock.patch.object(ReportGenerator, 'get_report_dataframe', side_effect=MemoryError):
+            with self.assertLogs('main.report_jobs', 'ERROR'):
+                job = self.submit().json()
+        self.assertEqual(self.client.get(job['status_url']).json()['message'], 'Не удалось построить отчет')
+
+    @override_settings(REPORT_MAX_ROWS=1000)
+    def test_count_clamped_with_notice(self):
+        job = self.submit(execute=False).json()
+        self.assertEqual(ReportJobs.objects.get(pk=job['id']).count, 1000)
+        self.assertIn('5000', job['notice'])
+
+        job = self.submit(dict(self.data, count='800'), execute=False).json()
+        self.assertEqual(ReportJobs.objects.get(pk=job['id']).count, 800)
+        self.assertIsNone(job['notice'])
+
+        ReportJobs.objects.all().delete()
+        response = self.client.post(reverse('reports_filter'), self.data, follow=True)
+        self.assertEqual(ReportJobs.objects.get().count, 1000)
+        self.assertContains(response, 'Запрошено строк: 5000')
+
+    @override_settings(REPORT_JOB_MAX_ACTIVE=2, REPORT_JOB_TIMEOUT=60)
+    def test_active_limit_and_stale_jobs(self):
+        for _ in range(2):
+            self.assertEqual(self.submit(execute=False).status_code, 202)
+        self.assertEqual(self.submit(execute=False).status_code, 429)
+
+        # Задания, застрявшие после перезапуска процесса, не держат очередь
+        ReportJobs.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.submit(execute=False).status_code, 202)
+        self.assertEqual(ReportJobs.objects.filter(status='failed', message='Задание прервано').count(), 2)
+
+    @override_settings(REPORT_JOB_TIMEOUT=60)
+    def test_running_jobs_expire_by_start(self):
+        long_ago = timezone.now() - timedelta(minutes=5)
+        queued = ReportJobs.objects.create(user=self.admin, data_type='users', count=10, seed=1)
+        started = ReportJobs.objects.create(
+            user=self.admin, data_type='users', count=10, seed=1, status='running', started_at=timezone.now()
+        )
+        stuck = ReportJobs.objects.create(
+            user=self.admin, data_type='users', count=10, seed=1, status='running', started_at=long_ago
+        )
+        ReportJobs.objects.update(created_at=long_ago)
+
+        self.assertEqual(ReportJobRunner.expire_stale(), 2)
+        statuses = dict(ReportJobs.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            (statuses[queued.pk], statuses[started.pk], statuses[stuck.pk]), ('failed', 'running', 'failed')
+        )
+
+    @override_settings(REPORT_RESULTS_TTL=60)
+    def test_old_finished_jobs_purged(self):
+        old = ReportJobs.objects.create(user=self.admin, data_type='users', count=100, seed=1)
+        ReportJobRunner.run(old.pk)
+        old.refresh_from_db()
+        path = ResultStore.path(old.result_token)
+        recent = ReportJobs.objects.create(user=self.admin, data_type='users', count=100, seed=1)
+        ReportJobRunner.run(recent.pk)
+        long_ago = timezone.now() - timedelta(minutes=5)
+        ReportJobs.objects.create(
+            user=self.admin, data_type='users', count=10, seed=1, status='failed', finished_at=long_ago
+        )
+        queued = ReportJobs.objects.create(user=self.admin, data_type='users', count=10, seed=1)
+        ReportJobs.objects.filter(pk=old.pk).update(finished_at=long_ago)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ReportJobRunner.expire_stale()
+
+        self.assertEqual(set(ReportJobs.objects.values_list('pk', flat=True)), {recent.pk, queued.pk})
+        self.assertFalse(path.exists())
+
+    def test_expired_job_is_not_overwritten(self):
+        job = ReportJobs.objects.create(user=self.admin, data_type='users', count=100, seed=1)
+        generate = ReportGenerator.get_report_dataframe
+
+        def expire_during_run(*args):
+            ReportJobs.objects.filter(pk=job.pk).update(status='failed', message='Задание прервано')
+            return generate(*args)
+
+        with mock.patch.object(ReportGenerator, 'get_report_dataframe', side_effect=expire_during_run):
+            ReportJobRunner.run(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message, job.result_token), ('failed', 'Задание прервано', ''))
+        self.assertEqual(os.listdir(ResultStore.directory()), [])
+
+    @override_settings(REPORT_SHARD_MIN_ROWS=3000)
+    def test_large_job_generated_in_processes(self):
+        DatasetCache.clear()
+        self.addCleanup(DatasetCache.clear)
+        small = ReportJobs.objects.create(user=self.admin, data_type='users', count=2000, seed=1)
+        large = ReportJobs.objects.create(user=self.admin, data_type='users', count=5000, seed=1)
+        sharded = mock.patch.object(
+            ReportGenerator, 'create_report_dataframe_sharded',
+            wraps=ReportGenerator.create_report_dataframe_sharded
+        )
+        with sharded as create_sharded:
+            ReportJobRunner.run(small.pk)
+            create_sharded.assert_not_called()
+            ReportJobRunner.run(large.pk)
+        create_sharded.assert_called_once_with('users', 5000, 1)
+        large.refresh_from_db()
+        self.assertEqual((large.status, large.total_count), ('done', 5000))
+
+    def test_queued_jobs_recovered_by_new_pool(self):
+        job = ReportJobs.objects.create(user=self.admin, data_type='users', count=100, seed=1)
+        self.assertEqual(ReportJobRunner.recover(ImmediateExecutor()), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+
+
+class ReportJobThreadTest(FileDatabaseTestCase):
+    """Задание выполняется в потоке пула, пока запрос уже вернул ответ"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(REPORT_RESULTS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_job_runs_in_pool(self):
+        user = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        job = ReportJobRunner.submit(user, 'bookings', 20000, 1, '')
+        deadline = time_module.monotonic() + 30
+        while time_module.monotonic() < deadline:
+            job.refresh_from_db()
+            if job.is_finished:
+                break
+            time_module.sleep(0.05)
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.total_count, 20000)
+        self.assertIsNotNone(ResultStore.load(job.result_token))
+
+
+# ============== ТАБЛИЦА РЕЗУЛЬТАТА ==============
+class ResultTableTest(TestCase):
+    """Результат отчета отдается страницами JSON с сортировкой и форматированием на сервере"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(REPORT_RESULTS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        DatasetCache.clear()
+        self.addCleanup(DatasetCache.clear)
+
+        self.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(self.admin)
+        self.df = ReportGenerator.create_report_dataframe('users', 1234, seed=2)
+        self.job = ReportJobs.objects.create(
+            user=self.admin, data_type='users', count=1234, seed=2, status='done', progress=100,
+            result_token=ResultStore.save(self.df), filtered_count=1234, total_count=1234
+        )
+        self.url = reverse('report_job_rows', args=[self.job.pk])
+
+    def test_pages_and_sorting(self):
+        data = self.client.get(self.url, {'page': 3, 'per_page': 100}).json()
+        self.assertEqual((data['page'], data['num_pages'], data['total']), (3, 13, 1234))
+        self.assertEqual(data['columns'], list(self.df.columns))
+        self.assertEqual([row[0] for row in data['rows']], [str(i) for i in range(201, 301)])
+
+        last = self.client.get(self.url, {'page': 99, 'per_page': 100}).json()
+        self.assertEqual((last['page'], len(last['rows'])), (13, 34))
+
+        data = self.client.get(self.url, {'sort': 'wallet', 'order': 'desc', 'per_page': 5}).json()
+        expected = self.df.sort_values('wallet', ascending=False, kind='stable').head(5)
+        self.assertEqual([row[0] for row in data['rows']], expected['id'].astype(str).tolist())
+        self.assertEqual([row[3] for row in data['rows']], [f'{value:.2f}' for value in expected['wallet']])
+
+        # Категории - по алфавиту значений
+        data = self.client.get(self.url, {'sort': 'city', 'per_page': 500}).json()
+        cities = [row[list(self.df.columns).index('city')] for row in data['rows']]
+        self.assertEqual(cities, sorted(cities))
+
+    def test_sort_order_is_cached(self):
+        self.client.get(self.url, {'sort': 'age'})
+        with mock.patch.object(ResultStore, 'load') as load, \
+                mock.patch.object(ResultTable, 'sort_keys') as sort_keys:
+            self.client.get(self.url, {'sort': 'age', 'page': 2})
+        load.assert_not_called()
+        sort_keys.assert_not_called()
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url, {'sort': 'salary'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'page': 'два'}).status_code, 400)
+
+        ResultStore.delete(self.job.result_token)
+        self.assertEqual(self.client.get(self.url).status_code, 410)
+
+        ReportJobs.objects.filter(pk=self.job.pk).update(status='running')
+        self.assertEqual(self.client.get(self.url).status_code, 409)
+
+    def test_format_frame(self):
+        df = pd.DataFrame({
+            'price': [1.5, None],
+            'day': pd.to_datetime(['2024-01-01', None]),
+            'moment': pd.to_datetime(['2024-01-01 10:30', '2024-01-02 00:00']),
+            'status': pd.Categorical(['active', None]),
+            'name': ['<b>Анна</b>', None],
+        })
+        self.assertEqual(ReportGenerator.format_frame(df).to_numpy().tolist(), [
+            ['1.50', '2024-01-01', '2024-01-01 10:30:00', 'active', '<b>Анна</b>'],
+            ['', '', '2024-01-02 00:00:00', '', ''],
+        ])
+        html = ReportGenerator.dataframe_to_html(df)
+        self.assertIn('&lt;b&gt;Анна&lt;/b&gt;', html)
+        self.assertEqual(df['price'].iloc[0], 1.5)
+
+# ============== СНИМОК ТЕСТОВЫХ ДАННЫХ ==============
+class BaselineSnapshotTest(TestCase):
+    """Страница сравнения читает сохраненный снимок и не генерирует данные"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = Users.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_login(self.admin)
+
+    def test_command_builds_snapshot_for_today(self):
+        call_command('build_report_baseline', rows=500, seed=3, stdout=open(os.devnull, 'w'))
+        snapshot = ReportBaselines.objects.get()
+        self.assertEqual((snapshot.day, snapshot.count, snapshot.seed), (timezone.localdate(), 500, 3))
+
+        df = ReportGenerator.create_report_dataframe('users', 500, 3)
+        self.assertEqual(snapshot.stats, BaselineSnapshot.stats(df))
+        self.assertEqual(snapshot.stats['total_count'], 500)
+
+        # Повторный запуск в тот же день заменяет снимок
+        call_command('build_report_baseline', rows=200, seed=3, stdout=open(os.devnull, 'w'))
+        self.assertEqual(ReportBaselines.objects.get().count, 200)
+        self.assertEqual(BaselineSnapshot.latest()['count'], 200)
+
+    def test_page_uses_snapshot(self):
+        BaselineSnapshot.build(count=300, seed=1)
+        Clients.objects.create(first_name='Анна', last_name='Иванова', phone='+7 (000) 000-00-01', birth_date=date(1990, 1, 1))
+
+        with mock.patch.object(ReportGenerator, 'create_report_dataframe') as generate:
+            response = self.client.get(reverse('reports_comparison'))
+            generate.assert_not_called()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['baseline']['count'], 300)
+        self.assertEqual(response.context['comparison'][0], ('Количество', 1, 300))
+        self.assertEqual(len(response.context['periods']), 2)
+
+    def test_page_without_snapshot_shows_notice(self):
+        with mock.patch.object(ReportGenerator, 'create_report_dataframe') as generate:
+            response = self.client.get(reverse('reports_comparison'))
+            generate.assert_not_called()
+
+        self.assertIsNone(BaselineSnapshot.latest())
+        self.assertEqual(ReportBaselines.objects.count(), 0)
+        self.assertContains(response, 'build_report_baseline')
+        self.assertIsNone(response.context['comparison'])
+
+    def test_active_subscription_definition(self):
+        service = Services.objects.create(service_name='Йога', price=1000, duration=90)
+        today = date.today()
+        for i, end_date in enumerate([today, today - timedelta(days=1)]):
+            client = Clients.objects.create(first_name=f'Клиент{i}', last_name='Тест', phone=f'+7 (000) 000-00-{i:02d}')
+            subscription = Subscriptions.objects.create(
+                client=client, service=service, start_date=today - timedelta(days=30), end_date=end_date, price_paid=1000
+            )
+        # Статус active, но срок уже истек: не действующий ни в статистике, ни в фильтрах
+        Subscriptions.objects.filter(pk=subscription.pk).update(status='active')
+
+        stats = ReportGenerator.get_real_data_stats()
+        self.assertEqual(stats['subscriptions']['active_clients'], 1)
+        subscribed = QueryFilter.queryset({
+            'table': 'clients', 'name': 'С абонементом', 'where': {'field': 'is_subscribed', 'op': 'eq', 'value': True},
+        })
+        self.assertEqual(len(subscribed), 1)
+
+
+# ============== СРАВНЕНИЕ ПЕРИОДОВ ==============
+class PeriodComparisonTest(TestCase):
+    """Месяц и год сравниваются с теми же днями прошлого периода по DailyMetrics"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_periods(self):
+        periods = PeriodComparison.periods(date(2024, 3, 31))
+        self.assertEqual(periods[0][1:], ((date(2024, 3, 1), date(2024, 3, 31)), (date(2024, 2, 1), date(2024, 2, 29))))
+        periods = PeriodComparison.periods(date(2024, 2, 29))
+        self.assertEqual(periods[1][1:], ((date(2024, 1, 1), date(2024, 2, 29)), (date(2023, 1, 1), date(2023, 2, 28))))
+
+    def test_compare_in_one_query(self):
+        DailyMetrics.objects.bulk_create([
+            DailyMetrics(day=date(2024, 5, 3), revenue=1500, new_clients=3),
+            DailyMetrics(day=date(2024, 4, 2), revenue=1000, new_clients=2),
+            # После тех же дней прошлого месяца - не учитывается
+            DailyMetrics(day=date(2024, 4, 20), revenue=9000),
+            DailyMetrics(day=date(2023, 2, 1), revenue=500),
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            month, year = PeriodComparison.compare(date(2024, 5, 10))
+        self.assertEqual(len(queries), 1)
+
+        rows = {row['field']: row for row in month['rows']}
+        self.assertEqual((rows['revenue']['current'], rows['revenue']['previous']), (1500, 1000))
+        self.assertEqual(rows['revenue']['change'], 50.0)
+        self.assertEqual(rows['new_clients']['change'], 50.0)
+        self.assertIsNone(rows['new_subscriptions']['change'])
+
+        rows = {row['field']: row for row in year['rows']}
+        self.assertEqual((rows['revenue']['current'], rows['revenue']['previous']), (11500, 500))
+
+    def test_refresh_invalidates_cache(self):
+        today = timezone.localdate()
+        self.assertEqual(PeriodComparison.cached()[0]['rows'][0]['current'], 0)
+        DailyMetrics.objects.create(day=today, revenue=700)
+        self.assertEqual(PeriodComparison.cached()[0]['rows'][0]['current'], 0)
+
+        MetricsRollup.refresh_range(today - timedelta(days=400), today - timedelta(days=400))
+        self.assertEqual(PeriodComparison.cached()[0]['rows'][0]['current'], 700)
@@ -57,13 +57,20 @@ urlpatterns = [
     # ============== ДОПОЛНИТЕЛЬНЫЕ СТРАНИЦЫ ==============
     path('schedule/', views.schedule, name='schedule'),
     path('settings/', views.settings, name='settings'),
+    path('performance/', views.performance_stats, name='performance_stats'),
 
     # ============== ОТЧЕТЫ (НОВЫЕ) ==============
     path('reports/', views.reports_dashboard, name='reports_dashboard'),
     path('reports/filter/', views.reports_filter, name='reports_filter'),
+    path('reports/filter/db/', views.reports_filter_db, name='reports_filter_db'),
+    path('reports/jobs/', views.report_job_submit, name='report_job_submit'),
+    path('reports/jobs/<int:job_id>/', views.report_job_status, name='report_job_status'),
+    path('reports/jobs/<int:job_id>/result/', views.report_job_result, name='report_job_result'),
+    path('reports/jobs/<int:job_id>/rows/', views.report_job_rows, name='report_job_rows'),
     path('reports/statistics/', views.reports_statistics, name='reports_statistics'),
     path('reports/comparison/', views.reports_comparison, name='reports_comparison'),
     path('reports/export-csv/', views.export_filter_to_csv, name='export_filter_to_csv'),
+    path('export/<str:table>/', views.export_table, name='export_table'),
 
     # ============== API для AJAX ==============
     path('api/update-profile/', views.update_profile, name='update_profile'),
@@ -71,9 +78,11 @@ urlpatterns = [
     path('api/get-available-times/', views.get_available_times, name='get_available_times'),
     path('api/create-booking-ajax/', views.create_booking_ajax, name='create_booking_ajax'),
     path('api/get-client-info/<int:client_id>/', views.get_client_info, name='get_client_info'),
+    path('api/autocomplete/clients/', views.autocomplete_clients, name='autocomplete_clients'),
+    path('api/autocomplete/services/', views.autocomplete_services, name='autocomplete_services'),
 
     # ============== ВСПОМОГАТЕЛЬНЫЕ ==============
-    path('admin/link-client/<int:user_id>/', views.link_client_to_user, name='link_client_to_user'),
+    path('users/<int:user_id>/link-client/', views.link_client_to_user, name='link_client_to_user'),
     # Аутентификация
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
@@ -4,18 +4,29 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Sum, Avg, Count, Q, Min, Max
-from .models import Users, Clients, Trainers, Services, Subscriptions, Bookings
+from .models import Users, Clients, Trainers, Services, Subscriptions, Bookings, ReportJobs
 from .forms import UserRegisterForm, ClientForm, TrainerForm, ServiceForm, SubscriptionForm, UserProfileForm, \
-    BookingForm, QuickBookingForm
+    BookingForm, QuickBookingForm, LinkClientForm
 from .decorators import admin_required, manager_required, client_required, role_required
 from datetime import date, datetime, timedelta
-from django.http import JsonResponse, HttpResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 import json
-import random  # Импортируем random для генерации данных графиков
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
-from .report_generator import ReportGenerator
-import pandas as pd
+from .report_generator import BaselineSnapshot, ReportGenerator
+from .result_store import ResultStore
+from .result_table import ResultTable, ResultTableError
+from .exports import EXPORT_TABLES, TableExport
+from .report_filters import DB_FILTERS, FilterSpecError, QueryFilter
+from .report_jobs import ReportJobRunner, ReportJobLimitError
+from .booking_service import BookingService, BookingConflictError
+from .stats import DashboardStats
+from .metrics import MetricsRollup, PeriodComparison, RevenueSeries
+from .pagination import KeysetPaginator
+from .middleware import RequestStats
+from .search import ClientSearch, ServiceSearch
+from .autocomplete import Autocomplete
 
 
 # ============== АУТЕНТИФИКАЦИЯ ==============
@@ -49,11 +60,13 @@ def profile(request):
     # Получаем статистику в зависимости от роли
     if user.role == 'client':
         # Для клиентов ищем или создаем профиль
-        client_profile = get_or_create_client_profile(user)
+        client_profile = get_request_client_profile(request)
         if client_profile:
-            subscriptions = Subscriptions.objects.filter(client=client_profile)
+            subscriptions = Subscriptions.objects.filter(client=client_profile).select_related('service')
             active_subscriptions = subscriptions.filter(status='active')
-            bookings = Bookings.objects.filter(client=client_profile).order_by('-booking_date', '-start_time')[:5]
+            bookings = Bookings.objects.filter(client=client_profile).select_related(
+                'service', 'trainer'
+            ).order_by('-booking_date', '-start_time')[:5]
 
             context = {
                 'user': user,
@@ -129,6 +142,16 @@ def get_or_create_client_profile(user):
         return None
 
 
+def get_request_client_profile(request):
+    """
+    Профиль клиента текущего запроса. Определяется один раз (в client_required
+    или при первом обращении) и запоминается в request.client_profile.
+    """
+    if not hasattr(request, 'client_profile'):
+        request.client_profile = get_or_create_client_profile(request.user)
+    return request.client_profile
+
+
 # ============== ГЛАВНАЯ СТРАНИЦА ==============
 @login_required
 def index(request):
@@ -136,98 +159,51 @@ def index(request):
 
     # Для разных ролей разная статистика
     if user.role in ['admin', 'manager']:
-        # Базовая статистика
-        clients_count = Clients.objects.count()
-        trainers_count = Trainers.objects.count()
-        services_count = Services.objects.count()
-        subscriptions_count = Subscriptions.objects.count()
-
-        # Расширенная статистика для услуг
-        active_services = Services.objects.filter(is_active=True)
-        avg_price = active_services.aggregate(avg=Avg('price'))['avg'] or 0
-        avg_duration = active_services.aggregate(avg=Avg('duration'))['avg'] or 0
-        active_services_count = active_services.count()
-
-        # Статистика для тренеров
-        active_trainers = Trainers.objects.filter(is_active=True)
-        avg_experience = active_trainers.aggregate(avg=Avg('experience_years'))['avg'] or 0
-        active_trainers_count = active_trainers.count()
+        # Сводная статистика из кэша (сбрасывается сигналами при изменении данных)
+        client_stats = DashboardStats.cached('clients')
+        trainer_stats = DashboardStats.cached('trainers')
+        service_stats = DashboardStats.cached('services')
+        subscription_stats = DashboardStats.cached('subscriptions')
+        booking_stats = DashboardStats.cached('bookings')
 
         # Популярные специализации тренеров
-        specializations = Trainers.objects.values('specialization').annotate(
-            count=Count('specialization')
-        ).order_by('-count')[:5]
-
-        # Статистика для клиентов
-        clients_with_email = Clients.objects.exclude(email='').exclude(email__isnull=True).count()
-        email_percentage = (clients_with_email / clients_count * 100) if clients_count > 0 else 0
-
-        # Средний возраст клиентов
-        today = date.today()
-        clients_with_birthdate = Clients.objects.exclude(birth_date__isnull=True)
-
-        total_age = 0
-        count_age = 0
-        for client in clients_with_birthdate:
-            if client.birth_date:
-                age = today.year - client.birth_date.year - (
-                        (today.month, today.day) < (client.birth_date.month, client.birth_date.day)
-                )
-                total_age += age
-                count_age += 1
-
-        avg_age = round(total_age / count_age, 1) if count_age > 0 else 0
-
-        # Статистика для записей на занятия
-        today_bookings = Bookings.objects.filter(booking_date=today, status='scheduled').count()
-        upcoming_bookings = Bookings.objects.filter(
-            booking_date__gte=today,
-            status='scheduled'
-        ).count()
-        completed_bookings = Bookings.objects.filter(status='completed').count()
-        cancelled_bookings = Bookings.objects.filter(status='cancelled').count()
-        total_bookings = Bookings.objects.count()
-
-        # Общая выручка
-        total_revenue = Subscriptions.objects.aggregate(total=Sum('price_paid'))['total'] or 0
+        specializations = trainer_stats['specializations'][:5]
 
         # Популярные услуги
-        popular_services = Services.objects.annotate(
-            sub_count=Count('subscriptions')
-        ).order_by('-sub_count')[:3]
+        popular_services = DashboardStats.cached('popular_services')
 
         # Последние записи
         recent_bookings = Bookings.objects.select_related('client', 'service', 'trainer').order_by('-created_at')[:5]
 
         stats = {
-            'clients_count': clients_count,
-            'trainers_count': trainers_count,
-            'services_count': services_count,
-            'subscriptions_count': subscriptions_count,
+            'clients_count': client_stats['total'],
+            'trainers_count': trainer_stats['total'],
+            'services_count': service_stats['total'],
+            'subscriptions_count': subscription_stats['total'],
             'recent_clients': Clients.objects.order_by('-created_at')[:5],
-            'active_subscriptions': Subscriptions.objects.filter(status='active')[:5],
-            'total_revenue': total_revenue,
-            'today_bookings': today_bookings,
+            'active_subscriptions': Subscriptions.objects.filter(status='active').select_related('client', 'service')[:5],
+            'total_revenue': subscription_stats['total_revenue'],
+            'today_bookings': booking_stats['today_scheduled'],
 
             # Расширенная статистика
-            'active_services_count': active_services_count,
-            'avg_price': avg_price,
-            'avg_duration': avg_duration,
-            'active_trainers_count': active_trainers_count,
-            'avg_experience': avg_experience,
-            'specializations': list(specializations),
-            'clients_with_email': clients_with_email,
-            'email_percentage': round(email_percentage, 1),
-            'avg_age': avg_age,
-            'upcoming_bookings': upcoming_bookings,
-            'completed_bookings': completed_bookings,
-            'cancelled_bookings': cancelled_bookings,
-            'total_bookings': total_bookings,
+            'active_services_count': service_stats['active'],
+            'avg_price': service_stats['avg_price'],
+            'avg_duration': service_stats['avg_duration'],
+            'active_trainers_count': trainer_stats['active'],
+            'avg_experience': trainer_stats['avg_experience'],
+            'specializations': specializations,
+            'clients_with_email': client_stats['with_email'],
+            'email_percentage': client_stats['email_percentage'],
+            'avg_age': client_stats['avg_age'],
+            'upcoming_bookings': booking_stats['upcoming_scheduled'],
+            'completed_bookings': booking_stats['completed'],
+            'cancelled_bookings': booking_stats['cancelled'],
+            'total_bookings': booking_stats['total'],
             'popular_services': popular_services,
             'recent_bookings': recent_bookings,
         }
     elif user.role == 'client':
-        client_profile = get_or_create_client_profile(user)
+        client_profile = get_request_client_profile(request)
         if client_profile:
             subscriptions = Subscriptions.objects.filter(client=client_profile)
             active_subscriptions = subscriptions.filter(status='active')
@@ -276,53 +252,31 @@ def index(request):
 def client_list(request):
     clients = Clients.objects.all()
 
-    search = request.GET.get('search', '')
+    # Поиск по индексу токенов (имя в любой раскладке, телефон цифрами, email), лучшие совпадения первыми
+    search = request.GET.get('search', '').strip()
+    ordering = ['-created_at']
     if search:
-        clients = clients.filter(
-            Q(first_name__icontains=search) |
-            Q(last_name__icontains=search) |
-            Q(phone__icontains=search) |
-            Q(email__icontains=search)
-        )
+        clients = ClientSearch.filter(clients, search)
+        ordering = ['-search_rank', '-created_at']
 
-    paginator = Paginator(clients, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Статистика для клиентов (из кэша)
+    client_stats = DashboardStats.cached('clients')
+    total_clients = clients.count() if search else client_stats['total']
 
-    # Статистика для клиентов
-    total_clients = clients.count()
-    clients_with_email = Clients.objects.exclude(email='').exclude(email__isnull=True).count()
+    paginator = KeysetPaginator(clients, 10, ordering, count=total_clients)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    clients_with_email = client_stats['with_email']
     email_percentage = (clients_with_email / total_clients * 100) if total_clients > 0 else 0
 
-    # Средний возраст клиентов
-    today = date.today()
-    clients_with_birthdate = Clients.objects.exclude(birth_date__isnull=True)
-
-    total_age = 0
-    count_age = 0
-    for client in clients_with_birthdate:
-        if client.birth_date:
-            age = today.year - client.birth_date.year - (
-                    (today.month, today.day) < (client.birth_date.month, client.birth_date.day)
-            )
-            total_age += age
-            count_age += 1
-
-    avg_age = round(total_age / count_age, 1) if count_age > 0 else 0
-
-    # Статистика по регистрации
-    week_ago = timezone.now() - timedelta(days=7)
-    new_clients_week = Clients.objects.filter(created_at__gte=week_ago).count()
-
     context = {
         'clients': page_obj,
         'search_query': search,
         'total_clients': total_clients,
         'clients_with_email': clients_with_email,
         'email_percentage': round(email_percentage, 1),
-        'avg_age': avg_age,
-        'count_age': count_age,
-        'new_clients_week': new_clients_week,
+        'avg_age': client_stats['avg_age'],
+        'count_age': client_stats['with_birthdate'],
+        'new_clients_week': client_stats['new_week'],
     }
     return render(request, 'clients/list.html', context)
 
@@ -354,9 +308,11 @@ def client_detail(request, pk):
     client = get_object_or_404(Clients, pk=pk)
 
     # Получаем абонементы клиента
-    subscriptions = Subscriptions.objects.filter(client=client)
+    subscriptions = Subscriptions.objects.filter(client=client).select_related('service')
     # Получаем записи на занятия клиента
-    bookings = Bookings.objects.filter(client=client).order_by('-booking_date', '-start_time')
+    bookings = Bookings.objects.filter(client=client).select_related(
+        'service', 'trainer'
+    ).order_by('-booking_date', '-start_time')
 
     context = {
         'client': client,
@@ -426,35 +382,21 @@ def trainer_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
-    # Статистика для тренеров
-    total_trainers = trainers.count()
-    active_trainers = Trainers.objects.filter(is_active=True)
-    active_count = active_trainers.count()
-
-    # Средний стаж
-    avg_experience = active_trainers.aggregate(avg=Avg('experience_years'))['avg'] or 0
-
-    # Специализации
-    specializations = Trainers.objects.values('specialization').annotate(
-        count=Count('specialization')
-    ).order_by('-count')
-
-    # Популярные специализации (топ-3)
-    top_specializations = specializations[:3]
-
-    # Тренеры, нанятые за последнюю неделю
-    week_ago = timezone.now() - timedelta(days=7)
-    new_trainers_week = Trainers.objects.filter(created_at__gte=week_ago).count()
+    # Статистика для тренеров (из кэша)
+    trainer_stats = DashboardStats.cached('trainers')
+    total_trainers = trainers.count() if search else trainer_stats['total']
+    specializations = trainer_stats['specializations']
 
     context = {
         'trainers': page_obj,
         'search_query': search,
         'total_trainers': total_trainers,
-        'active_count': active_count,
-        'avg_experience': round(avg_experience, 1),
-        'specializations': list(specializations),
-        'top_specializations': list(top_specializations),
-        'new_trainers_week': new_trainers_week,
+        'active_count': trainer_stats['active'],
+        'avg_experience': round(trainer_stats['avg_experience'], 1),
+        'specializations': specializations,
+        # Популярные специализации (топ-3)
+        'top_specializations': specializations[:3],
+        'new_trainers_week': trainer_stats['new_week'],
     }
     return render(request, 'trainers/list.html', context)
 
@@ -486,7 +428,9 @@ def trainer_detail(request, pk):
     trainer = get_object_or_404(Trainers, pk=pk)
 
     # Получаем записи на занятия с этим тренером
-    bookings = Bookings.objects.filter(trainer=trainer).order_by('-booking_date', '-start_time')
+    bookings = Bookings.objects.filter(trainer=trainer).select_related(
+        'client', 'service'
+    ).order_by('-booking_date', '-start_time')
 
     context = {
         'trainer': trainer,
@@ -550,33 +494,20 @@ def service_list_admin(request):
             Q(description__icontains=search)
         )
 
-    # Статистика для услуг
-    total_services = services.count()
-    active_services = Services.objects.filter(is_active=True)
-    active_count = active_services.count()
-
-    # Средняя цена и длительность (только активные услуги)
-    avg_price = active_services.aggregate(avg=Avg('price'))['avg'] or 0
-    avg_duration = active_services.aggregate(avg=Avg('duration'))['avg'] or 0
-
-    # Самая дорогая и самая дешевая услуга
-    most_expensive = active_services.order_by('-price').first()
-    cheapest = active_services.order_by('price').first()
-
-    # Услуги, добавленные за последнюю неделю
-    week_ago = timezone.now() - timedelta(days=7)
-    new_services_week = Services.objects.filter(created_at__gte=week_ago).count()
+    # Статистика для услуг (из кэша)
+    service_stats = DashboardStats.cached('services')
+    total_services = services.count() if search else service_stats['total']
 
     context = {
         'services': services,
         'search_query': search,
         'total_services': total_services,
-        'active_count': active_count,
-        'avg_price': round(avg_price, 2),
-        'avg_duration': round(avg_duration, 1),
-        'most_expensive': most_expensive,
-        'cheapest': cheapest,
-        'new_services_week': new_services_week,
+        'active_count': service_stats['active'],
+        'avg_price': round(service_stats['avg_price'], 2),
+        'avg_duration': round(service_stats['avg_duration'], 1),
+        'most_expensive': service_stats['most_expensive'],
+        'cheapest': service_stats['cheapest'],
+        'new_services_week': service_stats['new_week'],
         'is_admin': True,
     }
     return render(request, 'services/list.html', context)
@@ -609,9 +540,11 @@ def service_detail_admin(request, pk):
     service = get_object_or_404(Services, pk=pk)
 
     # Получаем абонементы по этой услуге
-    subscriptions = Subscriptions.objects.filter(service=service)
+    subscriptions = Subscriptions.objects.filter(service=service).select_related('client')
     # Получаем записи на занятия по этой услуге
-    bookings = Bookings.objects.filter(service=service).order_by('-booking_date', '-start_time')
+    bookings = Bookings.objects.filter(service=service).select_related(
+        'client', 'trainer'
+    ).order_by('-booking_date', '-start_time')
 
     context = {
         'service': service,
@@ -664,13 +597,16 @@ def service_delete(request, pk):
 
 
 # ============== АБОНЕМЕНТЫ ==============
+SUBSCRIPTION_SORTS = ['-created_at', 'created_at', 'start_date', '-price_paid']
+
+
 @login_required
 def subscription_list(request):
     user = request.user
 
     if user.role == 'client':
         # Клиент видит только свои абонементы
-        client_profile = get_or_create_client_profile(user)
+        client_profile = get_request_client_profile(request)
         if client_profile:
             subscriptions = Subscriptions.objects.filter(client=client_profile)
         else:
@@ -678,6 +614,7 @@ def subscription_list(request):
     else:
         # Админы и менеджеры видят все абонементы
         subscriptions = Subscriptions.objects.all()
+    subscriptions = subscriptions.select_related('client', 'service')
 
     # Фильтрация
     status_filter = request.GET.get('status', '')
@@ -693,21 +630,28 @@ def subscription_list(request):
             Q(service__service_name__icontains=search)
         )
 
-    # Сортировка
+    # Сортировка (только по полям из списка: по ним строится курсор пагинации)
     sort_by = request.GET.get('sort', '-created_at')
-    subscriptions = subscriptions.order_by(sort_by)
-
-    # Статистика
-    total_count = subscriptions.count()
-    active_count = subscriptions.filter(status='active').count()
-    expired_count = subscriptions.filter(status='expired').count()
-    cancelled_count = subscriptions.filter(status='cancelled').count()
-    total_revenue = subscriptions.aggregate(total=Sum('price_paid'))['total'] or 0
+    if sort_by not in SUBSCRIPTION_SORTS:
+        sort_by = '-created_at'
+
+    # Статистика (одним запросом)
+    stats = subscriptions.aggregate(
+        total=Count('pk'),
+        active=Count('pk', filter=Q(status='active')),
+        expired=Count('pk', filter=Q(status='expired')),
+        cancelled=Count('pk', filter=Q(status='cancelled')),
+        revenue=Sum('price_paid'),
+    )
+    total_count = stats['total']
+    active_count = stats['active']
+    expired_count = stats['expired']
+    cancelled_count = stats['cancelled']
+    total_revenue = stats['revenue'] or 0
 
     # Пагинация
-    paginator = Paginator(subscriptions, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(subscriptions, 15, [sort_by], count=total_count)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     context = {
         'subscriptions': page_obj,
@@ -744,12 +688,12 @@ def subscription_create(request):
 
 @login_required
 def subscription_detail(request, pk):
-    subscription = get_object_or_404(Subscriptions, pk=pk)
+    subscription = get_object_or_404(Subscriptions.objects.select_related('client', 'service'), pk=pk)
     user = request.user
 
     # Проверка прав доступа для клиентов
     if user.role == 'client':
-        client_profile = get_or_create_client_profile(user)
+        client_profile = get_request_client_profile(request)
         if not client_profile or client_profile != subscription.client:
             messages.error(request, 'У вас нет прав для просмотра этого абонемента')
             return redirect('my_subscriptions')
@@ -805,13 +749,13 @@ def subscription_delete(request, pk):
 def my_subscriptions(request):
     """Показывает абонементы текущего клиента"""
     user = request.user
-    client_profile = get_or_create_client_profile(user)
+    client_profile = get_request_client_profile(request)
 
     if not client_profile:
         messages.error(request, 'Профиль клиента не найден')
         return redirect('profile')
 
-    subscriptions = Subscriptions.objects.filter(client=client_profile).order_by('-created_at')
+    subscriptions = Subscriptions.objects.filter(client=client_profile).select_related('service').order_by('-created_at')
 
     # Рассчитываем оставшиеся дни для активных абонементов
     today = date.today()
@@ -835,7 +779,7 @@ def my_subscriptions(request):
 def my_schedule(request):
     """Показывает расписание занятий клиента"""
     user = request.user
-    client_profile = get_or_create_client_profile(user)
+    client_profile = get_request_client_profile(request)
 
     if not client_profile:
         messages.error(request, 'Профиль клиента не найден')
@@ -845,21 +789,21 @@ def my_schedule(request):
     active_subscriptions = Subscriptions.objects.filter(
         client=client_profile,
         status='active'
-    )
+    ).select_related('service')
 
     # Получаем предстоящие записи клиента
     upcoming_bookings = Bookings.objects.filter(
         client=client_profile,
         booking_date__gte=date.today(),
         status='scheduled'
-    ).order_by('booking_date', 'start_time')
+    ).select_related('service', 'trainer').order_by('booking_date', 'start_time')
 
     # Получаем прошедшие записи клиента
     past_bookings = Bookings.objects.filter(
         client=client_profile,
         booking_date__lt=date.today(),
         status__in=['scheduled', 'completed', 'no_show']
-    ).order_by('-booking_date', '-start_time')[:10]
+    ).select_related('service', 'trainer').order_by('-booking_date', '-start_time')[:10]
 
     # Получаем записи на сегодня
     today_bookings = Bookings.objects.filter(
@@ -889,7 +833,7 @@ def my_schedule(request):
 def buy_subscription(request):
     """Покупка нового абонемента"""
     user = request.user
-    client_profile = get_or_create_client_profile(user)
+    client_profile = get_request_client_profile(request)
 
     if not client_profile:
         messages.error(request, 'Профиль клиента не найден')
@@ -932,7 +876,7 @@ def buy_subscription(request):
     active_subscriptions = Subscriptions.objects.filter(
         client=client_profile,
         status='active'
-    )
+    ).select_related('service')
 
     context = {
         'services': services,
@@ -948,7 +892,7 @@ def cancel_subscription(request, pk):
     """Отмена абонемента клиентом"""
     subscription = get_object_or_404(Subscriptions, pk=pk)
     user = request.user
-    client_profile = get_or_create_client_profile(user)
+    client_profile = get_request_client_profile(request)
 
     if not client_profile:
         messages.error(request, 'Профиль клиента не найден')
@@ -1025,7 +969,7 @@ def service_detail(request, pk):
     # Для клиентов показываем только их абонементы по этой услуге
     client_subscriptions = None
     if request.user.role == 'client':
-        client_profile = get_or_create_client_profile(request.user)
+        client_profile = get_request_client_profile(request)
         if client_profile:
             client_subscriptions = Subscriptions.objects.filter(
                 client=client_profile,
@@ -1047,7 +991,7 @@ def service_detail(request, pk):
 def book_training(request):
     """Запись на занятие"""
     user = request.user
-    client_profile = get_or_create_client_profile(user)
+    client_profile = get_request_client_profile(request)
 
     if not client_profile:
         messages.error(request, 'Профиль клиента не найден')
@@ -1056,21 +1000,28 @@ def book_training(request):
     if request.method == 'POST':
         form = BookingForm(request.POST, client=client_profile)
         if form.is_valid():
-            booking = form.save(commit=False)
-            booking.client = client_profile
+            data = form.cleaned_data
 
-            # Устанавливаем значение по умолчанию для room, если оно не указано
-            if not booking.room:
-                booking.room = 'hall1'
-
-            booking.status = 'scheduled'
-            booking.save()
-
-            messages.success(request,
-                             f'Вы успешно записались на занятие "{booking.service.service_name}" '
-                             f'{booking.booking_date.strftime("%d.%m.%Y")} в {booking.start_time.strftime("%H:%M")}!'
-                             )
-            return redirect('my_schedule')
+            try:
+                booking = BookingService.create_booking(
+                    client=client_profile,
+                    service=data['service'],
+                    trainer=data.get('trainer'),
+                    booking_date=data['booking_date'],
+                    start_time=data['start_time'],
+                    end_time=data['end_time'],
+                    # Устанавливаем значение по умолчанию для room, если оно не указано
+                    room=data.get('room') or 'hall1',
+                    notes=data.get('notes', '')
+                )
+            except BookingConflictError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request,
+                                 f'Вы успешно записались на занятие "{booking.service.service_name}" '
+                                 f'{booking.booking_date.strftime("%d.%m.%Y")} в {booking.start_time.strftime("%H:%M")}!'
+                                 )
+                return redirect('my_schedule')
         else:
             # Показываем ошибки формы
             for field, errors in form.errors.items():
@@ -1092,7 +1043,7 @@ def book_training(request):
     active_subscriptions = Subscriptions.objects.filter(
         client=client_profile,
         status='active'
-    )
+    ).select_related('service')
 
     # Если есть активные абонементы, помечаем соответствующие услуги
     if active_subscriptions.exists():
@@ -1114,14 +1065,14 @@ def book_training(request):
 def quick_book(request, service_id=None):
     """Быстрая запись на занятие"""
     user = request.user
-    client_profile = get_or_create_client_profile(user)
+    client_profile = get_request_client_profile(request)
 
     if not client_profile:
         messages.error(request, 'Профиль клиента не найден')
         return redirect('profile')
 
     if request.method == 'POST':
-        form = QuickBookingForm(request.POST)
+        form = QuickBookingForm(request.POST, client=client_profile)
         if form.is_valid():
             try:
                 booking = form.save(client_profile)
@@ -1131,6 +1082,8 @@ def quick_book(request, service_id=None):
                                  f'{booking.booking_date.strftime("%d.%m.%Y")} в {booking.start_time.strftime("%H:%M")}!'
                                  )
                 return redirect('my_schedule')
+            except BookingConflictError as e:
+                messages.error(request, str(e))
             except Exception as e:
                 messages.error(request, f'Ошибка при создании записи: {str(e)}')
         else:
@@ -1153,7 +1106,7 @@ def quick_book(request, service_id=None):
             except Services.DoesNotExist:
                 pass
 
-        form = QuickBookingForm(initial=initial_data)
+        form = QuickBookingForm(initial=initial_data, client=client_profile)
 
     # Получаем все активные услуги
     active_services = Services.objects.filter(is_active=True)
@@ -1161,13 +1114,13 @@ def quick_book(request, service_id=None):
     active_subscriptions = Subscriptions.objects.filter(
         client=client_profile,
         status='active'
-    )
+    ).select_related('service')
 
     today_bookings = Bookings.objects.filter(
         client=client_profile,
         booking_date=date.today(),
         status='scheduled'
-    )
+    ).select_related('service')
 
     # Получаем выбор залов из формы
     from .forms import ROOM_CHOICES
@@ -1190,7 +1143,7 @@ def cancel_booking(request, pk):
     """Отмена записи на занятие"""
     booking = get_object_or_404(Bookings, pk=pk)
     user = request.user
-    client_profile = get_or_create_client_profile(user)
+    client_profile = get_request_client_profile(request)
 
     if not client_profile:
         messages.error(request, 'Профиль клиента не найден')
@@ -1231,7 +1184,7 @@ def cancel_booking(request, pk):
 @role_required(['admin', 'manager'])
 def manage_bookings(request):
     """Управление записями для админов/менеджеров"""
-    bookings = Bookings.objects.all().order_by('-booking_date', '-start_time')
+    bookings = Bookings.objects.select_related('client', 'service', 'trainer')
 
     # Фильтрация
     status_filter = request.GET.get('status', '')
@@ -1257,36 +1210,13 @@ def manage_bookings(request):
             Q(trainer__full_name__icontains=search)
         )
 
-    paginator = Paginator(bookings, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    # Статистика для записей
-    total_bookings = Bookings.objects.count()
-
-    # Статистика по статусам
-    scheduled_count = Bookings.objects.filter(status='scheduled').count()
-    completed_count = Bookings.objects.filter(status='completed').count()
-    cancelled_count = Bookings.objects.filter(status='cancelled').count()
-    no_show_count = Bookings.objects.filter(status='no_show').count()
-
-    # Записи на сегодня
-    today = date.today()
-    today_bookings = Bookings.objects.filter(booking_date=today).count()
-
-    # Записи на завтра
-    tomorrow = today + timedelta(days=1)
-    tomorrow_bookings = Bookings.objects.filter(booking_date=tomorrow).count()
-
-    # Статистика по залам
-    room_stats = Bookings.objects.values('room').annotate(
-        count=Count('room')
-    ).order_by('-count')
+    # Статистика для записей (из кэша)
+    booking_stats = DashboardStats.cached('bookings')
+    filtered = status_filter or date_filter or search
+    total_count = bookings.count() if filtered else booking_stats['total']
 
-    # Популярные услуги для записи
-    popular_services_booking = Services.objects.annotate(
-        booking_count=Count('bookings')
-    ).order_by('-booking_count')[:3]
+    paginator = KeysetPaginator(bookings, 15, ['-booking_date', '-start_time'], count=total_count)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     context = {
         'bookings': page_obj,
@@ -1297,15 +1227,15 @@ def manage_bookings(request):
         'STATUS_CHOICES': Bookings.STATUS_CHOICES,
 
         # Статистика
-        'total_bookings': total_bookings,
-        'scheduled_count': scheduled_count,
-        'completed_count': completed_count,
-        'cancelled_count': cancelled_count,
-        'no_show_count': no_show_count,
-        'today_bookings': today_bookings,
-        'tomorrow_bookings': tomorrow_bookings,
-        'room_stats': list(room_stats),
-        'popular_services_booking': popular_services_booking,
+        'total_bookings': booking_stats['total'],
+        'scheduled_count': booking_stats['scheduled'],
+        'completed_count': booking_stats['completed'],
+        'cancelled_count': booking_stats['cancelled'],
+        'no_show_count': booking_stats['no_show'],
+        'today_bookings': booking_stats['today'],
+        'tomorrow_bookings': booking_stats['tomorrow'],
+        'room_stats': booking_stats['rooms'],
+        'popular_services_booking': DashboardStats.cached('popular_services_booking'),
     }
     return render(request, 'bookings/list.html', context)
 
@@ -1340,7 +1270,7 @@ def schedule(request):
     bookings = Bookings.objects.filter(
         booking_date__range=[today, week_later],
         status='scheduled'
-    ).order_by('booking_date', 'start_time')
+    ).select_related('client', 'service', 'trainer').order_by('booking_date', 'start_time')
 
     # Группируем по дням
     schedule_data = {}
@@ -1394,6 +1324,21 @@ def settings(request):
     return render(request, 'settings.html', context)
 
 
+@login_required
+@admin_required
+def performance_stats(request):
+    """Число запросов к БД и время ответа по страницам (только для админов)"""
+    if request.method == 'POST':
+        RequestStats.reset()
+        messages.success(request, 'Статистика производительности сброшена')
+        return redirect('performance_stats')
+
+    context = {
+        'stats': RequestStats.all(),
+    }
+    return render(request, 'performance.html', context)
+
+
 # ============== API для AJAX ==============
 @login_required
 def update_profile(request):
@@ -1492,6 +1437,37 @@ def get_available_times(request):
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+@login_required
+@role_required(['admin', 'manager'])
+def autocomplete_clients(request):
+    """Поиск клиентов для полей выбора (JSON, постранично)"""
+    query = request.GET.get('q', '').strip()
+    clients = Clients.objects.all()
+    ordering = ['-created_at']
+    if query:
+        clients = ClientSearch.filter(clients, query)
+        ordering = ['-search_rank', '-created_at']
+
+    return Autocomplete.response(
+        request, 'clients', clients, ordering,
+        lambda client: f'{client.full_name}, {client.phone}'
+    )
+
+
+@login_required
+def autocomplete_services(request):
+    """Поиск услуг по началу названия для полей выбора (JSON, постранично)"""
+    query = request.GET.get('q', '').strip()
+    services = Services.objects.all()
+    if query:
+        services = ServiceSearch.filter(services, query)
+
+    return Autocomplete.response(
+        request, 'services', services, ['service_name'],
+        lambda service: str(service) if service.is_active else f'{service} (неактивна)'
+    )
+
+
 # ============== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==============
 @login_required
 @role_required(['admin', 'manager'])
@@ -1500,23 +1476,21 @@ def link_client_to_user(request, user_id):
     user = get_object_or_404(Users, pk=user_id)
 
     if request.method == 'POST':
-        client_id = request.POST.get('client_id')
-        if client_id:
-            try:
-                client = Clients.objects.get(pk=client_id)
-                user.client_profile = client
-                user.save()
-                messages.success(request, f'Профиль клиента {client.full_name} привязан к пользователю {user.userName}')
-                return redirect('profile')
-            except Clients.DoesNotExist:
-                messages.error(request, 'Клиент не найден')
-
-    # Показываем форму выбора клиента
-    clients = Clients.objects.all()
+        form = LinkClientForm(request.POST)
+        if form.is_valid():
+            client = form.cleaned_data['client_id']
+            user.client_profile = client
+            user.save()
+            messages.success(request, f'Профиль клиента {client.full_name} привязан к пользователю {user.userName}')
+            return redirect('profile')
+        messages.error(request, 'Клиент не найден')
+    else:
+        # Клиент выбирается через автодополнение, весь список в страницу не выводится
+        form = LinkClientForm(initial={'client_id': user.client_profile_id})
 
     context = {
-        'user': user,
-        'clients': clients,
+        'linked_user': user,
+        'form': form,
     }
     return render(request, 'admin/link_client.html', context)
 
@@ -1535,7 +1509,7 @@ def link_client_profile(request):
         return redirect('my_subscriptions')
 
     if request.method == 'POST':
-        client_profile = get_or_create_client_profile(user)
+        client_profile = get_request_client_profile(request)
         if client_profile:
             messages.success(request, 'Профиль успешно создан! Теперь вы можете использовать все функции клиента.')
             return redirect('my_subscriptions')
@@ -1571,7 +1545,7 @@ def create_booking_ajax(request):
     """Создание записи на занятие через AJAX"""
     if request.method == 'POST' and request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         user = request.user
-        client_profile = get_or_create_client_profile(user)
+        client_profile = get_request_client_profile(request)
 
         if not client_profile:
             return JsonResponse({'success': False, 'error': 'Профиль клиента не найден'})
@@ -1583,6 +1557,7 @@ def create_booking_ajax(request):
             start_time = request.POST.get('start_time')
             end_time = request.POST.get('end_time')
             trainer_id = request.POST.get('trainer_id')
+            room = request.POST.get('room') or 'hall1'
 
             # Валидация данных
             if not all([service_id, booking_date, start_time, end_time]):
@@ -1598,30 +1573,18 @@ def create_booking_ajax(request):
             if trainer_id:
                 trainer = Trainers.objects.get(pk=trainer_id, is_active=True)
 
-            # Проверяем, нет ли уже записи на это время
-            existing_bookings = Bookings.objects.filter(
-                client=client_profile,
-                booking_date=booking_date_obj,
-                status='scheduled'
-            )
-
-            for booking in existing_bookings:
-                if (start_time_obj < booking.end_time and end_time_obj > booking.start_time):
-                    return JsonResponse({
-                        'success': False,
-                        'error': f'У вас уже есть запись на это время: {booking.start_time.strftime("%H:%M")} - {booking.end_time.strftime("%H:%M")}'
-                    })
+            if room not in dict(Bookings.ROOM_CHOICES):
+                return JsonResponse({'success': False, 'error': 'Неизвестный зал'})
 
-            # Создаем запись
-            booking = Bookings.objects.create(
+            # Создаем запись (проверка зала, тренера и клиента выполняется под блокировкой)
+            booking = BookingService.create_booking(
                 client=client_profile,
                 service=service,
                 trainer=trainer,
                 booking_date=booking_date_obj,
                 start_time=start_time_obj,
                 end_time=end_time_obj,
-                room='Зал 1',
-                status='scheduled',
+                room=room,
                 notes='Запись создана через форму на сайте'
             )
 
@@ -1632,6 +1595,8 @@ def create_booking_ajax(request):
                 'redirect_url': reverse('my_schedule')
             })
 
+        except BookingConflictError as e:
+            return JsonResponse({'success': False, 'error': str(e)})
         except Services.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Услуга не найдена или неактивна'})
         except Trainers.DoesNotExist:
@@ -1652,24 +1617,21 @@ def reports_dashboard(request):
     # Получаем реальную статистику
     real_stats = ReportGenerator.get_real_data_stats()
 
-    # Статистика за последний месяц
+    # Статистика за последний месяц (из дневных итогов DailyMetrics)
     month_ago = date.today() - timedelta(days=30)
-    new_clients_month = Clients.objects.filter(created_at__gte=month_ago).count()
-    new_subscriptions_month = Subscriptions.objects.filter(created_at__gte=month_ago).count()
+    month_totals = MetricsRollup.summary(start=month_ago)
+    new_clients_month = month_totals['new_clients']
+    new_subscriptions_month = month_totals['new_subscriptions']
 
     # Популярная услуга
-    popular_service = Services.objects.annotate(
-        sub_count=Count('subscriptions')
-    ).order_by('-sub_count').first()
+    popular_services = DashboardStats.cached('popular_services')
+    popular_service = popular_services[0] if popular_services else None
 
     # Выручка за месяц
-    month_revenue = Subscriptions.objects.filter(
-        created_at__gte=month_ago
-    ).aggregate(total=Sum('price_paid'))['total'] or 0
+    month_revenue = month_totals['revenue']
 
-    # Генерируем тестовые данные для демонстрации
-    test_users = ReportGenerator.generate_test_users(20)
-    test_users_df = pd.DataFrame(test_users)
+    # Тестовые данные для демонстрации (из кэша наборов)
+    test_users_df = ReportGenerator.get_report_dataframe('users', 20)
 
     context = {
         'real_stats': real_stats,
@@ -1686,114 +1648,207 @@ def reports_dashboard(request):
 @login_required
 @role_required(['admin', 'manager'])
 def reports_filter(request):
-    """Страница с фильтрацией данных"""
+    """
+    Страница с фильтрацией данных. Отчет строит фоновое задание (report_jobs):
+    форма ставит его в очередь, страница опрашивает статус и показывает результат
+    """
+    if request.method == 'POST':
+        params, notice = ReportJobRunner.params(request.POST)
+        try:
+            job = ReportJobRunner.submit(request.user, **params)
+        except ReportJobLimitError as e:
+            messages.error(request, str(e))
+            return redirect('reports_filter')
+        if notice:
+            messages.warning(request, notice)
+        return redirect(f"{reverse('reports_filter')}?job={job.pk}")
+
+    job = None
+    if request.GET.get('job', '').isdigit():
+        job = ReportJobs.objects.filter(pk=request.GET['job'], user=request.user).first()
+
     context = {
         'title': 'Фильтрация данных',
-        'filter_results': None,
+        'rows_url': None,
         'filter_name': None,
+        'seed': job.seed if job else ReportGenerator.parse_seed(None),
+        'count': job.count if job else 10000,
+        'max_rows': ReportJobRunner.max_rows(),
+        'job': job,
     }
+    if job and job.status == 'done':
+        context.update(report_job_result_context(request, job) or {})
+    return render(request, 'reports/filter.html', context)
+
+
+def report_job_result_context(request, job):
+    """
+    Результат готового задания для шаблона includes/filter_results.html (строки
+    таблица загружает сама через report_job_rows); токен результата запоминается
+    в сессии для экспорта в CSV. None - результат удален по сроку
+    """
+    df = ResultTable.frame(job.result_token)
+    if df is None:
+        return None
+    # Экспорт в CSV берет последний просмотренный результат. Прежний не удаляется:
+    # его может листать другая вкладка, файл удалится по сроку или вместе с заданием
+    if request.session.get('last_filter_token') != job.result_token:
+        request.session['last_filter_token'] = job.result_token
+    return {
+        'rows_url': reverse('report_job_rows', args=[job.pk]),
+        'filter_name': job.filter_name,
+        'filtered_count': job.filtered_count,
+        'total_count': job.total_count,
+    }
+
+
+def report_job_json(job):
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'message': job.message,
+        'finished': job.is_finished,
+        'status_url': reverse('report_job_status', args=[job.pk]),
+        'result_url': reverse('report_job_result', args=[job.pk]),
+    }
+
+
+@login_required
+@role_required(['admin', 'manager'])
+def report_job_submit(request):
+    """Ставит отчет в очередь (POST с полями формы фильтров), отвечает 202 и адресами статуса"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Нужен POST'}, status=405)
+    params, notice = ReportJobRunner.params(request.POST)
+    try:
+        job = ReportJobRunner.submit(request.user, **params)
+    except ReportJobLimitError as e:
+        return JsonResponse({'error': str(e)}, status=429)
+    return JsonResponse(dict(report_job_json(job), notice=notice), status=202)
 
-    if request.method == 'POST':
-        filter_type = request.POST.get('filter_type')
-        data_type = request.POST.get('data_type', 'users')
-        count = int(request.POST.get('count', 1000))
-
-        # Генерируем данные
-        df = ReportGenerator.create_report_dataframe(data_type, count)
-
-        # Применяем выбранный фильтр
-        filter_name = ""
-        df_filtered = None
-
-        if filter_type == '1':  # Фильтр 1: wallet > 100000
-            df_filtered = df[df['wallet'] > 100000]
-            filter_name = "Кошелек > 100000"
-        elif filter_type == '2':  # Фильтр 2: age 18-25 AND wallet > 125000
-            df_filtered = df[(df['age'] >= 18) & (df['age'] <= 25) & (df['wallet'] > 125000)]
-            filter_name = "Возраст 18-25 и кошелек > 125000"
-        elif filter_type == '3':  # Фильтр 3: age > 50 AND registration_date 2018-2023
-            df['registration_date'] = pd.to_datetime(df['registration_date'])
-            df_filtered = df[(df['age'] > 50) &
-                             (df['registration_date'].between('2018-01-01', '2023-01-01'))]
-            filter_name = "Возраст > 50 и регистрация 2018-2023"
-        elif filter_type == '4':  # Фильтр 4: email contains gmail AND wallet > 50000 AND is_subscribed
-            df_filtered = df[df['email'].str.contains('gmail', na=False) &
-                             (df['wallet'] > 50000) &
-                             (df['is_subscribed'] == True)]
-            filter_name = "Gmail, кошелек > 50000, с подпиской"
-        elif filter_type == '5':  # Фильтр 5: age = 18 AND email contains yahoo AND wallet < 25000
-            df_filtered = df[(df['age'] == 18) &
-                             (df['email'].str.contains('yahoo', na=False)) &
-                             (df['wallet'] < 25000)]
-            filter_name = "Возраст 18, Yahoo, кошелек < 25000"
-        elif filter_type == '6':  # Фильтр 6: age > 100 AND last_online = today
-            today = datetime.now().date()
-            df['last_online'] = pd.to_datetime(df['last_online'])
-            df['last_online_date'] = df['last_online'].dt.date
-            df_filtered = df[(df['age'] > 100) & (df['last_online_date'] == today)]
-            filter_name = "Возраст > 100 и был сегодня"
-        elif filter_type == '7':  # Фильтр 7: wallet > 100000, сортировка по registration_date
-            df['registration_date'] = pd.to_datetime(df['registration_date'])
-            df_filtered = df[df['wallet'] > 100000].sort_values('registration_date').head(50)
-            filter_name = "Кошелек > 100000 (первые 50 по дате регистрации)"
-        elif filter_type == '8':  # Фильтр 8: день рождения сегодня, age > 21
-            today = datetime.now()
-            df['birth_date'] = pd.to_datetime(df['birth_date'])
-            df_filtered = df[(df['birth_date'].dt.day == today.day) &
-                             (df['birth_date'].dt.month == today.month) &
-                             (df['age'] > 21)]
-            filter_name = "День рождения сегодня, возраст > 21"
-        elif filter_type == '9':  # Фильтр 9: is_subscribed AND total_spent > 400000 AND age > 25
-            df_filtered = df[(df['is_subscribed'] == True) &
-                             (df['total_spent'] > 400000) &
-                             (df['age'] > 25)].sort_values('registration_date').head(10)
-            filter_name = "С подпиской, потратил > 400000, возраст > 25"
-        else:
-            df_filtered = df.head(100)
-            filter_name = "Первые 100 записей"
 
-        # Сохраняем в CSV
-        if df_filtered is not None:
-            # Для отображения в HTML
-            html_table = ReportGenerator.dataframe_to_html(df_filtered)
+@login_required
+@role_required(['admin', 'manager'])
+def report_job_status(request, job_id):
+    """Статус и прогресс задания (опрашивается страницей фильтров)"""
+    job = get_object_or_404(ReportJobs, pk=job_id, user=request.user)
+    if job.status == 'queued':
+        # После перезапуска пул создается здесь и забирает ждущие задания
+        ReportJobRunner.executor()
+    return JsonResponse(report_job_json(job))
+
+
+@login_required
+@role_required(['admin', 'manager'])
+def report_job_result(request, job_id):
+    """Результат готового задания: HTML блока результатов и счетчики"""
+    job = get_object_or_404(ReportJobs, pk=job_id, user=request.user)
+    if job.status != 'done':
+        return JsonResponse(report_job_json(job), status=409)
+
+    context = report_job_result_context(request, job)
+    if context is None:
+        return JsonResponse({'error': 'Результат устарел, постройте отчет заново'}, status=410)
+    return JsonResponse({
+        'filter_name': context['filter_name'],
+        'filtered_count': context['filtered_count'],
+        'total_count': context['total_count'],
+        'html': render_to_string('includes/filter_results.html', context, request=request),
+    })
 
-            # Сохраняем в сессию для экспорта
-            request.session['last_filter_df'] = df_filtered.to_json()
-            request.session['last_filter_name'] = filter_name
 
+@login_required
+@role_required(['admin', 'manager'])
+def report_job_rows(request, job_id):
+    """
+    Страница строк результата задания в JSON: ?page=, per_page=, sort=столбец,
+    order=asc|desc. Сортировка и форматирование - на сервере, только для страницы
+    """
+    job = get_object_or_404(ReportJobs, pk=job_id, user=request.user)
+    if job.status != 'done':
+        return JsonResponse(report_job_json(job), status=409)
+
+    df = ResultTable.frame(job.result_token)
+    if df is None:
+        return JsonResponse({'error': 'Результат устарел, постройте отчет заново'}, status=410)
+    try:
+        data = ResultTable.page(
+            df, job.result_token,
+            page=request.GET.get('page'),
+            per_page=request.GET.get('per_page'),
+            sort=request.GET.get('sort'),
+            descending=request.GET.get('order') == 'desc',
+        )
+    except ResultTableError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
+
+@login_required
+@role_required(['admin', 'manager'])
+def reports_filter_db(request):
+    """Фильтры по реальным данным: условия выполняются в SQL, в pandas - только текущая страница"""
+    filter_key = request.GET.get('filter', '')
+    spec = DB_FILTERS.get(filter_key)
+    context = {
+        'title': 'Фильтрация реальных данных',
+        'filters': DB_FILTERS,
+        'filter_key': filter_key,
+        'spec': spec,
+        'filter_results': None,
+    }
+
+    if spec:
+        try:
+            queryset = QueryFilter.queryset(spec)
+        except FilterSpecError as e:
+            messages.error(request, f'Фильтр не подходит к данным: {e}')
+        else:
+            page_obj = Paginator(queryset, 50).get_page(request.GET.get('page'))
+            df = QueryFilter.page_dataframe(spec, page_obj.object_list)
             context.update({
-                'filter_results': html_table,
-                'filter_name': filter_name,
-                'filtered_count': len(df_filtered),
-                'total_count': len(df),
-                'filter_type': filter_type,
-                'data_type': data_type,
+                'page_obj': page_obj,
+                'filter_results': ReportGenerator.dataframe_to_html(df),
             })
 
-    return render(request, 'reports/filter.html', context)
+    return render(request, 'reports/filter_db.html', context)
 
 
 @login_required
 @role_required(['admin', 'manager'])
 def export_filter_to_csv(request):
-    """Экспорт отфильтрованных данных в CSV"""
-    if 'last_filter_df' in request.session:
-        df_json = request.session.get('last_filter_df')
-        filter_name = request.session.get('last_filter_name', 'filter')
+    """Экспорт отфильтрованных данных в CSV (потоком из хранилища результатов)"""
+    result = ResultStore.load(request.session.get('last_filter_token'))
+    if result is None:
+        messages.error(request, 'Нет данных для экспорта')
+        return redirect('reports_filter')
+
+    filter_name = result['meta'].get('name') or 'filter'
+    response = StreamingHttpResponse(csv_chunks(result['df']), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filter_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+    return response
 
-        # Восстанавливаем DataFrame
-        df = pd.read_json(df_json)
 
-        # Создаем HTTP ответ с CSV
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{filter_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+def csv_chunks(df, chunk_size=5000):
+    """CSV по частям: BOM и заголовок, затем строки блоками по chunk_size (разделитель ';')"""
+    yield '\ufeff' + df.head(0).to_csv(index=False, sep=';')
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size].to_csv(index=False, header=False, sep=';')
 
-        # ИСПРАВЛЕНИЕ: добавляем sep=';' для разделителя точкой с запятой
-        df.to_csv(path_or_buf=response, index=False, encoding='utf-8-sig', sep=';')
-        return response
 
-    messages.error(request, 'Нет данных для экспорта')
-    return redirect('reports_filter')
+@login_required
+@role_required(['admin', 'manager'])
+def export_table(request, table):
+    """Потоковая выгрузка клиентов, абонементов или записей в CSV (фильтры start, end, status, service)"""
+    if table not in EXPORT_TABLES:
+        raise Http404('Неизвестная таблица')
+
+    queryset = TableExport.queryset(table, request.GET)
+    response = StreamingHttpResponse(TableExport.stream(table, queryset), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{table}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+    return response
 
 
 @login_required
@@ -1802,17 +1857,54 @@ def reports_statistics(request):
     """Статистика из реальной базы данных"""
     stats = ReportGenerator.get_real_data_stats()
 
-    # Генерируем тестовые данные для графиков
+    # Записи по статусам за всю историю - из дневных итогов
+    totals = MetricsRollup.summary()
+    booking_totals = {
+        'scheduled': totals['bookings_scheduled'],
+        'completed': totals['bookings_completed'],
+        'cancelled': totals['bookings_cancelled'],
+        'no_show': totals['bookings_no_show'],
+    }
+
+    # Выручка по периодам: по умолчанию последние 12 месяцев
+    today = date.today()
+    period = request.GET.get('period', 'month')
+    if period not in ('month', 'week'):
+        period = 'month'
+
+    default_start = (today.replace(day=1) - timedelta(days=335)).replace(day=1)
+    try:
+        start = datetime.strptime(request.GET.get('start', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start = default_start
+    try:
+        end = datetime.strptime(request.GET.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end = today
+    if start > end:
+        start, end = end, start
+
+    range_error = None
+    try:
+        revenue = RevenueSeries.series(start, end, period)
+    except ValueError as e:
+        # Слишком большой диапазон - ошибка у формы и график за период по умолчанию
+        range_error = str(e)
+        start, end = default_start, today
+        revenue = RevenueSeries.series(start, end, period)
+
     chart_data = {
-        'revenue': {
-            'labels': ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек'],
-            'data': [random.randint(100000, 500000) for _ in range(12)]
-        }
+        'revenue': revenue
     }
 
     context = {
         'stats': stats,
+        'booking_totals': booking_totals,
         'chart_data': json.dumps(chart_data),
+        'period': period,
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d'),
+        'range_error': range_error,
         'title': 'Статистика системы',
     }
     return render(request, 'reports/statistics.html', context)
@@ -1821,23 +1913,16 @@ def reports_statistics(request):
 @login_required
 @role_required(['admin', 'manager'])
 def reports_comparison(request):
-    """Сравнение реальных и тестовых данных"""
+    """Сравнение реальных данных со снимком тестовых и с прошлыми периодами"""
     real_stats = ReportGenerator.get_real_data_stats()
-
-    # Генерируем тестовые данные
-    test_users = ReportGenerator.generate_test_users(1000)
-    test_users_df = pd.DataFrame(test_users)
-
-    test_stats = {
-        'avg_age': round(test_users_df['age'].mean(), 1),
-        'avg_wallet': round(test_users_df['wallet'].mean(), 2),
-        'subscribed_percent': round((test_users_df['is_subscribed'].sum() / len(test_users_df) * 100), 1),
-        'total_count': len(test_users_df),
-    }
+    # Снимок строит команда build_report_baseline - страница только читает кэш
+    baseline = BaselineSnapshot.latest()
 
     context = {
         'real_stats': real_stats,
-        'test_stats': test_stats,
+        'baseline': baseline,
+        'comparison': BaselineSnapshot.compare(real_stats, baseline) if baseline else None,
+        'periods': PeriodComparison.cached(),
         'title': 'Сравнение данных',
     }
     return render(request, 'reports/comparison.html', context)
\ No newline at end of file
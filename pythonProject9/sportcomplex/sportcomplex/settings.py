@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +87,61 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sportcomplex',
+    }
+}
+
+# Время жизни кэша статистики (сек). Кэш сбрасывается сигналами при изменении данных,
+# таймаут лишь ограничивает устаревание счетчиков "за неделю"
+STATS_CACHE_TIMEOUT = 300
+
+# Время жизни кэша ответов API автодополнения (сек)
+AUTOCOMPLETE_CACHE_TIMEOUT = 30
+
+# Тестовые данные отчетов: seed по умолчанию (одинаковые данные между запросами)
+# и предел памяти LRU-кэша сгенерированных DataFrame в каждом процессе (МБ)
+REPORT_DATASET_SEED = 42
+REPORT_DATASET_CACHE_MB = 64
+
+# Наибольшее число строк тестового набора в отчете; больший запрос ограничивается
+# этим числом, а пользователь видит предупреждение (main.report_jobs)
+REPORT_MAX_ROWS = 1000000
+
+# С какого числа строк тестовые данные генерируются частями в нескольких процессах
+# (ReportGenerator.create_report_dataframe_sharded); меньшие наборы - в одном процессе
+REPORT_SHARD_MIN_ROWS = 500000
+
+# Результаты фильтрации отчетов (main.result_store): каталог файлов и срок хранения (сек).
+# Каталог создается с правами 0700 и должен принадлежать пользователю веб-процесса
+REPORT_RESULTS_DIR = os.path.join(BASE_DIR, 'report_results')
+REPORT_RESULTS_TTL = 3600
+
+# Фоновые отчеты (main.report_jobs): потоки пула, незавершенных заданий на пользователя,
+# через сколько секунд незавершенное задание считается прерванным
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_MAX_ACTIVE = 3
+REPORT_JOB_TIMEOUT = 600
+
+# Размер тестового набора для снимка сравнения (main.report_generator.BaselineSnapshot)
+REPORT_BASELINE_ROWS = 100000
+
+# Бюджет одного запроса к странице (main.middleware.QueryBudgetMiddleware):
+# при превышении в лог main.performance пишется предупреждение
+REQUEST_QUERY_BUDGET = 30
+REQUEST_TIME_BUDGET_MS = 500
+# Отдельные бюджеты тяжелых страниц: url_name -> {'queries': ..., 'time_ms': ...}
+REQUEST_BUDGET_OVERRIDES = {
+    'reports_filter': {'time_ms': 3000},
+    'export_filter_to_csv': {'time_ms': 5000},
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -136,8 +192,14 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
 
 # Настройки сессии
+# Сессии хранятся в кэше с записью в БД (main.session_backend). Вместо сохранения
+# на каждый запрос срок продлевается не чаще раза в SESSION_REFRESH_MINUTES.
+# Для нескольких процессов нужен общий кэш (Redis, Memcached), иначе чтение идет из БД.
+# Просроченные сессии удаляет команда cleanup_sessions
+SESSION_ENGINE = 'main.session_backend'
 SESSION_COOKIE_AGE = 86400  # 1 день
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_MINUTES = 15
 
 # Сообщения
 from django.contrib.messages import constants as messages